@@ -1,7 +1,12 @@
+import csv
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
 from pathlib import Path
-from typing import Iterable, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
 
-from openpyxl import load_workbook
+from openpyxl import Workbook as NewWorkbook, load_workbook
 from openpyxl.workbook.workbook import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
 
@@ -10,6 +15,12 @@ from MRCASE.models.manhour_entry import ManHourEntry
 
 HEADERS = env.EXCEL_HEADERS
 
+# 追記専用の raw ストア（ブック本体の横に置く CSV）
+RAW_STORE_SUFFIX = ".raw.csv"
+# raw ストアに追記済みの位置（最後に追記したメッセージの ts を1つだけ持つ。
+# 同じメッセージを読み直しても重複させない）
+KEYS_SUFFIX = ".keys"
+
 
 def open_sheet(excel_filepath: str | Path, excel_sheet_name: str | None) -> Tuple[Workbook, Worksheet]:
     """
@@ -79,4 +90,196 @@ def append_entries(
         ws.cell(row=next_row, column=5, value=text_raw)
         next_row += 1
 
-    workbook.save(excel_filepath)
\ No newline at end of file
+    workbook.save(excel_filepath)
+
+
+# ------------------------------------------------------------------ #
+#  追記モード（ブックを開かずに raw ストアへ追記し、必要な時に xlsx を組み立てる）
+# ------------------------------------------------------------------ #
+
+def raw_store_path(excel_filepath: str | Path) -> Path:
+    path = Path(excel_filepath)
+    return path.with_name(path.name + RAW_STORE_SUFFIX)
+
+
+def keys_path(excel_filepath: str | Path) -> Path:
+    path = Path(excel_filepath)
+    return path.with_name(path.name + KEYS_SUFFIX)
+
+
+def _ts_value(ts: str) -> Decimal:
+    """Slack の ts（"1771398155.000100"）を比較用の値にする"""
+    return Decimal(ts)
+
+
+def read_watermark(excel_filepath: str | Path) -> Optional[str]:
+    """最後に追記したメッセージの ts（まだ無ければ None）"""
+    path = keys_path(excel_filepath)
+    if not path.exists():
+        return None
+    value = path.read_text(encoding="utf-8").strip()
+    return value or None
+
+
+def _write_watermark(excel_filepath: Path, ts: str) -> None:
+    path = keys_path(excel_filepath)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(ts + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _raw_sheet_name(workbook_sheetnames: List[str], excel_sheet_name: str | None) -> str | None:
+    if excel_sheet_name and excel_sheet_name in workbook_sheetnames:
+        return excel_sheet_name
+    if getattr(env, "EXCEL_SHEET_RAW", None) and env.EXCEL_SHEET_RAW in workbook_sheetnames:
+        return env.EXCEL_SHEET_RAW
+    return workbook_sheetnames[0] if workbook_sheetnames else None
+
+
+def _seed_store(excel_filepath: Path, store: Path, excel_sheet_name: str | None) -> None:
+    """
+    raw ストアが無い場合に、既存ブックの raw シートの内容で初期化する（初回のみ）。
+    read_only で1行ずつ読むのでブック全体は展開しない。
+    """
+    tmp = store.with_name(store.name + ".tmp")
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if excel_filepath.exists():
+            workbook = load_workbook(excel_filepath, read_only=True)
+            try:
+                name = _raw_sheet_name(workbook.sheetnames, excel_sheet_name)
+                if name is not None:
+                    for row in workbook[name].iter_rows(min_row=2, values_only=True):
+                        if any(v is not None for v in row):
+                            writer.writerow(_to_store_row(row))
+            finally:
+                workbook.close()
+    os.replace(tmp, store)
+
+
+def _to_store_row(values) -> list:
+    values = list(values)[: len(HEADERS)]
+    values += [None] * (len(HEADERS) - len(values))
+    return ["" if v is None else (v.isoformat() if hasattr(v, "isoformat") else v) for v in values]
+
+
+def _from_store_row(row: List[str]) -> list:
+    work_date, project, assignee, hours, *rest = row + [""] * (len(HEADERS) - len(row))
+    try:
+        work_date = date.fromisoformat(work_date[:10]) if work_date else None
+    except ValueError:
+        pass
+    try:
+        hours = float(hours) if hours != "" else None
+    except ValueError:
+        pass
+    return [work_date, project or None, assignee or None, hours, *[v or None for v in rest]]
+
+
+def append_entries_to_store(
+    entries: Iterable[ManHourEntry],
+    excel_filepath: str | Path,
+    excel_sheet_name: str | None = None,
+    source_ts: Optional[Iterable[str]] = None,
+) -> int:
+    """
+    entries を raw ストアの末尾に追記する。ブックも追記済みの行も読まないので
+    コストは渡した件数にだけ比例する（シートの行数には依存しない）。
+    source_ts（entries と同じ順の、元メッセージの ts）を渡すと、前回までに追記した
+    最後の ts 以前のエントリは飛ばす（チャンネルを読み直しても重複しない）。
+    そのため、後から届いた古い ts のメッセージ（編集・遅れたスレッド返信）は追記されない。
+    追記した件数を返す。
+    """
+    excel_filepath = Path(excel_filepath)
+    store = raw_store_path(excel_filepath)
+    if not store.exists():
+        _seed_store(excel_filepath, store, excel_sheet_name)
+
+    watermark = read_watermark(excel_filepath) if source_ts is not None else None
+    after = _ts_value(watermark) if watermark is not None else None
+    keyed = zip(source_ts, entries, strict=True) if source_ts is not None else ((None, e) for e in entries)
+
+    count = 0
+    latest: Optional[str] = None
+    with open(store, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for ts, e in keyed:
+            if ts is not None:
+                value = _ts_value(ts)
+                if after is not None and value <= after:
+                    continue
+                if latest is None or value > _ts_value(latest):
+                    latest = ts
+            writer.writerow(_to_store_row([
+                e.work_date,
+                getattr(e, "project", None) or e.case_key,
+                e.assignee,
+                float(e.hours),
+                getattr(e, "text_raw", ""),  # 無ければ空
+            ]))
+            count += 1
+
+    # 行を書いてから位置を進める（途中で落ちても行が欠けることはない）
+    if latest is not None:
+        _write_watermark(excel_filepath, latest)
+    return count
+
+
+def _iter_store(store: Path) -> Iterator[list]:
+    if not store.exists():
+        return
+    with open(store, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            yield _from_store_row(row)
+
+
+def compile_workbook(
+    excel_filepath: str | Path,
+    excel_sheet_name: str | None = None,
+) -> Path:
+    """
+    raw ストアから xlsx を組み立てて excel_filepath に保存する（アップロード前などに1回）。
+    write_only で書き出すのでメモリは一定。raw 以外のシートは値だけ引き継ぐ。
+    """
+    excel_filepath = Path(excel_filepath)
+    store = raw_store_path(excel_filepath)
+    if not store.exists():
+        _seed_store(excel_filepath, store, excel_sheet_name)
+
+    sheetnames: List[str] = []
+    others = {}
+    if excel_filepath.exists():
+        source = load_workbook(excel_filepath, read_only=True)
+        try:
+            sheetnames = list(source.sheetnames)
+            raw_name = _raw_sheet_name(sheetnames, excel_sheet_name)
+            for name in sheetnames:
+                if name != raw_name:
+                    others[name] = [list(r) for r in source[name].iter_rows(values_only=True)]
+        finally:
+            source.close()
+    else:
+        raw_name = excel_sheet_name or getattr(env, "EXCEL_SHEET_RAW", None) or "raw"
+        sheetnames = [raw_name]
+
+    workbook = NewWorkbook(write_only=True)
+    for name in sheetnames:
+        ws = workbook.create_sheet(name)
+        if name == raw_name:
+            ws.append(HEADERS)
+            for row in _iter_store(store):
+                ws.append(row)
+        else:
+            for row in others[name]:
+                ws.append(row)
+
+    fd, tmp_name = tempfile.mkstemp(dir=excel_filepath.parent, suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(tmp_name)
+        os.replace(tmp_name, excel_filepath)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    return excel_filepath
@@ -1,6 +1,6 @@
 # MRCASE/app/filter.py
 
-from typing import Iterable, List
+from typing import Iterable, Iterator, List
 from MRCASE.models.slack_message import SlackMessage
 
 
@@ -9,23 +9,31 @@ def normalize(text: str) -> str:
     return text.replace(" ", "").strip()
 
 
-def filter_by_first_line(
+def iter_filter_by_first_line(
     messages: Iterable[SlackMessage],
     keyword: str,
-) -> List[SlackMessage]:
+) -> Iterator[SlackMessage]:
     """
-    メッセージの先頭行が keyword と一致するものを返す
+    メッセージの先頭行が keyword と一致するものを1件ずつ返すジェネレータ
     （keyword は env 側から渡す）
     """
     key = normalize(keyword)
 
-    result: List[SlackMessage] = []
     for m in messages:
         if not m.text:
             continue
 
         first_line = m.text.splitlines()[0]
         if normalize(first_line) == key:
-            result.append(m)
+            yield m
 
-    return result
+
+def filter_by_first_line(
+    messages: Iterable[SlackMessage],
+    keyword: str,
+) -> List[SlackMessage]:
+    """
+    メッセージの先頭行が keyword と一致するものを返す
+    （keyword は env 側から渡す）
+    """
+    return list(iter_filter_by_first_line(messages, keyword))
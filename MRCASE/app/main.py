@@ -1,4 +1,7 @@
 # MRCASE/app/main.py
+import sys
+from pathlib import Path
+
 from MRCASE.app.slack_FileUpload import file_upload
 from MRCASE.app.slack_ReadChannel import get_channel_messages
 from MRCASE.app.filter import filter_by_first_line
@@ -6,16 +9,28 @@ from MRCASE.app.manhour_parser import parse_man_hour_message
 from MRCASE import env
 import MRCASE.app.excel_write as ex
 
-def main():
+def main(compile_workbook: bool = False):
+    """
+    毎回の実行は raw ストアへの追記だけ（コストは新しいエントリの件数に比例）。
+    xlsx の組み立て（履歴全体を書き出す）と Slack への送信は --compile を付けた実行
+    （月次など）か、まだブックが無い時だけ行う。
+    """
     messages = get_channel_messages()
 
     filtered = filter_by_first_line(messages, env.ADD_MAN_HOUR)
 
     entries = []
+    source_ts = []
     for msg in filtered:
-        entries.extend(parse_man_hour_message(msg.text))
-    ex.append_entries(entries, env.FILE, env.EXCEL_SHEET_RAW)
-    file_upload(env.FILE)
+        for entry in parse_man_hour_message(msg.text):
+            entries.append(entry)
+            source_ts.append(msg.ts)
+    # 追記は raw ストアへ（ブックの行数に依存しない）。前回までに追記したメッセージは飛ばす
+    ex.append_entries_to_store(entries, env.FILE, env.EXCEL_SHEET_RAW, source_ts=source_ts)
+
+    if compile_workbook or not Path(env.FILE).exists():
+        ex.compile_workbook(env.FILE, env.EXCEL_SHEET_RAW)
+        file_upload(env.FILE)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(compile_workbook="--compile" in sys.argv[1:])
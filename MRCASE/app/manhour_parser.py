@@ -1,10 +1,36 @@
 from __future__ import annotations
 
-from datetime import date
-from typing import Dict, List, Optional
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from MRCASE import env
 from MRCASE.models.manhour_entry import ManHourEntry
+from MRCASE.models.slack_message import SlackMessage
+
+# parse_many で一度に処理するメッセージ数
+PARSE_BATCH_SIZE = 500
+
+# key=value の組（区切りは , と 、。全角記号は NFKC で半角にしてから適用）
+_KV_RE = re.compile(r"([^=,、]+)=([^,、]*)")
+# 2 / 1.5 / .5（h・時間 は省略可）
+_HOURS_RE = re.compile(r"^(\d*\.\d+|\d+)\s*(?:h|H|時間)?$")
+# 2026-02-18 / 2026/2/18 / 2026.02.18 / 2026年2月18日
+_DATE_YMD_RE = re.compile(r"^(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})\s*日?$")
+# 2/18 / 2月18日（年はメッセージの送信日から補う）
+_DATE_MD_RE = re.compile(r"^(\d{1,2})\s*[/月]\s*(\d{1,2})\s*日?$")
+# 年の無い日付が送信日よりこれ以上後になる場合は前年とみなす（少し先の予定の登録は許す）
+MAX_FUTURE_DAYS = 31
+
+# 却下理由
+REJECT_NO_KEY_VALUE = "no_key_value"
+REJECT_MISSING_CASE = "missing_case"
+REJECT_MISSING_HOURS = "missing_hours"
+REJECT_INVALID_HOURS = "invalid_hours"
+REJECT_INVALID_DATE = "invalid_date"
 
 
 def _normalize(s: str) -> str:
@@ -12,21 +38,193 @@ def _normalize(s: str) -> str:
     return s.replace(" ", "").replace("　", "").strip()
 
 
+def _nfkc(s: str) -> str:
+    """全角の数字・記号を半角に揃える（ASCII のみなら何もしない）"""
+    return s if s.isascii() else unicodedata.normalize("NFKC", s)
+
+
 def _parse_kv_line(line: str) -> Dict[str, str]:
     """
     '案件=XXXX, 時間=2[, 日付=2026/02/17][, 担当者=大場]' のような1行を
-    {key: value} に変換する
+    {key: value} に変換する（全角の数字・記号は半角として扱う）
+    """
+    return {
+        k.replace(" ", ""): v.strip()
+        for k, v in _KV_RE.findall(_nfkc(line))
+    }
+
+
+def parse_date(value: str, message_date: date) -> date:
+    """
+    いくつかの日付形式を受け付ける。解釈できなければ ValueError
+    年の無い形式は message_date の年とし、MAX_FUTURE_DAYS を超えて後になる場合は前年にする
+    （2027/1/4 に送った「12/28」は 2026/12/28）
+    """
+    value = _nfkc(value).strip()
+    m = _DATE_YMD_RE.match(value)
+    if m:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    m = _DATE_MD_RE.match(value)
+    if m:
+        month, day = int(m.group(1)), int(m.group(2))
+        for year in (message_date.year, message_date.year - 1):
+            try:
+                d = date(year, month, day)
+            except ValueError:  # 2/29 が無い年など
+                continue
+            if (d - message_date).days <= MAX_FUTURE_DAYS:
+                return d
+        raise ValueError(f"invalid date: {value}")
+    raise ValueError(f"unsupported date format: {value}")
+
+
+def ts_to_date(ts: str) -> date:
+    """Slack の ts（UNIXタイムスタンプ文字列）を date に変換する"""
+    try:
+        return datetime.fromtimestamp(float(ts), tz=timezone.utc).date()
+    except (ValueError, TypeError):
+        return date.today()
+
+
+@dataclass(frozen=True)
+class ParseReject:
+    """解析できなかった1行"""
+    ts: Optional[str]  # 元メッセージの ts
+    line_no: int       # メッセージ内の行番号（1始まり、1行目は見出し）
+    line: str
+    reason: str
+
+    def as_dict(self) -> dict:
+        return {"ts": self.ts, "line_no": self.line_no, "line": self.line, "reason": self.reason}
+
+
+@dataclass
+class ParsedMessage:
+    message: SlackMessage
+    entries: List[ManHourEntry] = field(default_factory=list)
+    rejects: List[ParseReject] = field(default_factory=list)
+
+
+@dataclass
+class ParseBatch:
+    messages: List[ParsedMessage]
+
+    @property
+    def entries(self) -> List[ManHourEntry]:
+        return [e for m in self.messages for e in m.entries]
+
+    @property
+    def rejects(self) -> List[ParseReject]:
+        return [r for m in self.messages for r in m.rejects]
+
+
+class ManHourParser:
+    """
+    工数登録メッセージのパーサー。
+    キー名（env.KEY_*）の正規化は生成時に1回だけ行い、正規表現はモジュール読込時にコンパイル済み。
     """
-    parts = [p.strip() for p in line.split(",") if p.strip()]
-    kv: Dict[str, str] = {}
 
-    for p in parts:
-        if "=" not in p:
-            continue
-        k, v = p.split("=", 1)
-        kv[_normalize(k)] = v.strip()
+    def __init__(
+        self,
+        keyword: str = env.ADD_MAN_HOUR,
+        key_case: str = env.KEY_CASE,
+        key_time: str = env.KEY_TIME,
+        key_date: str = env.KEY_DATE,
+        key_assignee: str = env.KEY_ASSIGNEE,
+    ):
+        self.keyword = _normalize(_nfkc(keyword))
+        self.key_case = _normalize(_nfkc(key_case))
+        self.key_time = _normalize(_nfkc(key_time))
+        self.key_date = _normalize(_nfkc(key_date))
+        self.key_assignee = _normalize(_nfkc(key_assignee))
+
+    def parse_line(self, line: str, message_date: date) -> Tuple[Optional[ManHourEntry], Optional[str]]:
+        """1行を解析して (entry, None) か (None, 却下理由) を返す"""
+        kv = _parse_kv_line(line)
+        if not kv:
+            return None, REJECT_NO_KEY_VALUE
+
+        # 案件・時間は必須
+        if not kv.get(self.key_case):
+            return None, REJECT_MISSING_CASE
+        if not kv.get(self.key_time):
+            return None, REJECT_MISSING_HOURS
+
+        m = _HOURS_RE.match(kv[self.key_time])
+        if not m:
+            return None, REJECT_INVALID_HOURS
+
+        # 日付: 省略時はメッセージの送信日
+        work_date = message_date
+        if kv.get(self.key_date):
+            try:
+                work_date = parse_date(kv[self.key_date], message_date)
+            except ValueError:
+                return None, REJECT_INVALID_DATE
+
+        return ManHourEntry(
+            case_key=kv[self.key_case].strip().upper(),
+            hours=float(m.group(1)),
+            work_date=work_date,
+            # 担当者: 省略時はNone（tasks.pyでSlackから補完）
+            assignee=kv.get(self.key_assignee) or None,
+        ), None
+
+    def parse_text(
+        self,
+        text: str,
+        message_date: Optional[date] = None,
+        ts: Optional[str] = None,
+    ) -> Tuple[List[ManHourEntry], List[ParseReject]]:
+        lines = text.splitlines()
+        first = next((i for i, ln in enumerate(lines) if ln.strip()), None)
+        if first is None or _normalize(lines[first]) != self.keyword:
+            return [], []
+
+        today = message_date or date.today()
+        entries: List[ManHourEntry] = []
+        rejects: List[ParseReject] = []
+
+        for line_no, line in enumerate(lines[first + 1:], start=first + 2):
+            if not line.strip():
+                continue
+            entry, reason = self.parse_line(line, today)
+            if entry is not None:
+                entries.append(entry)
+            else:
+                rejects.append(ParseReject(ts=ts, line_no=line_no, line=line.strip(), reason=reason))
+
+        return entries, rejects
+
+    def parse_many(
+        self,
+        messages: Iterable[SlackMessage],
+        batch_size: int = PARSE_BATCH_SIZE,
+        date_of: Callable[[SlackMessage], date] = lambda m: ts_to_date(m.ts),
+    ) -> Iterator[ParseBatch]:
+        """messages を batch_size 件ずつ解析して ParseBatch を返すジェネレータ"""
+        it = iter(messages)
+        while True:
+            chunk = list(islice(it, batch_size))
+            if not chunk:
+                return
+            parsed = []
+            for msg in chunk:
+                entries, rejects = self.parse_text(msg.text, date_of(msg), ts=msg.ts)
+                parsed.append(ParsedMessage(msg, entries, rejects))
+            yield ParseBatch(parsed)
+
 
-    return kv
+_default_parser = ManHourParser()
+
+
+def parse_many(
+    messages: Iterable[SlackMessage],
+    batch_size: int = PARSE_BATCH_SIZE,
+    date_of: Callable[[SlackMessage], date] = lambda m: ts_to_date(m.ts),
+) -> Iterator[ParseBatch]:
+    """既定のキー設定で messages をまとめて解析する（ManHourParser.parse_many 参照）"""
+    return _default_parser.parse_many(messages, batch_size=batch_size, date_of=date_of)
 
 
 def parse_man_hour_message(
@@ -41,49 +239,7 @@ def parse_man_hour_message(
     - 案件・時間は必須、日付・担当者は省略可能
       - 日付省略時 → message_date（Slackの送信日）を使用
       - 担当者省略時 → None を返す（tasks.py 側でSlackユーザーから補完）
+    - 解析できなかった行は捨てる（理由が必要なら parse_many を使う）
     """
-    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-    if not lines:
-        return []
-
-    if _normalize(lines[0]) != _normalize(env.ADD_MAN_HOUR):
-        return []
-
-    today = message_date or date.today()
-
-    required_case_key = _normalize(env.KEY_CASE)
-    required_hours    = _normalize(env.KEY_TIME)
-    optional_date     = _normalize(env.KEY_DATE)
-    optional_assignee = _normalize(env.KEY_ASSIGNEE)
-
-    entries: List[ManHourEntry] = []
-
-    for line in lines[1:]:
-        kv = _parse_kv_line(line)
-
-        # 案件・時間は必須
-        if required_case_key not in kv or required_hours not in kv:
-            continue
-
-        try:
-            # 日付: 省略時はメッセージの送信日
-            if optional_date in kv:
-                work_date = date.fromisoformat(kv[optional_date])
-            else:
-                work_date = today
-
-            # 担当者: 省略時はNone（tasks.pyでSlackから補完）
-            assignee = kv.get(optional_assignee) or None
-
-            entries.append(
-                ManHourEntry(
-                    case_key=kv[required_case_key].strip().upper(),
-                    hours=float(kv[required_hours]),
-                    work_date=work_date,
-                    assignee=assignee,
-                )
-            )
-        except (ValueError, TypeError):
-            continue
-
+    entries, _ = _default_parser.parse_text(text, message_date)
     return entries
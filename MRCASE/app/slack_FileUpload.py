@@ -1,14 +1,14 @@
 from pathlib import Path
-from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 import MRCASE.env as env
+from MRCASE.app.slack_client import get_client
 
 # Initialize a Web API client
 slack_token = env.SLACK_BOT_TOKEN
 channel_id = env.SLACK_CHANNEL_ID
 
 def file_upload(excel_filepath: str | Path):
-    client = WebClient(token=slack_token)
+    client = get_client(slack_token)
 
     # Call the chat.postMessage method
     try:
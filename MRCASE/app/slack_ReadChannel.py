@@ -1,25 +1,130 @@
-from slack_sdk import WebClient
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional
+
 from MRCASE import env
 from MRCASE.app import get_time
+from MRCASE.app.slack_client import get_client
 from MRCASE.models.slack_message import SlackMessage
 
-def get_channel_messages() -> list[SlackMessage]:
-    client = WebClient(token=env.SLACK_BOT_TOKEN)
+# conversations.history の1ページあたり件数（Slack 推奨上限）
+PAGE_LIMIT = 200
+
+# conversations.replies を同時に取得するスレッド数の上限
+REPLY_CONCURRENCY = int(os.environ.get("SLACK_REPLY_CONCURRENCY", "8"))
 
-    response = client.conversations_history(
-        channel=env.SLACK_CHANNEL_ID,
-        oldest=get_time.OLDEST
+
+def _to_slack_message(msg: Dict[str, Any]) -> SlackMessage:
+    return SlackMessage(
+        text=msg.get(env.KEY_TEXT, env.VALUE_EMPTY),
+        user=msg.get(env.KEY_USER),
+        ts=msg[env.KEY_TS],
+        thread_ts=msg.get(env.KEY_THREAD_TS),
+        raw=msg
     )
 
-    messages = response.get("messages", [])
-
-    return [
-        SlackMessage(
-            text=msg.get(env.KEY_TEXT, env.VALUE_EMPTY),
-            user=msg.get(env.KEY_USER),
-            ts=msg[env.KEY_TS],
-            thread_ts=msg.get(env.KEY_THREAD_TS),
-            raw=msg
-        )
-        for msg in messages
-    ]
+
+def iter_channel_messages(
+    oldest: Optional[str] = None,
+    latest: Optional[str] = None,
+    channel: Optional[str] = None,
+    limit: int = PAGE_LIMIT,
+    inclusive: bool = False,
+) -> Iterator[SlackMessage]:
+    """
+    conversations.history を next_cursor が尽きるまでページングして
+    SlackMessage を1件ずつ返すジェネレータ（新しい順）。
+    oldest / latest は含まない（Slack の既定 inclusive=false）ので、
+    前回の最終 ts をそのまま渡せば新着分だけ取得できる。
+    inclusive=True で境界の ts ちょうどのメッセージも含める。
+    """
+    client = get_client(env.SLACK_BOT_TOKEN)
+
+    params: Dict[str, Any] = {
+        "channel": channel or env.SLACK_CHANNEL_ID,
+        "oldest": oldest or get_time.OLDEST,
+        "limit": limit,
+    }
+    if latest:
+        params["latest"] = latest
+    if inclusive:
+        params["inclusive"] = True
+
+    cursor = None
+    while True:
+        if cursor:
+            params["cursor"] = cursor
+        response = client.conversations_history(**params)
+
+        for msg in response.get("messages", []):
+            yield _to_slack_message(msg)
+
+        cursor = (response.get("response_metadata") or {}).get("next_cursor")
+        if not cursor:
+            break
+
+
+def has_replies(message: SlackMessage) -> bool:
+    """スレッドの親メッセージ（返信あり）かどうか"""
+    return bool(message.raw.get("reply_count")) and message.thread_ts == message.ts
+
+
+def _get_thread_replies(
+    channel: str,
+    thread_ts: str,
+    limit: int,
+    oldest: Optional[str] = None,
+) -> List[SlackMessage]:
+    """1スレッド分の返信を conversations.replies でページングして取得（親は除く。oldest より後だけ）"""
+    client = get_client(env.SLACK_BOT_TOKEN)
+
+    params: Dict[str, Any] = {"channel": channel, "ts": thread_ts, "limit": limit}
+    if oldest:
+        params["oldest"] = oldest
+    replies: List[SlackMessage] = []
+    cursor = None
+    while True:
+        if cursor:
+            params["cursor"] = cursor
+        response = client.conversations_replies(**params)
+
+        for msg in response.get("messages", []):
+            if msg[env.KEY_TS] == thread_ts:
+                continue
+            replies.append(_to_slack_message(msg))
+
+        cursor = (response.get("response_metadata") or {}).get("next_cursor")
+        if not cursor:
+            break
+    return replies
+
+
+def iter_thread_replies(
+    thread_ts_list: Iterable[str],
+    channel: Optional[str] = None,
+    max_workers: int = REPLY_CONCURRENCY,
+    limit: int = PAGE_LIMIT,
+    oldest: Optional[Mapping[str, str]] = None,
+) -> Iterator[SlackMessage]:
+    """
+    複数スレッドの返信をスレッドプールで並行取得し、取得できたスレッドから順に返す。
+    同時実行数は max_workers で制限（Slack 側の頻度制限は slack_client が担当）。
+    oldest（thread_ts → ts）を渡すと、そのスレッドはその ts より後の返信だけを取得する。
+    """
+    oldest = oldest or {}
+    channel = channel or env.SLACK_CHANNEL_ID
+    thread_ts_list = list(dict.fromkeys(thread_ts_list))
+    if not thread_ts_list:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = [
+            pool.submit(_get_thread_replies, channel, ts, limit, oldest.get(ts))
+            for ts in thread_ts_list
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def get_channel_messages() -> list[SlackMessage]:
+    return list(iter_channel_messages())
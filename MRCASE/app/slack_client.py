@@ -0,0 +1,219 @@
+"""
+MRCASE/app/slack_client.py
+Slack WebClient の共通ファクトリ
+  - token / base_url ごとに WebClient を1つだけ生成して使い回す
+    （SSLContext も共有し、リクエストごとの証明書ロードを省く）
+  - 429 は Retry-After に従って待機して再試行、接続エラー・5xx も再試行
+  - API メソッドごとにトークンバケットで呼び出し頻度を制限
+  - 呼び出し回数・再試行回数・待機時間をカウント
+SLACK_API_URL を設定するとローカルのスタブサーバーに向けられる。
+"""
+
+from __future__ import annotations
+
+import os
+import ssl
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from slack_sdk import WebClient
+from slack_sdk.http_retry.builtin_handlers import (
+    ConnectionErrorRetryHandler,
+    RateLimitErrorRetryHandler,
+    ServerErrorRetryHandler,
+)
+
+SLACK_API_URL = os.environ.get("SLACK_API_URL", WebClient.BASE_URL)
+SLACK_MAX_RETRIES = int(os.environ.get("SLACK_MAX_RETRIES", "3"))
+SLACK_TIMEOUT = int(os.environ.get("SLACK_TIMEOUT", "30"))
+
+# Slack Web API の Rate Limit Tier（1分あたりの呼び出し回数）
+TIER_2 = 20
+TIER_3 = 50
+TIER_4 = 100
+
+METHOD_TIERS: Dict[str, int] = {
+    "conversations.history": TIER_3,
+    "conversations.replies": TIER_3,
+    "users.list": TIER_2,
+    "users.info": TIER_4,
+    "files.getUploadURLExternal": TIER_4,
+    "files.completeUploadExternal": TIER_4,
+}
+DEFAULT_TIER = TIER_3
+
+# バーストとして即時に許可する割合（1分枠のうち）
+BURST_RATIO = 0.25
+
+
+# ------------------------------------------------------------------ #
+#  統計
+# ------------------------------------------------------------------ #
+
+@dataclass
+class SlackClientStats:
+    calls: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    retries: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    throttle_wait: float = 0.0  # トークンバケットで待った秒数
+    retry_wait: float = 0.0     # 再試行前に待った秒数（Retry-After 含む）
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": dict(self.calls),
+            "retries": dict(self.retries),
+            "throttle_wait": round(self.throttle_wait, 3),
+            "retry_wait": round(self.retry_wait, 3),
+        }
+
+
+_stats = SlackClientStats()
+_stats_lock = threading.Lock()
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        return _stats.snapshot()
+
+
+def reset_stats() -> None:
+    global _stats
+    with _stats_lock:
+        _stats = SlackClientStats()
+
+
+# ------------------------------------------------------------------ #
+#  トークンバケット
+# ------------------------------------------------------------------ #
+
+class TokenBucket:
+    """per_minute 回/分 の速度で補充されるトークンバケット"""
+
+    def __init__(self, per_minute: int, burst: Optional[int] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or max(1, int(per_minute * BURST_RATIO)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """トークンを1つ取得する。待った秒数を返す。"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket_for(api_method: str) -> TokenBucket:
+    with _buckets_lock:
+        bucket = _buckets.get(api_method)
+        if bucket is None:
+            bucket = TokenBucket(METHOD_TIERS.get(api_method, DEFAULT_TIER))
+            _buckets[api_method] = bucket
+        return bucket
+
+
+# ------------------------------------------------------------------ #
+#  再試行ハンドラ（待機時間と回数を記録）
+# ------------------------------------------------------------------ #
+
+class _CountingMixin:
+    def prepare_for_next_attempt(self, *, state, request, response=None, error=None):
+        started = time.monotonic()
+        try:
+            super().prepare_for_next_attempt(
+                state=state, request=request, response=response, error=error
+            )
+        finally:
+            method = request.url.rsplit("/", 1)[-1]
+            with _stats_lock:
+                _stats.retries[method] += 1
+                _stats.retry_wait += time.monotonic() - started
+
+
+class CountingRateLimitErrorRetryHandler(_CountingMixin, RateLimitErrorRetryHandler):
+    """429 を Retry-After 秒待って再試行"""
+
+
+class CountingConnectionErrorRetryHandler(_CountingMixin, ConnectionErrorRetryHandler):
+    """接続エラーを指数バックオフで再試行"""
+
+
+class CountingServerErrorRetryHandler(_CountingMixin, ServerErrorRetryHandler):
+    """500/503 を指数バックオフで再試行"""
+
+
+def _retry_handlers(max_retries: int):
+    return [
+        CountingRateLimitErrorRetryHandler(max_retry_count=max_retries),
+        CountingConnectionErrorRetryHandler(max_retry_count=max_retries),
+        CountingServerErrorRetryHandler(max_retry_count=max_retries),
+    ]
+
+
+# ------------------------------------------------------------------ #
+#  クライアント
+# ------------------------------------------------------------------ #
+
+class ThrottledWebClient(WebClient):
+    """API メソッドごとのトークンバケットを通してから呼び出す WebClient"""
+
+    def api_call(self, api_method: str, *args, **kwargs):
+        waited = _bucket_for(api_method).acquire()
+        with _stats_lock:
+            _stats.calls[api_method] += 1
+            _stats.throttle_wait += waited
+        return super().api_call(api_method, *args, **kwargs)
+
+
+_ssl_context: Optional[ssl.SSLContext] = None
+_clients: Dict[Tuple[str, str], WebClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(token: Optional[str] = None, base_url: Optional[str] = None) -> WebClient:
+    """
+    共有 WebClient を返す。
+    token 省略時は環境変数 SLACK_BOT_TOKEN、base_url 省略時は SLACK_API_URL を使う。
+    """
+    global _ssl_context
+    token = token if token is not None else os.environ.get("SLACK_BOT_TOKEN", "")
+    base_url = base_url or SLACK_API_URL
+
+    key = (token, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if _ssl_context is None:
+                _ssl_context = ssl.create_default_context()
+            client = ThrottledWebClient(
+                token=token,
+                base_url=base_url,
+                timeout=SLACK_TIMEOUT,
+                ssl=_ssl_context,
+                retry_handlers=_retry_handlers(SLACK_MAX_RETRIES),
+            )
+            _clients[key] = client
+        return client
+
+
+def reset_clients() -> None:
+    """共有クライアントとトークンバケットを破棄する（テスト用）"""
+    with _clients_lock:
+        _clients.clear()
+    with _buckets_lock:
+        _buckets.clear()
@@ -28,6 +28,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # PROFILE_REQUESTS=True の時だけ有効（セッション・認証のクエリも数えるため先頭に置く）
+    "jobs.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -83,6 +85,29 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# ---- Cache ----
+# 月次 Excel キャッシュのバージョン管理などに使う（web / worker で共有）
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_URL", "redis://redis:6379/2"),
+    }
+}
+
+# 生成済み Excel の保存先（compose.yaml の exceldata ボリューム配下）と合計サイズ上限
+EXPORT_CACHE_DIR = os.environ.get("EXPORT_CACHE_DIR", str(BASE_DIR / "MRCASE" / "doc" / "cache"))
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# ---- Profiling ----
+# true にするとリクエストごとのクエリ数・SQL 時間・描画時間・メモリのピークをログに出す（jobs.profiling）
+PROFILE_REQUESTS = os.environ.get("DJANGO_PROFILE_REQUESTS", "false").lower() == "true"
+# これ以上かかったリクエストは繰り返し実行された SQL と合わせて WARNING で出す（ミリ秒）
+PROFILE_SLOW_MS = int(os.environ.get("DJANGO_PROFILE_SLOW_MS", "500"))
+
+# ---- Metrics ----
+# /metrics/ の取得に使うトークン（Authorization: Bearer <token>）。未設定ならスタッフのログインが必要
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
 # ---- Celery ----
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/1")
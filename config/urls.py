@@ -22,4 +22,17 @@ urlpatterns = [
     # 工数
     path("manhours/", jobs_views.manhour_list, name="manhour_list"),
     path("manhours/download/", jobs_views.manhour_download, name="manhour_download"),
+    path("manhours/exports/", jobs_views.manhour_export_request, name="manhour_export_request"),
+    path("manhours/exports/<str:job_id>/", jobs_views.manhour_export_detail, name="manhour_export_detail"),
+    path("manhours/exports/<str:job_id>/status/", jobs_views.manhour_export_status, name="manhour_export_status"),
+    path("manhours/exports/<str:job_id>/download/", jobs_views.manhour_export_download, name="manhour_export_download"),
+
+    # API（読み取り専用）
+    path("api/manhours/", jobs_views.manhour_records_api, name="manhour_records_api"),
+
+    # Slack Events API（署名付き）
+    path("slack/events/", jobs_views.slack_events_endpoint, name="slack_events"),
+
+    # メトリクス（Prometheus）
+    path("metrics/", jobs_views.metrics_endpoint, name="metrics"),
 ]
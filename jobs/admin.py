@@ -1,5 +1,5 @@
 from django.contrib import admin
-from jobs.models import Case, ManHourRecord
+from jobs.models import BackfillWindow, Case, ManHourMonthlySummary, ManHourRecord, SlackChannelCursor, SlackUser, UserIdentity
 
 
 @admin.register(Case)
@@ -15,3 +15,45 @@ class ManHourRecordAdmin(admin.ModelAdmin):
     list_filter = ("work_date", "assignee")
     search_fields = ("project_name", "assignee")
     date_hierarchy = "work_date"
+    # 件数の多い表なので絞り込み時に全件 COUNT を取らない
+    show_full_result_count = False
+
+
+@admin.register(ManHourMonthlySummary)
+class ManHourMonthlySummaryAdmin(admin.ModelAdmin):
+    list_display = ("month", "case", "assignee", "hours", "record_count")
+    # case は null 可なので自動では JOIN されない
+    list_select_related = ("case",)
+    list_filter = ("month",)
+    search_fields = ("assignee",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SlackChannelCursor)
+class SlackChannelCursorAdmin(admin.ModelAdmin):
+    list_display = ("channel_id", "last_ts", "updated_at")
+
+
+@admin.register(SlackUser)
+class SlackUserAdmin(admin.ModelAdmin):
+    list_display = ("slack_id", "name", "is_deleted", "updated_at")
+    search_fields = ("slack_id", "name")
+
+
+@admin.register(BackfillWindow)
+class BackfillWindowAdmin(admin.ModelAdmin):
+    list_display = ("channel_id", "oldest", "latest", "status", "fetched", "imported", "attempts", "finished_at")
+    list_filter = ("status", "channel_id")
+
+
+@admin.register(UserIdentity)
+class UserIdentityAdmin(admin.ModelAdmin):
+    list_display = ("user", "kind", "value", "created_at")
+    list_filter = ("kind",)
+    search_fields = ("value", "user__username")
+    autocomplete_fields = ("user",)
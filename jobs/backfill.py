@@ -0,0 +1,187 @@
+"""
+jobs/backfill.py
+過去分の再取り込み（manage.py backfill_manhours）
+  - 範囲を時間窓に分割して BackfillWindow に登録（同じ範囲の再実行では既存行を使う）
+  - 窓ごとに jobs.tasks.backfill_window を投入し、複数ワーカーで並行に取り込む
+  - 各窓は jobs.pipeline.import_window をそのまま使う（重複は source_ts でスキップ）
+  - 完了した窓は再実行時に投入しないので、途中で止めても続きから再開できる
+通常取り込みのチェックポイント（SlackChannelCursor）は動かさない。
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Callable, List, Optional
+
+from django.db.models import Count, Max, Min, Q, QuerySet, Sum
+from django.utils import timezone
+
+from jobs.importer import ImportResult
+from jobs.models import BackfillWindow
+from jobs.pipeline import format_ts, import_window, iter_windows
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_RE = re.compile(r"^(\d+)\s*([dhm])$")
+_CHUNK_UNITS = {"d": 24 * 60 * 60, "h": 60 * 60, "m": 60}
+
+
+def parse_chunk(value: str) -> int:
+    """'1d' / '12h' / '30m' を秒数に変換する。解釈できなければ ValueError"""
+    m = _CHUNK_RE.match(value.strip().lower())
+    if not m or int(m.group(1)) <= 0:
+        raise ValueError(f"unsupported chunk: {value}")
+    return int(m.group(1)) * _CHUNK_UNITS[m.group(2)]
+
+
+def day_start_ts(d: date) -> str:
+    """ローカルタイムゾーン（settings.TIME_ZONE）での d の 0:00 を Slack の ts にする"""
+    dt = timezone.make_aware(datetime.combine(d, datetime.min.time()))
+    return _ts(dt.timestamp())
+
+
+def _ts(value: float) -> str:
+    return format_ts(Decimal(str(value)))
+
+
+# ------------------------------------------------------------------ #
+#  計画
+# ------------------------------------------------------------------ #
+
+def plan(channel: str, since: date, until: date, chunk: int, now: Optional[float] = None) -> QuerySet:
+    """
+    since 〜 until（両端の日を含む）を chunk 秒ずつの窓にして BackfillWindow に登録し、
+    その範囲の窓を古い順に返す。未来の分は now で打ち切る。
+    """
+    oldest = day_start_ts(since)
+    latest = day_start_ts(until + timedelta(days=1))
+    now_ts = _ts(time.time() if now is None else now)
+    if Decimal(latest) > Decimal(now_ts):
+        latest = now_ts
+
+    BackfillWindow.objects.bulk_create(
+        [
+            BackfillWindow(channel_id=channel, oldest=start, latest=end)
+            for start, end in iter_windows(oldest, latest, chunk)
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    return windows_in(channel, oldest, latest)
+
+
+def windows_in(channel: str, oldest: str, latest: str) -> QuerySet:
+    # ts は整数部10桁の固定小数なので文字列比較で範囲を絞れる
+    return BackfillWindow.objects.filter(
+        channel_id=channel, oldest__gte=oldest, latest__lte=latest,
+    ).order_by("oldest")
+
+
+# ------------------------------------------------------------------ #
+#  実行（Celery タスクから呼ぶ）
+# ------------------------------------------------------------------ #
+
+def run_window(window_id: int, resolve_user: Callable[[Optional[str]], str]) -> BackfillWindow:
+    """1つの窓を取り込んで進捗を記録する。失敗時は failed にして例外を投げ直す。"""
+    window = BackfillWindow.objects.get(pk=window_id)
+    if window.status == BackfillWindow.Status.DONE:
+        return window
+
+    window.status = BackfillWindow.Status.RUNNING
+    window.attempts += 1
+    window.started_at = timezone.now()
+    window.error = ""
+    window.save(update_fields=["status", "attempts", "started_at", "error", "updated_at"])
+
+    result = ImportResult()
+    try:
+        state = import_window(window.channel_id, window.oldest, window.latest, resolve_user, result)
+    except Exception as exc:
+        window.status = BackfillWindow.Status.FAILED
+        window.error = str(exc)[:2000]
+        window.imported = result.imported
+        window.finished_at = timezone.now()
+        window.save(update_fields=["status", "error", "imported", "finished_at", "updated_at"])
+        raise
+
+    window.status = BackfillWindow.Status.DONE
+    window.fetched = state.fetched
+    window.imported = result.imported
+    window.finished_at = timezone.now()
+    window.save(update_fields=["status", "fetched", "imported", "finished_at", "updated_at"])
+    return window
+
+
+# ------------------------------------------------------------------ #
+#  進捗
+# ------------------------------------------------------------------ #
+
+@dataclass(frozen=True)
+class Progress:
+    total: int
+    done: int
+    running: int
+    failed: int
+    fetched: int
+    imported: int
+    elapsed: float  # 最初の開始 〜 最後の完了（秒）
+
+    @property
+    def pending(self) -> int:
+        return self.total - self.done - self.running - self.failed
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.fetched / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def windows_per_minute(self) -> float:
+        return self.done * 60 / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.done}/{self.total} windows done "
+            f"(running={self.running} failed={self.failed} pending={self.pending}) "
+            f"fetched={self.fetched} imported={self.imported} "
+            f"elapsed={self.elapsed:.1f}s {self.messages_per_second:.1f} msg/s "
+            f"{self.windows_per_minute:.1f} windows/min"
+        )
+
+
+def progress(windows: QuerySet) -> Progress:
+    """窓の進捗を1クエリで集計する"""
+    s = BackfillWindow.Status
+    agg = windows.order_by().aggregate(
+        total=Count("id"),
+        done=Count("id", filter=Q(status=s.DONE)),
+        running=Count("id", filter=Q(status=s.RUNNING)),
+        failed=Count("id", filter=Q(status=s.FAILED)),
+        fetched=Sum("fetched"),
+        imported=Sum("imported"),
+        first_started=Min("started_at"),
+        last_finished=Max("finished_at"),
+    )
+    elapsed = 0.0
+    if agg["first_started"] and agg["last_finished"]:
+        elapsed = max((agg["last_finished"] - agg["first_started"]).total_seconds(), 0.0)
+    return Progress(
+        total=agg["total"],
+        done=agg["done"],
+        running=agg["running"],
+        failed=agg["failed"],
+        fetched=agg["fetched"] or 0,
+        imported=agg["imported"] or 0,
+        elapsed=elapsed,
+    )
+
+
+def dispatchable(windows: QuerySet, retry_running: bool = False) -> List[int]:
+    """投入対象の窓 id（完了済みは除く。処理中は retry_running のときだけ）"""
+    s = BackfillWindow.Status
+    statuses = [s.PENDING, s.FAILED] + ([s.RUNNING] if retry_running else [])
+    return list(windows.filter(status__in=statuses).values_list("id", flat=True))
@@ -0,0 +1,372 @@
+"""
+jobs/benchmarks.py
+パーサー・取り込み・Excel 出力・工数画面のベンチマーク（通常のテストとは別に実行する）
+
+    BENCH_SCALE=100k BENCH_JSON=bench_output.json python manage.py test jobs.benchmarks
+
+  BENCH_SCALE   : 1k / 100k / 1m（ManHourRecord の件数。直近12か月に均等に作成）
+  BENCH_ROUNDS  : 各ベンチマークの繰り返し回数（既定 5）
+  BENCH_JSON    : 結果の出力先（既定 bench_output.json）
+  BENCH_BASELINE: 比較対象の過去の結果。指定すると平均時間の増減を表示する
+
+結果は pytest-benchmark と同じ形（benchmarks[].stats.min/max/mean/median/stddev）の JSON。
+各ベンチマークはクエリ数の上限も検証し、件数に比例してクエリが増えたら失敗する。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Callable, List, Optional
+from unittest import mock
+
+import django
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from jobs import case_directory, export_cache, summary, tasks
+from jobs.dates import month_start, next_month
+from jobs.importer import BATCH_SIZE
+from jobs.models import Case, ManHourRecord, SlackChannelCursor, UserIdentity
+from jobs.pipeline import IMPORT_WINDOW
+from MRCASE import env
+from MRCASE.app.filter import filter_by_first_line
+from MRCASE.app.manhour_parser import parse_man_hour_message
+from MRCASE.models.slack_message import SlackMessage
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+SCALE = os.environ.get("BENCH_SCALE", "1k").lower()
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", "5"))
+JSON_PATH = os.environ.get("BENCH_JSON", "bench_output.json")
+BASELINE_PATH = os.environ.get("BENCH_BASELINE")
+
+# シード時の bulk_create の件数
+SEED_BATCH_SIZE = 5000
+ASSIGNEES = ["大場", "田中", "佐藤", "鈴木", "高橋", "伊藤", "渡辺", "山本"]
+CASE_COUNT = 50
+
+# 取り込みベンチマークで1メッセージに書く工数の行数
+LINES_PER_MESSAGE = 10
+
+# 1バッチの INSERT が分割されうる文の数（SQLite の変数上限による）
+INSERT_SPLIT = 10
+
+_results: List[dict] = []
+
+
+# ------------------------------------------------------------------ #
+#  計測
+# ------------------------------------------------------------------ #
+
+def _stats(times: List[float]) -> dict:
+    return {
+        "min": min(times),
+        "max": max(times),
+        "mean": statistics.fmean(times),
+        "median": statistics.median(times),
+        "stddev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "rounds": len(times),
+        "total": sum(times),
+        "data": times,
+    }
+
+
+def _commit_info() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"id": commit}
+
+
+def _machine_info() -> dict:
+    return {
+        "python_version": platform.python_version(),
+        "django_version": django.get_version(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "database": connection.vendor,
+    }
+
+
+def write_results(path: str = JSON_PATH) -> None:
+    data = {
+        "machine_info": _machine_info(),
+        "commit_info": _commit_info(),
+        "benchmarks": _results,
+        "datetime": datetime.now().isoformat(),
+        "version": "mrcase-bench-1",
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+    if BASELINE_PATH:
+        compare(BASELINE_PATH, data)
+
+
+def compare(baseline_path: str, current: dict) -> None:
+    """過去の結果と平均時間を比べて標準エラーに表示する"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {b["fullname"]: b for b in json.load(f)["benchmarks"]}
+    for b in current["benchmarks"]:
+        old = baseline.get(b["fullname"])
+        if old is None:
+            continue
+        ratio = b["stats"]["mean"] / old["stats"]["mean"] if old["stats"]["mean"] else 0.0
+        sys.stderr.write(
+            f"{b['fullname']}: {old['stats']['mean']:.4f}s -> {b['stats']['mean']:.4f}s ({ratio - 1:+.1%})\n"
+        )
+
+
+def tearDownModule():
+    if _results:
+        write_results()
+
+
+# ------------------------------------------------------------------ #
+#  シード
+# ------------------------------------------------------------------ #
+
+def bench_months(today: Optional[date] = None) -> List[date]:
+    """今月を含む直近12か月の月初"""
+    month = month_start(today or date.today())
+    months = [month]
+    for _ in range(11):
+        month = month_start(month - timedelta(days=1))
+        months.append(month)
+    return list(reversed(months))
+
+
+def seed(n: int) -> dict:
+    """n 件の ManHourRecord を直近12か月に均等に作成し、月次集計を作り直す"""
+    User = get_user_model()
+    admin = User.objects.create_superuser("bench-admin", password="pw")
+    user = User.objects.create_user("bench-user", password="pw")
+    UserIdentity.objects.create(user=user, kind=UserIdentity.Kind.ALIAS, value=ASSIGNEES[0])
+
+    cases = Case.objects.bulk_create([
+        Case(name=f"案件{i:03d}", unique_key=f"BENCH{i:03d}", created_by=admin)
+        for i in range(CASE_COUNT)
+    ])
+    # bulk_create は signal を送らないので案件キャッシュを明示的に無効化する
+    case_directory.bump_version()
+
+    months = bench_months()
+    batch = []
+    for i in range(n):
+        month = months[i % len(months)]
+        days = (next_month(month) - month).days
+        assignee = ASSIGNEES[i % len(ASSIGNEES)]
+        case = cases[i % len(cases)]
+        batch.append(ManHourRecord(
+            case=case,
+            project_name=case.name,
+            assignee=assignee,
+            assignee_user=user if assignee == ASSIGNEES[0] else None,
+            work_date=month + timedelta(days=(i // len(months)) % days),
+            hours=Decimal("1.5") + i % 4,
+            source_ts=f"seed{i}_0",
+        ))
+        if len(batch) >= SEED_BATCH_SIZE:
+            ManHourRecord.objects.bulk_create(batch)
+            batch = []
+    ManHourRecord.objects.bulk_create(batch)
+    summary.rebuild()
+
+    return {"admin": admin, "user": user, "cases": cases}
+
+
+def synthetic_messages(count: int, start_ts: float, lines: int = LINES_PER_MESSAGE) -> List[SlackMessage]:
+    """工数登録メッセージ（lines 行ずつ）と関係ないメッセージを交互に作る"""
+    messages = []
+    today = date.today()
+    for i in range(count):
+        ts = f"{start_ts + i:.6f}"
+        if i % 2:
+            text = "お疲れさまです。本日の作業は以上です。"
+        else:
+            body = "\n".join(
+                f"案件名=BENCH{(i + j) % CASE_COUNT:03d}, 時間={1 + j % 4}, "
+                f"日付={today:%Y/%m/%d}, 担当者={ASSIGNEES[(i + j) % len(ASSIGNEES)]}"
+                for j in range(lines)
+            )
+            text = f"{env.ADD_MAN_HOUR}\n{body}"
+        messages.append(SlackMessage(text=text, user="U1", ts=ts, thread_ts=None, raw={}))
+    return messages
+
+
+# ------------------------------------------------------------------ #
+#  ベンチマーク
+# ------------------------------------------------------------------ #
+
+@tag("benchmark")
+class Benchmarks(TestCase):
+    scale = SCALE
+    n = SCALES[SCALE]
+
+    @classmethod
+    def setUpTestData(cls):
+        started = time.perf_counter()
+        cls.seeded = seed(cls.n)
+        sys.stderr.write(f"\nseeded {cls.n} records in {time.perf_counter() - started:.1f}s\n")
+
+    def setUp(self):
+        self.today = date.today()
+
+    def bench(
+        self,
+        name: str,
+        fn: Callable[[], object],
+        max_queries: Optional[int] = None,
+        setup: Optional[Callable[[], None]] = None,
+        rounds: int = ROUNDS,
+        **extra,
+    ) -> List[float]:
+        """
+        fn を rounds 回実行して時間を計る（setup は計測外で毎回呼ぶ）。
+        max_queries を指定するとクエリ数が上限以内であることも検証する。
+        """
+        times, queries = [], []
+        for _ in range(rounds):
+            if setup is not None:
+                setup()
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - started)
+            queries.append(len(ctx.captured_queries))
+
+        if max_queries is not None:
+            self.assertLessEqual(
+                max(queries), max_queries,
+                f"{name}: {max(queries)} queries (budget {max_queries})",
+            )
+
+        _results.append({
+            "group": name.split("[")[0],
+            "name": name,
+            "fullname": f"{name}[{self.scale}]",
+            "params": {"scale": self.scale, "records": self.n},
+            "stats": _stats(times),
+            "extra_info": {"queries": max(queries), "query_budget": max_queries, **extra},
+        })
+        return times
+
+    # ---- MRCASE.app ----
+
+    def test_parse_man_hour_message(self):
+        messages = synthetic_messages(self.n // LINES_PER_MESSAGE * 2, 0)[::2]  # 工数登録のみ
+
+        def run():
+            for m in messages:
+                parse_man_hour_message(m.text, self.today)
+
+        self.bench("parse_man_hour_message", run, max_queries=0, lines=len(messages) * LINES_PER_MESSAGE)
+
+    def test_filter_by_first_line(self):
+        messages = synthetic_messages(self.n // LINES_PER_MESSAGE * 2, 0, lines=1)
+        self.bench(
+            "filter_by_first_line",
+            lambda: filter_by_first_line(messages, env.ADD_MAN_HOUR),
+            max_queries=0,
+            messages=len(messages),
+        )
+
+    # ---- 取り込み ----
+
+    def test_import_from_slack(self):
+        """Slack の取得部分をスタブにした取り込み（毎回セーブポイントでロールバック）"""
+        now = time.time()
+        start = now - IMPORT_WINDOW / 2
+        messages = synthetic_messages(max(self.n // LINES_PER_MESSAGE * 2, 2), start)
+
+        def fake_history(oldest=None, latest=None, **kwargs):
+            return iter(messages)
+
+        SlackChannelCursor.objects.create(channel_id="CBENCH", last_ts=f"{start - 1:.6f}")
+
+        @contextmanager
+        def stubbed():
+            with mock.patch("jobs.pipeline.iter_channel_messages", fake_history), \
+                    mock.patch("jobs.pipeline.iter_thread_replies", lambda *a, **k: iter(())), \
+                    mock.patch.object(tasks.user_directory, "warm_up", return_value=0), \
+                    mock.patch.object(tasks, "SLACK_CHANNEL_ID", "CBENCH"):
+                yield
+
+        imported = []
+
+        def run():
+            with transaction.atomic():
+                imported.append(tasks._import_from_slack().imported)
+                transaction.set_rollback(True)
+
+        records = len(messages) // 2 * LINES_PER_MESSAGE
+        # クエリ数はレコード数ではなくバッチ数で決まる:
+        #   バッチごとに 既存チェック・担当者解決2・INSERT・集計の UPSERT（SQLite では分割される）
+        #   （Case は案件キャッシュで解決するので、読み直しは最初の1回だけ）
+        # 集計表の一意制約を作れない DB（SQLite）では集計グループごとに UPDATE（新規グループは INSERT も）
+        batches = -(-records // BATCH_SIZE)
+        if connection.features.supports_nulls_distinct_unique_constraints:
+            budget = 11 + batches * (3 + 2 * INSERT_SPLIT)
+        else:
+            groups = min(BATCH_SIZE, CASE_COUNT * len(ASSIGNEES))
+            budget = 11 + batches * (3 + INSERT_SPLIT + 2 * groups)
+
+        with stubbed():
+            self.bench("import_from_slack", run, max_queries=budget, records=records)
+        self.assertEqual(imported[0], records)
+
+    # ---- Excel ----
+
+    def _invalidate(self):
+        export_cache.bump_version(self.today.year, self.today.month)
+
+    def test_build_monthly_excel(self):
+        def run():
+            with tasks._build_monthly_excel():
+                pass
+
+        # raw 1 + 集計シート（案件別・担当者別・日別・案件×担当者）ごとに GROUP BY 1
+        self.bench("build_monthly_excel[cold]", run, max_queries=5, setup=self._invalidate)
+        self.bench("build_monthly_excel[cached]", run, max_queries=0)
+
+    def test_manhour_download(self):
+        url = reverse("manhour_download")
+        params = {"year": self.today.year, "month": self.today.month}
+
+        for who in ("admin", "user"):
+            self.client.force_login(self.seeded[who])
+
+            def run():
+                res = self.client.get(url, params)
+                b"".join(res.streaming_content)
+                self.assertEqual(res.status_code, 200)
+
+            # session + user + レコード + 集計シート4
+            self.bench(f"manhour_download[{who}]", run, max_queries=7, setup=self._invalidate)
+
+    def test_manhour_list(self):
+        url = reverse("manhour_list")
+        params = {"year": self.today.year, "month": self.today.month}
+
+        for who in ("admin", "user"):
+            self.client.force_login(self.seeded[who])
+
+            def run():
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+
+            # session + user + 集計 + 1ページ分（案件リストはプロセス内キャッシュを計測外で読み込んでおく）
+            self.bench(f"manhour_list[{who}]", run, max_queries=4, setup=case_directory.directory.snapshot)
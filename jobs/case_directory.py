@@ -0,0 +1,100 @@
+"""
+jobs/case_directory.py
+案件キー（unique_key）→ 案件 の解決キャッシュ
+  - 全案件を (id, name, unique_key, is_active) でプロセス内に保持する（件数が少なく、めったに変わらない）
+  - Django cache（Redis）のバージョンを web / worker で共有し、Case の保存・削除のたびに更新する（jobs.signals）
+  - 参照のたびにバージョンだけを確認し、変わっていれば DB から読み直す
+取り込み（jobs.importer）と工数一覧の案件プルダウン（jobs.views）で使う。
+Case.objects.update / bulk_create は signal を送らないので、使った場合は bump_version() を呼ぶこと。
+"""
+
+from __future__ import annotations
+
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+
+from jobs.models import Case
+
+VERSION_KEY = "case_directory:version"
+
+
+@dataclass(frozen=True)
+class CaseEntry:
+    id: int
+    name: str
+    unique_key: str
+    is_active: bool
+
+
+@dataclass(frozen=True)
+class CaseSnapshot:
+    """あるバージョン時点の全案件"""
+    by_key: Dict[str, CaseEntry]
+    active: List[CaseEntry]  # 有効案件（名前順）
+
+    def resolve(self, unique_key: str) -> Optional[CaseEntry]:
+        """有効な案件だけを返す（無効・未登録なら None）"""
+        entry = self.by_key.get(unique_key)
+        return entry if entry is not None and entry.is_active else None
+
+
+def current_version() -> str:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # cache が消えた場合も古い内容を使わないよう新しい値にする
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version() -> None:
+    """案件が変わったことを全プロセスに知らせる"""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+class CaseDirectory:
+    """バージョンが変わった時だけ DB から読み直す案件キャッシュ（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._snapshot = CaseSnapshot({}, [])
+
+    def snapshot(self) -> CaseSnapshot:
+        """最新の全案件（Redis へのバージョン確認1回、変わっていれば DB 1クエリ）"""
+        version = current_version()
+        with self._lock:
+            if version != self._version:
+                self._snapshot = self._load()
+                self._version = version
+            return self._snapshot
+
+    def resolve(self, unique_key: str) -> Optional[CaseEntry]:
+        return self.snapshot().resolve(unique_key)
+
+    def active(self) -> List[CaseEntry]:
+        return self.snapshot().active
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version = None
+            self._snapshot = CaseSnapshot({}, [])
+
+    @staticmethod
+    def _load() -> CaseSnapshot:
+        entries = [
+            CaseEntry(*row)
+            for row in Case.objects.values_list("id", "name", "unique_key", "is_active")
+        ]
+        return CaseSnapshot(
+            by_key={e.unique_key: e for e in entries},
+            active=sorted((e for e in entries if e.is_active), key=lambda e: (e.name, e.id)),
+        )
+
+
+# プロセス内で共有する
+directory = CaseDirectory()
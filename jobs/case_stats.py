@@ -0,0 +1,86 @@
+"""
+jobs/case_stats.py
+案件一覧の集計列（合計工数・今月の工数・最終稼働日・未マッチ件数）と並び替え
+  - 合計・今月の工数は月次集計表（ManHourMonthlySummary）から
+  - 最終稼働日は (case, work_date) のインデックスで案件ごとに1行だけ読む
+  - 未マッチ件数は案件キーと同じ案件名で case が無いレコード（部分インデックス）
+いずれも相関サブクエリなので、1ページ分の SELECT 1回で求まる。
+並び替えに使う列だけは全案件分を計算するが、集計表とインデックスしか読まないので
+レコード数が増えても重くならない。
+"""
+
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from jobs.dates import month_start
+from jobs.models import Case, ManHourMonthlySummary, ManHourRecord
+
+# ?sort= に指定できる列（先頭に - で降順）
+SORT_FIELDS = (
+    "unique_key",
+    "name",
+    "is_active",
+    "created_at",
+    "total_hours",
+    "month_hours",
+    "last_activity",
+    "unmatched_count",
+)
+DEFAULT_SORT = "-created_at"
+
+
+def _summary_hours(month: Optional[date] = None) -> Coalesce:
+    summaries = ManHourMonthlySummary.objects.filter(case=OuterRef("pk"))
+    if month is not None:
+        summaries = summaries.filter(month=month_start(month))
+    hours = summaries.order_by().values("case").annotate(total=Sum("hours")).values("total")
+    return Coalesce(
+        Subquery(hours, output_field=DecimalField(max_digits=12, decimal_places=2)),
+        Value(Decimal(0)),
+    )
+
+
+def with_stats(queryset: QuerySet, today: Optional[date] = None) -> QuerySet:
+    """Case の queryset に集計列を付ける"""
+    today = today or date.today()
+    last_activity = (
+        ManHourRecord.objects.filter(case=OuterRef("pk"))
+        .order_by("-work_date")
+        .values("work_date")[:1]
+    )
+    unmatched = (
+        ManHourRecord.objects.filter(case__isnull=True, project_name=OuterRef("unique_key"))
+        .order_by()
+        .values("project_name")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    return queryset.annotate(
+        total_hours=_summary_hours(),
+        month_hours=_summary_hours(today),
+        last_activity=Subquery(last_activity),
+        unmatched_count=Coalesce(Subquery(unmatched, output_field=IntegerField()), Value(0)),
+    )
+
+
+def parse_sort(value: Optional[str]) -> str:
+    """?sort= の値（不正なら既定の並び）"""
+    if value and value.lstrip("-") in SORT_FIELDS:
+        return value
+    return DEFAULT_SORT
+
+
+def case_list_queryset(sort: str = DEFAULT_SORT, today: Optional[date] = None) -> QuerySet:
+    """案件一覧（集計列付き、sort の順。同じ値の中は id 順）"""
+    field = sort.lstrip("-")
+    order = F(field).desc(nulls_last=True) if sort.startswith("-") else F(field).asc(nulls_last=True)
+    return (
+        with_stats(Case.objects.select_related("created_by"), today)
+        .order_by(order, "id")
+    )
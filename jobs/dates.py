@@ -0,0 +1,32 @@
+"""
+jobs/dates.py
+月単位の日付範囲ヘルパー
+work_date__year / work_date__month は EXTRACT() になり work_date のインデックスが
+使えないため、月の絞り込みは [月初, 翌月初) の範囲条件で行う。
+"""
+
+from datetime import date
+from typing import Iterator, Tuple
+
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def next_month(d: date) -> date:
+    """d の翌月の1日"""
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def month_range(year: int, month: int) -> Tuple[date, date]:
+    """year/month の [月初, 翌月初)"""
+    start = date(year, month, 1)
+    return start, next_month(start)
+
+
+def iter_months(start: date, end: date) -> Iterator[date]:
+    """start 〜 end（両端を含む）の各月の1日"""
+    month = month_start(start)
+    while month <= end:
+        yield month
+        month = next_month(month)
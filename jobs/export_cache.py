@@ -0,0 +1,151 @@
+"""
+jobs/export_cache.py
+生成済み月次 Excel のキャッシュ
+  - キーは (年, 月, 範囲=全員 or 担当者のユーザー, データバージョン) のハッシュ
+  - データバージョンは月ごとに Django cache（Redis）に保持し、
+    その月の ManHourRecord が変わるたびに更新する（取込・管理画面・シグナル）
+  - ファイルは共有ボリューム（EXPORT_CACHE_DIR）に置き、合計サイズ上限を
+    超えたら最終アクセスが古いものから削除する
+バージョンが変わらない限り、2回目以降は DB も openpyxl も使わずにファイルを返す。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from jobs.exporter import monthly_records, write_workbook
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "manhour:version:{year}:{month:02d}"
+SCOPE_ALL = "all"
+
+
+def _cache_dir() -> Path:
+    path = Path(settings.EXPORT_CACHE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+# ------------------------------------------------------------------ #
+#  データバージョン
+# ------------------------------------------------------------------ #
+
+def data_version(year: int, month: int) -> str:
+    """year/month のデータバージョン（未設定なら新しく発行する）"""
+    key = VERSION_KEY.format(year=year, month=month)
+    version = cache.get(key)
+    if version is None:
+        # cache が消えた場合も古いファイルを返さないよう新しい値にする
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def data_versions(months: Iterable[Tuple[int, int]]) -> List[str]:
+    """複数月のデータバージョン（まとめて1回で取得し、未設定の月だけ発行する）"""
+    months = list(months)
+    keys = [VERSION_KEY.format(year=y, month=m) for y, m in months]
+    found = cache.get_many(keys)
+    return [
+        found[key] if key in found else data_version(y, m)
+        for key, (y, m) in zip(keys, months)
+    ]
+
+
+def bump_version(year: int, month: int) -> None:
+    """year/month のデータが変わったことを記録する"""
+    cache.set(VERSION_KEY.format(year=year, month=month), uuid.uuid4().hex, timeout=None)
+
+
+def bump_versions(months: Iterable[Tuple[int, int]]) -> None:
+    for year, month in set(months):
+        bump_version(year, month)
+
+
+# ------------------------------------------------------------------ #
+#  ファイルキャッシュ
+# ------------------------------------------------------------------ #
+
+def cache_key(year: int, month: int, user_id: Optional[int], version: str) -> str:
+    scope = SCOPE_ALL if user_id is None else f"user:{user_id}"
+    raw = f"{year}-{month:02d}|{scope}|{version}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def path_for(year: int, month: int, user_id: Optional[int] = None) -> Path:
+    """現在のデータバージョンの Excel の保存先（まだ無いこともある）"""
+    version = data_version(year, month)
+    return _cache_dir() / f"{cache_key(year, month, user_id, version)}.xlsx"
+
+
+def get_or_build(
+    year: int,
+    month: int,
+    user_id: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Path:
+    """
+    キャッシュ済みの Excel のパスを返す。無ければ生成して保存する。
+    progress は生成時に write_workbook へ渡す（書いた行数で呼ばれる）。
+    """
+    path = path_for(year, month, user_id)
+
+    if path.exists():
+        # 最終アクセス時刻を更新（LRU 判定に使う）
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass  # 直前に削除された場合は作り直す
+
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            write_workbook(monthly_records(year, month, user_id), tmp, progress)
+        os.replace(tmp_name, path)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+    evict()
+    return path
+
+
+def evict(max_bytes: Optional[int] = None) -> int:
+    """合計サイズが max_bytes を超えていれば古いものから削除する。削除数を返す。"""
+    max_bytes = settings.EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    files = []
+    for p in _cache_dir().glob("*.xlsx"):
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        files.append((st.st_mtime, st.st_size, p))
+
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, p in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+
+    if removed:
+        logger.info("export cache: evicted %d files", removed)
+    return removed
@@ -0,0 +1,154 @@
+"""
+jobs/export_jobs.py
+月次 Excel の非同期生成（画面の「Excel を作成」から使う）
+  - request_export: ジョブを登録して Celery（jobs.tasks.export_manhours）に渡す。
+    生成済みならタスクを使わずに完了済みのジョブを返す
+  - 同じ 年月・範囲・データバージョン のジョブが実行待ち/実行中なら、新しく登録せずそれを返す
+    （別のユーザーの依頼で作られたジョブも返すので、参照の可否は requested_by ではなく
+    範囲 user_id で判定する。jobs.views._own_job）
+  - run: ワーカーで Excel を共有ボリューム（EXPORT_CACHE_DIR、jobs.export_cache）に生成し、
+    書いた行数を進捗としてジョブに記録する
+ジョブの状態は Django cache（Redis）に置くので、web からは DB もファイルも触らずに進捗を返せる。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from jobs.export_cache import get_or_build, path_for
+from jobs.exporter import monthly_records
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY = "export:job:{job_id}"
+PENDING_KEY = "export:pending:{key}"
+
+# ジョブの状態を残す期間と、実行待ちの重複排除を続ける上限（ワーカーが落ちた場合に備える）
+JOB_TTL = 24 * 60 * 60
+PENDING_TTL = int(os.environ.get("EXPORT_JOB_PENDING_TIMEOUT", "3600"))
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def get(job_id: str) -> Optional[dict]:
+    return cache.get(JOB_KEY.format(job_id=job_id))
+
+
+def _save(job: dict) -> dict:
+    cache.set(JOB_KEY.format(job_id=job["id"]), job, timeout=JOB_TTL)
+    return job
+
+
+def update(job_id: str, **fields) -> Optional[dict]:
+    """ジョブの値を更新する（書き込むのは担当ワーカーだけなので上書きで良い）"""
+    job = get(job_id)
+    if job is None:
+        return None
+    job.update(fields)
+    return _save(job)
+
+
+def percent(job: dict) -> int:
+    """進捗（%）。完了するまでは 99 で止める"""
+    if job["status"] == DONE:
+        return 100
+    if not job.get("total_rows"):
+        return 0
+    return min(int(job["rows"] * 100 / job["total_rows"]), 99)
+
+
+def file_path(job: dict) -> Optional[Path]:
+    """完了したジョブの Excel（キャッシュの上限で削除済みなら None）"""
+    if job["status"] != DONE or not job.get("file"):
+        return None
+    path = Path(settings.EXPORT_CACHE_DIR) / Path(job["file"]).name
+    return path if path.exists() else None
+
+
+# ------------------------------------------------------------------ #
+#  受付（web）
+# ------------------------------------------------------------------ #
+
+def request_export(
+    year: int,
+    month: int,
+    user_id: Optional[int],
+    requested_by: int,
+    enqueue: Callable[[str], object],
+) -> dict:
+    """
+    year/month（user_id 指定時はその担当者分）の Excel 生成を受け付けてジョブを返す。
+    enqueue にはジョブ ID を受け取って Celery に渡す関数（export_manhours.delay）を渡す。
+    """
+    job = {
+        "id": uuid.uuid4().hex,
+        "year": year,
+        "month": month,
+        "user_id": user_id,
+        "requested_by": requested_by,
+        "status": PENDING,
+        "rows": 0,
+        "total_rows": None,
+        "file": None,
+        "error": None,
+        "created_at": time.time(),
+    }
+
+    path = path_for(year, month, user_id)
+    if path.exists():
+        return _save({**job, "status": DONE, "file": path.name})
+
+    # ファイル名は 年月・範囲・データバージョン のハッシュなので、そのまま重複排除のキーにする
+    job["pending_key"] = PENDING_KEY.format(key=path.stem)
+    if not cache.add(job["pending_key"], job["id"], timeout=PENDING_TTL):
+        existing = get(cache.get(job["pending_key"]) or "")
+        if existing is not None and existing["status"] in (PENDING, RUNNING):
+            return existing
+        cache.set(job["pending_key"], job["id"], timeout=PENDING_TTL)
+
+    _save(job)
+    enqueue(job["id"])
+    return get(job["id"]) or job
+
+
+# ------------------------------------------------------------------ #
+#  実行（worker）
+# ------------------------------------------------------------------ #
+
+def _release_pending(job: dict) -> None:
+    key = job.get("pending_key")
+    if key and cache.get(key) == job["id"]:
+        cache.delete(key)
+
+
+def run(job_id: str) -> Optional[dict]:
+    """ジョブの Excel を生成して完了にする（失敗したら failed にして例外を送出）"""
+    job = get(job_id)
+    if job is None:
+        logger.warning("export job %s not found (expired?)", job_id)
+        return None
+
+    year, month, user_id = job["year"], job["month"], job["user_id"]
+    total = monthly_records(year, month, user_id).count()
+    update(job_id, status=RUNNING, total_rows=total, started_at=time.time())
+
+    try:
+        path = get_or_build(year, month, user_id, progress=lambda rows: update(job_id, rows=rows))
+    except Exception as exc:
+        update(job_id, status=FAILED, error=str(exc), finished_at=time.time())
+        raise
+    finally:
+        _release_pending(job)
+
+    return update(job_id, status=DONE, file=path.name, rows=total, finished_at=time.time())
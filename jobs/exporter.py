@@ -0,0 +1,154 @@
+"""
+jobs/exporter.py
+月次工数 Excel の生成（ダウンロード・Slack 送信で共通）
+  - openpyxl の write_only モードで1行ずつ書き出す
+  - レコードは values_list(...).iterator() でモデルを作らずに読む
+  - 出力先は呼び出し側が渡すファイル（ダウンロード・Slack 送信・非同期生成はすべて
+    jobs.export_cache.get_or_build 経由でキャッシュに保存したものを使う）
+raw シートの後に 案件別・担当者別・日別・案件×担当者 の集計シートを付ける。
+集計はシートごとに GROUP BY 1回で DB 側で行い、Python ではグループ単位の値だけを扱う
+（数式やピボットテーブルは使わないので、raw が数十万行でも開くのは軽い）。
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db.models import Count, QuerySet, Sum
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from jobs.models import ManHourRecord
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+SHEET_RAW = "raw"
+HEADERS = ["日付", "案件名", "担当者", "時間(h)"]
+
+SHEET_BY_CASE = "案件別"
+SHEET_BY_ASSIGNEE = "担当者別"
+SHEET_BY_DAY = "日別"
+SHEET_MATRIX = "案件×担当者"
+TOTAL_LABEL = "合計"
+
+# DB から一度に読む件数
+CHUNK_SIZE = 2000
+
+
+def monthly_filename(year: int, month: int) -> str:
+    return f"manhour_{year}{month:02d}.xlsx"
+
+
+def monthly_records(year: int, month: int, user_id: Optional[int] = None) -> QuerySet:
+    """year/month の ManHourRecord（user_id 指定時はそのユーザーが担当者のもののみ）"""
+    records = ManHourRecord.objects.in_month(year, month)
+    if user_id is not None:
+        records = records.filter(assignee_user_id=user_id)
+    return records.order_by("work_date", "assignee")
+
+
+def _raw_rows(records: QuerySet) -> Iterable[Tuple]:
+    rows = records.values_list("work_date", "project_name", "assignee", "hours")
+    for work_date, project_name, assignee, hours in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield (work_date.isoformat(), project_name, assignee, float(hours))
+
+
+def _grouped(records: QuerySet, *fields: str, distinct: Optional[str] = None) -> QuerySet:
+    """fields ごとの合計時間・件数（distinct 指定時はその列の種類数も）を GROUP BY 1回で求める"""
+    aggregates = {"total": Sum("hours"), "count": Count("id")}
+    if distinct:
+        aggregates["kinds"] = Count(distinct, distinct=True)
+    return records.order_by().values(*fields).annotate(**aggregates).order_by(*fields)
+
+
+def _sheet(wb: Workbook, title: str, headers: Sequence[str], widths: Sequence[int]):
+    """見出し行・1列目を固定した集計シート"""
+    ws = wb.create_sheet(title)
+    ws.freeze_panes = "B2"
+    for i, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.append(list(headers))
+    return ws
+
+
+def _write_groups(
+    wb: Workbook,
+    title: str,
+    label: str,
+    kinds_label: str,
+    groups: Iterable[dict],
+    key: str,
+    format_key=str,
+) -> None:
+    """1列目が key の集計シート（最終行に合計）"""
+    ws = _sheet(wb, title, [label, "時間(h)", "件数", kinds_label], [24, 12, 10, 10])
+    total, count = Decimal(0), 0
+    for g in groups:
+        ws.append([format_key(g[key]), float(g["total"]), g["count"], g["kinds"]])
+        total += g["total"]
+        count += g["count"]
+    ws.append([TOTAL_LABEL, float(total), count, None])
+
+
+def _write_matrix(wb: Workbook, records: QuerySet) -> None:
+    """案件（行）× 担当者（列）の時間。行・列の合計付き"""
+    cells: Dict[str, Dict[str, Decimal]] = {}
+    assignees = set()
+    for g in _grouped(records, "project_name", "assignee"):
+        cells.setdefault(g["project_name"], {})[g["assignee"]] = g["total"]
+        assignees.add(g["assignee"])
+    columns: List[str] = sorted(assignees)
+
+    ws = _sheet(wb, SHEET_MATRIX, ["案件名", *columns, TOTAL_LABEL], [24])
+    column_totals = dict.fromkeys(columns, Decimal(0))
+    for project_name, row in cells.items():
+        for assignee, hours in row.items():
+            column_totals[assignee] += hours
+        ws.append([
+            project_name,
+            *[float(row[a]) if a in row else None for a in columns],
+            float(sum(row.values())),
+        ])
+    ws.append([TOTAL_LABEL, *[float(column_totals[a]) for a in columns], float(sum(column_totals.values()))])
+
+
+def write_workbook(
+    records: QuerySet,
+    fileobj: BinaryIO,
+    progress: Optional[Callable[[int], None]] = None,
+) -> None:
+    """
+    records を raw シートと集計シートに書き出して fileobj に保存する。
+    progress を渡すと raw シートに CHUNK_SIZE 行書くごとに書いた行数で呼ぶ。
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SHEET_RAW)
+    ws.freeze_panes = "A2"
+
+    ws.append(HEADERS)
+    written = 0
+    for row in _raw_rows(records):
+        ws.append(row)
+        written += 1
+        if progress is not None and written % CHUNK_SIZE == 0:
+            progress(written)
+    if progress is not None:
+        progress(written)
+
+    _write_groups(
+        wb, SHEET_BY_CASE, "案件名", "担当者数",
+        _grouped(records, "project_name", distinct="assignee"), "project_name",
+    )
+    _write_groups(
+        wb, SHEET_BY_ASSIGNEE, "担当者", "案件数",
+        _grouped(records, "assignee", distinct="project_name"), "assignee",
+    )
+    _write_groups(
+        wb, SHEET_BY_DAY, "日付", "担当者数",
+        _grouped(records, "work_date", distinct="assignee"), "work_date",
+        format_key=lambda d: d.isoformat(),
+    )
+    _write_matrix(wb, records)
+
+    wb.save(fileobj)
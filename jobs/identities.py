@@ -0,0 +1,108 @@
+"""
+jobs/identities.py
+担当者（Slack の送信者 / メッセージ中の担当者名）→ Django ユーザー の解決
+  - Slack ID: UserIdentity(kind=slack_id)
+  - 担当者名: UserIdentity(kind=alias)、無ければ Slack ID を登録済みのユーザーの Slack 表示名
+どちらもバッチ単位で IN クエリ2回にまとめて引く。
+ユーザーを追加・改名した時は jobs.signals から seed_aliases / link_unassigned を呼び、
+それまでに取り込んだ担当者名のレコードも紐づける。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from jobs.models import ManHourRecord, SlackUser, UserIdentity
+
+
+@dataclass
+class IdentityMap:
+    by_slack_id: Dict[str, int] = field(default_factory=dict)
+    by_name: Dict[str, int] = field(default_factory=dict)
+
+    def user_id(self, slack_id: Optional[str], name: Optional[str]) -> Optional[int]:
+        """送信者の Slack ID を優先し、無ければ担当者名で解決する"""
+        if slack_id and slack_id in self.by_slack_id:
+            return self.by_slack_id[slack_id]
+        if name:
+            return self.by_name.get(name)
+        return None
+
+
+def identity_map(slack_ids: Iterable[Optional[str]], names: Iterable[Optional[str]]) -> IdentityMap:
+    """slack_ids / names をまとめて解決する（クエリ2回）"""
+    slack_ids = {s for s in slack_ids if s}
+    names = {n for n in names if n}
+    if not slack_ids and not names:
+        return IdentityMap()
+
+    # 担当者名が Slack の表示名の場合は、その Slack ID 経由でも引けるようにする
+    name_of_slack_id = dict(
+        SlackUser.objects.filter(name__in=names).values_list("slack_id", "name")
+    ) if names else {}
+
+    rows = UserIdentity.objects.filter(
+        Q(kind=UserIdentity.Kind.SLACK_ID, value__in=slack_ids | name_of_slack_id.keys())
+        | Q(kind=UserIdentity.Kind.ALIAS, value__in=names)
+    ).values_list("kind", "value", "user_id")
+
+    result = IdentityMap()
+    aliases: Dict[str, int] = {}
+    for kind, value, user_id in rows:
+        if kind == UserIdentity.Kind.ALIAS:
+            aliases[value] = user_id
+            continue
+        if value in slack_ids:
+            result.by_slack_id[value] = user_id
+        if value in name_of_slack_id:
+            result.by_name.setdefault(name_of_slack_id[value], user_id)
+    # 明示的に登録した担当者名を優先
+    result.by_name.update(aliases)
+    return result
+
+
+def user_id_for_name(name: Optional[str]) -> Optional[int]:
+    return identity_map((), [name]).user_id(None, name)
+
+
+def alias_names(user) -> Set[str]:
+    """ユーザーの担当者名として扱う名前（氏名・ユーザー名）"""
+    return {v for v in (user.get_full_name(), user.get_username()) if v}
+
+
+def seed_aliases(users: Optional[Iterable] = None) -> int:
+    """
+    各ユーザー（省略時は全員）の氏名・ユーザー名を担当者名として登録する（未登録のものだけ）。
+    これまでの「氏名 or ユーザー名 = 担当者名」の対応を引き継ぐためのもの。
+    """
+    if users is None:
+        users = get_user_model().objects.all()
+    identities = [
+        UserIdentity(user=user, kind=UserIdentity.Kind.ALIAS, value=value)
+        for user in users
+        for value in alias_names(user)
+    ]
+    created = UserIdentity.objects.bulk_create(identities, ignore_conflicts=True)
+    return len(created)
+
+
+def link_unassigned(names: Iterable[str]) -> Set[Tuple[int, int]]:
+    """
+    assignee_user が未設定で担当者名が names のレコードを解決できたユーザーに紐づける。
+    更新した (年, 月) を返す（Excel キャッシュの無効化に使う）。
+    """
+    names = {n for n in names if n}
+    users = identity_map((), names)
+    months: Set[Tuple[int, int]] = set()
+    for name in names:
+        user_id = users.user_id(None, name)
+        if user_id is None:
+            continue
+        records = ManHourRecord.objects.filter(assignee_user__isnull=True, assignee=name)
+        months |= {(d.year, d.month) for d in records.dates("work_date", "month")}
+        records.update(assignee_user_id=user_id)
+    return months
@@ -0,0 +1,202 @@
+"""
+jobs/importer.py
+工数エントリを ManHourRecord にまとめて書き込むバッチインポーター
+  - バッチ内の source_ts を1クエリで既存チェック
+  - case_key をプロセス内の案件キャッシュ（jobs.case_directory）で Case に解決
+  - 担当者を jobs.identities で Django ユーザーに解決（assignee_user）
+  - INSERT ... ON CONFLICT (source_ts) DO NOTHING RETURNING をバッチ単位のトランザクションで実行し、
+    実際に INSERT できた行だけを件数・月次集計に反映する
+"""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+from datetime import date
+from decimal import Decimal
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Sequence, Set
+
+from django.db import connection, transaction
+
+from jobs.case_directory import directory as case_directory
+from jobs.export_cache import bump_versions
+from jobs.identities import identity_map
+from jobs.metrics import StageTimings
+from jobs.models import ManHourRecord
+from jobs.summary import SummaryRow, apply_records
+
+# 1トランザクションで書き込む件数
+BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class PendingRecord:
+    """書き込み待ちの1工数（担当者・source_ts 確定済み）"""
+    source_ts: str
+    case_key: str
+    assignee: str
+    work_date: date
+    hours: float
+    # 担当者を送信者から補った場合の Slack user_id（assignee_user の解決に使う）
+    slack_user_id: Optional[str] = None
+
+
+@dataclass
+class BatchStats:
+    """1バッチ分の書き込み結果"""
+    received: int = 0          # バッチに渡された件数
+    skipped_existing: int = 0  # 既に登録済み（source_ts 重複）
+    unmatched_case: int = 0    # 有効な Case が見つからなかった件数
+    inserted: int = 0          # 新規に INSERT した件数
+
+
+@dataclass
+class ImportResult:
+    """インポート全体の結果（バッチごとの統計・解析できなかった行・段ごとの所要時間を保持）"""
+    batches: List[BatchStats] = field(default_factory=list)
+    rejects: List[dict] = field(default_factory=list)
+    stages: StageTimings = field(default_factory=StageTimings)
+
+    @property
+    def imported(self) -> int:
+        return sum(b.inserted for b in self.batches)
+
+    def as_dict(self) -> dict:
+        return {
+            "imported": self.imported,
+            "batches": [asdict(b) for b in self.batches],
+            "rejects": self.rejects,
+            "stages": {
+                stage: {"seconds": round(seconds, 6), "items": self.stages.items[stage]}
+                for stage, seconds in self.stages.exclusive().items()
+            },
+        }
+
+
+def _chunked(rows: Iterable[PendingRecord], size: int) -> Iterator[List[PendingRecord]]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _insert_new(objs: Sequence[ManHourRecord]) -> Set[str]:
+    """
+    objs を INSERT し、実際に挿入できた source_ts を返す。
+    並行実行で同じ source_ts が先に入っていた行は黙ってスキップされ、結果に含まれない
+    （bulk_create(ignore_conflicts=True) はスキップした行を区別できないため SQL で書く）。
+    """
+    meta = ManHourRecord._meta
+    fields = [f for f in meta.concrete_fields if not f.primary_key]
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(f.column) for f in fields)
+    row_sql = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+
+    inserted: Set[str] = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            chunk = objs[start:start + batch_size]
+            params = [
+                f.get_db_prep_save(f.pre_save(o, add=True), connection)
+                for o in chunk
+                for f in fields
+            ]
+            cursor.execute(
+                f"INSERT INTO {qn(meta.db_table)} ({columns}) VALUES {', '.join([row_sql] * len(chunk))} "
+                f"ON CONFLICT ({qn('source_ts')}) DO NOTHING RETURNING {qn('source_ts')}",
+                params,
+            )
+            inserted.update(ts for (ts,) in cursor.fetchall())
+    return inserted
+
+
+def _existing_source_ts(rows: Sequence[PendingRecord]) -> Set[str]:
+    return set(
+        ManHourRecord.objects.filter(
+            source_ts__in=[r.source_ts for r in rows],
+        ).values_list("source_ts", flat=True)
+    )
+
+
+def write_batch(rows: Sequence[PendingRecord]) -> BatchStats:
+    """
+    rows を1トランザクションで ManHourRecord に書き込む。
+    クエリ数は件数によらず 既存チェック1 + 担当者解決2 + INSERT + 月次集計の UPSERT の定数回
+    （Case は案件キャッシュで解決し、案件が変わった後の最初のバッチだけ読み直しの1クエリ。
+    集計表の一意制約を作れない DB では集計はグループごとの UPDATE になる。jobs.summary 参照）。
+    """
+    stats = BatchStats(received=len(rows))
+    if not rows:
+        return stats
+
+    existing = _existing_source_ts(rows)
+
+    # 既存分とバッチ内の重複を除外
+    new_rows: List[PendingRecord] = []
+    seen = set(existing)
+    for r in rows:
+        if r.source_ts in seen:
+            stats.skipped_existing += 1
+            continue
+        seen.add(r.source_ts)
+        new_rows.append(r)
+
+    if not new_rows:
+        return stats
+
+    cases = case_directory.snapshot()
+
+    users = identity_map(
+        (r.slack_user_id for r in new_rows),
+        (r.assignee for r in new_rows),
+    )
+
+    objs = []
+    for r in new_rows:
+        case = cases.resolve(r.case_key)
+        objs.append(
+            ManHourRecord(
+                case_id=case.id if case else None,
+                project_name=case.name if case else r.case_key,
+                assignee=r.assignee,
+                assignee_user_id=users.user_id(r.slack_user_id, r.assignee),
+                work_date=r.work_date,
+                hours=r.hours,
+                source_ts=r.source_ts,
+            )
+        )
+
+    with transaction.atomic():
+        # 並行実行で同じ source_ts が先に入った場合は黙ってスキップ
+        inserted_ts = _insert_new(objs)
+        inserted = [o for o in objs if o.source_ts in inserted_ts]
+        # 月次集計も同じトランザクションで、実際に挿入できた分だけ加算
+        apply_records(added=[
+            SummaryRow(o.work_date, o.case_id, o.assignee, Decimal(str(o.hours)))
+            for o in inserted
+        ])
+        # signal を送らないので、対象月の Excel キャッシュをここで無効化
+        months = {(o.work_date.year, o.work_date.month) for o in inserted}
+        transaction.on_commit(lambda: bump_versions(months))
+    stats.inserted = len(inserted)
+    # 案件の未マッチも実際に挿入した分だけ数える（読み直した窓の重複を数えない）
+    stats.unmatched_case = sum(1 for o in inserted if o.case_id is None)
+    # 既存チェックの後に他の取り込みが先に入れた分
+    stats.skipped_existing += len(objs) - len(inserted)
+
+    return stats
+
+
+def import_records(
+    rows: Iterable[PendingRecord],
+    batch_size: int = BATCH_SIZE,
+    result: Optional[ImportResult] = None,
+) -> ImportResult:
+    """rows を batch_size 件ずつ write_batch に流す"""
+    result = result or ImportResult()
+    for chunk in _chunked(rows, batch_size):
+        result.batches.append(write_batch(chunk))
+    return result
@@ -0,0 +1,69 @@
+"""
+jobs/locks.py
+Django cache（Redis）を使った分散ロック
+  - 取得は cache.add（Redis の SET NX + 有効期限）なので、同時に取れるのは1つだけ
+  - 値にはランダムなトークンを入れ、解放・延長はトークンが一致する場合のみ行う
+  - ワーカーが落ちても timeout 経過後に自動で解放される
+Celery のタスクをまたいで保持する場合はトークンを引数で渡して release する。
+"""
+
+from __future__ import annotations
+
+import logging
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "lock:{name}"
+
+# Slack 取り込み（nightly / manual_import）で共有するロック
+IMPORT_LOCK = "manhour-import"
+
+
+def acquire(name: str, timeout: int) -> Optional[str]:
+    """ロックを取得してトークンを返す（他で保持中なら None）"""
+    token = uuid.uuid4().hex
+    if cache.add(LOCK_KEY.format(name=name), token, timeout=timeout):
+        return token
+    return None
+
+
+def owner(name: str) -> Optional[str]:
+    """保持中のトークン（無ければ None）"""
+    return cache.get(LOCK_KEY.format(name=name))
+
+
+def release(name: str, token: str) -> bool:
+    """token で取得したロックを解放する（既に他に移っていれば何もしない）"""
+    key = LOCK_KEY.format(name=name)
+    if cache.get(key) != token:
+        logger.warning("lock %s is not held by %s; skip release", name, token)
+        return False
+    cache.delete(key)
+    return True
+
+
+def extend(name: str, token: str, timeout: int) -> bool:
+    """token で保持中のロックの有効期限を timeout 秒後に延ばす"""
+    key = LOCK_KEY.format(name=name)
+    if cache.get(key) != token:
+        return False
+    return cache.touch(key, timeout)
+
+
+@contextmanager
+def held(name: str, timeout: int) -> Iterator[Optional[str]]:
+    """
+    with held(name, timeout) as token: ...
+    取得できなかった場合 token は None（本体は呼び出し側でスキップする）。
+    """
+    token = acquire(name, timeout)
+    try:
+        yield token
+    finally:
+        if token is not None:
+            release(name, token)
@@ -0,0 +1,17 @@
+from datetime import date, datetime
+
+from django.core.management.base import CommandError
+
+
+def parse_month(value):
+    """'YYYY-MM' を月初の date に変換する（None はそのまま）"""
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m").date().replace(day=1)
+    except ValueError:
+        raise CommandError(f"月は YYYY-MM 形式で指定してください: {value}")
+
+
+def format_month(d: date) -> str:
+    return f"{d:%Y-%m}"
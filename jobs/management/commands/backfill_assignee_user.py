@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from jobs.export_cache import bump_versions
+from jobs.identities import identity_map, seed_aliases
+from jobs.models import ManHourRecord
+
+
+class Command(BaseCommand):
+    help = "ManHourRecord.assignee_user を担当者名（UserIdentity）から設定する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--no-seed", action="store_true",
+            help="ユーザーの氏名・ユーザー名を担当者名として登録しない",
+        )
+        parser.add_argument(
+            "--all", action="store_true",
+            help="設定済みのレコードも解決し直す（担当者名の対応を変えた場合）",
+        )
+
+    def handle(self, *args, **options):
+        if not options["no_seed"]:
+            self.stdout.write(f"seeded {seed_aliases()} aliases")
+
+        records = ManHourRecord.objects.all()
+        if not options["all"]:
+            records = records.filter(assignee_user__isnull=True)
+
+        # 担当者名ごとに1回の UPDATE（担当者名の種類は少ない）
+        names = list(records.order_by().values_list("assignee", flat=True).distinct())
+        months = {(d.year, d.month) for d in records.dates("work_date", "month")}
+        users = identity_map((), names)
+
+        updated = unresolved = 0
+        for name in names:
+            user_id = users.user_id(None, name)
+            if user_id is None:
+                unresolved += 1
+                if not options["all"]:
+                    continue
+            updated += records.filter(assignee=name).update(assignee_user_id=user_id)
+
+        # 担当者ごとの Excel キャッシュの中身が変わる
+        if updated:
+            bump_versions(months)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"updated {updated} records ({len(names) - unresolved}/{len(names)} assignee names resolved)"
+        ))
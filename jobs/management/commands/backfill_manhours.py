@@ -0,0 +1,65 @@
+import os
+import time
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs import backfill
+from jobs.tasks import _warm_up_users, backfill_window
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"日付は YYYY-MM-DD 形式で指定してください: {value}")
+
+
+class Command(BaseCommand):
+    help = (
+        "指定期間の Slack メッセージを時間窓ごとの Celery タスクで取り込み直す。"
+        "同じ引数で再実行すると未完了の窓だけを投入する。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", required=True, help="開始日（YYYY-MM-DD、この日を含む）")
+        parser.add_argument("--until", help="終了日（YYYY-MM-DD、この日を含む）。省略時は今日")
+        parser.add_argument("--chunk", default="1d", help="窓の幅（例: 1d / 12h / 30m）")
+        parser.add_argument("--channel", default=os.environ.get("SLACK_CHANNEL_ID", ""), help="チャンネル ID")
+        parser.add_argument("--status", action="store_true", help="投入せずに進捗だけ表示する")
+        parser.add_argument("--wait", action="store_true", help="全窓が終わるまで進捗とスループットを表示する")
+        parser.add_argument("--interval", type=float, default=5.0, help="--wait の表示間隔（秒）")
+        parser.add_argument(
+            "--retry-running", action="store_true",
+            help="処理中のまま止まった窓（ワーカー停止など）も再投入する",
+        )
+
+    def handle(self, *args, **options):
+        since = _parse_date(options["since"])
+        until = _parse_date(options["until"]) if options["until"] else date.today()
+        if since > until:
+            raise CommandError("--since は --until 以前の日付を指定してください")
+        if not options["channel"]:
+            raise CommandError("--channel か SLACK_CHANNEL_ID を指定してください")
+        try:
+            chunk = backfill.parse_chunk(options["chunk"])
+        except ValueError:
+            raise CommandError(f"--chunk は 1d / 12h / 30m の形式で指定してください: {options['chunk']}")
+
+        windows = backfill.plan(options["channel"], since, until, chunk)
+
+        if not options["status"]:
+            _warm_up_users()
+            ids = backfill.dispatchable(windows, retry_running=options["retry_running"])
+            for window_id in ids:
+                backfill_window.delay(window_id)
+            self.stdout.write(f"dispatched {len(ids)} windows")
+
+        current = backfill.progress(windows)
+        while options["wait"] and current.pending + current.running > 0:
+            self.stdout.write(str(current))
+            time.sleep(options["interval"])
+            current = backfill.progress(windows)
+
+        style = self.style.ERROR if current.failed else self.style.SUCCESS
+        self.stdout.write(style(str(current)))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs.management.commands._month import format_month, parse_month
+from jobs.summary import check_consistency
+
+
+class Command(BaseCommand):
+    help = "月次工数集計（ManHourMonthlySummary）と ManHourRecord の整合性をチェックする"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="対象月（YYYY-MM）。省略時は全期間")
+
+    def handle(self, *args, **options):
+        mismatches = check_consistency(parse_month(options["month"]))
+        for m in mismatches:
+            self.stdout.write(
+                f"{format_month(m.month)} case={m.case_id} assignee={m.assignee}: "
+                f"expected {m.expected_hours}h/{m.expected_count} "
+                f"actual {m.actual_hours}h/{m.actual_count}"
+            )
+        if mismatches:
+            raise CommandError(
+                f"{len(mismatches)} groups are inconsistent. "
+                "Run `manage.py rebuild_manhour_summary` to fix."
+            )
+        self.stdout.write(self.style.SUCCESS("summary is consistent"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from jobs.management.commands._month import parse_month
+from jobs.summary import rebuild
+
+
+class Command(BaseCommand):
+    help = "月次工数集計（ManHourMonthlySummary）を ManHourRecord から作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="対象月（YYYY-MM）。省略時は全期間")
+
+    def handle(self, *args, **options):
+        month = parse_month(options["month"])
+        count = rebuild(month)
+        self.stdout.write(self.style.SUCCESS(f"rebuilt {count} summary rows"))
@@ -0,0 +1,224 @@
+"""
+jobs/metrics.py
+Celery タスクの段ごとの計測と Prometheus テキスト形式での出力（/metrics）
+  - StageTimings: ジェネレータでつないだ各段（fetch → filter → parse → resolve → write）の
+    所要時間と件数を記録する。各段の時間は上流を除いた自分の分だけ
+  - record_stage: 1段分の値を構造化ログ（JSON）に出し、メトリクスに加算する
+  - メトリクスは Django cache（Redis）に置くので、ワーカーで記録した値を web から返せる
+    （外部の Pushgateway などは不要）。秒はマイクロ秒の整数で加算する
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+SERIES_KEY = "metrics:series"
+VALUE_KEY = "metrics:v:{series}"
+
+COUNTER = "counter"
+GAUGE = "gauge"
+
+# 名前 → (種類, 説明, 保存時の倍率)
+METRICS: Dict[str, Tuple[str, str, int]] = {
+    "mrcase_task_stage_seconds_total": (COUNTER, "Time spent in each task stage", 1_000_000),
+    "mrcase_task_stage_runs_total": (COUNTER, "Number of times each task stage ran", 1),
+    "mrcase_task_stage_items_total": (COUNTER, "Items processed by each task stage", 1),
+    "mrcase_task_stage_retries_total": (COUNTER, "Retries in each task stage", 1),
+    "mrcase_task_stage_errors_total": (COUNTER, "Failed runs of each task stage", 1),
+    "mrcase_task_stage_last_seconds": (GAUGE, "Duration of the last run of each task stage", 1_000_000),
+    "mrcase_task_last_success_timestamp_seconds": (GAUGE, "Unix time of the last successful task run", 1),
+}
+
+
+# ------------------------------------------------------------------ #
+#  段ごとの計測
+# ------------------------------------------------------------------ #
+
+@dataclass
+class StageTimings:
+    """
+    ジェネレータの段ごとの時間（上流を含む）と件数。
+    wrap した順に上流 → 下流とみなし、exclusive() で各段だけの時間に直す。
+    """
+    inclusive: Dict[str, float] = field(default_factory=dict)
+    items: Dict[str, int] = field(default_factory=dict)
+    order: List[str] = field(default_factory=list)
+
+    def _stage(self, stage: str) -> None:
+        if stage not in self.inclusive:
+            self.inclusive[stage] = 0.0
+            self.items[stage] = 0
+            self.order.append(stage)
+
+    def wrap(self, stage: str, iterable: Iterable) -> Iterator:
+        """iterable から1件取り出すのにかかった時間を stage に加算しながら流す"""
+        self._stage(stage)
+        it = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.inclusive[stage] += time.perf_counter() - started
+                return
+            self.inclusive[stage] += time.perf_counter() - started
+            self.items[stage] += 1
+            yield item
+
+    def add(self, stage: str, seconds: float, items: int = 0) -> None:
+        """ジェネレータでない段（上流を含む時間）を加算する"""
+        self._stage(stage)
+        self.inclusive[stage] += seconds
+        self.items[stage] += items
+
+    def exclusive(self) -> Dict[str, float]:
+        """各段の時間から上流の段の時間を引いたもの"""
+        result, upstream = {}, 0.0
+        for stage in self.order:
+            result[stage] = max(self.inclusive[stage] - upstream, 0.0)
+            upstream = self.inclusive[stage]
+        return result
+
+
+# ------------------------------------------------------------------ #
+#  記録
+# ------------------------------------------------------------------ #
+
+_series_lock = threading.Lock()
+
+
+def _series(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{body}}}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _register(series: str) -> None:
+    with _series_lock:
+        registered = cache.get(SERIES_KEY) or []
+        if series not in registered:
+            cache.set(SERIES_KEY, sorted({*registered, series}), timeout=None)
+
+
+def inc(name: str, labels: Dict[str, str], value: float = 1) -> None:
+    scaled = int(round(value * METRICS[name][2]))
+    series = _series(name, labels)
+    _register(series)
+    key = VALUE_KEY.format(series=series)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, scaled)
+    except ValueError:
+        # add と incr の間に消えた場合
+        cache.set(key, scaled, timeout=None)
+
+
+def set_gauge(name: str, labels: Dict[str, str], value: float) -> None:
+    series = _series(name, labels)
+    _register(series)
+    cache.set(VALUE_KEY.format(series=series), int(round(value * METRICS[name][2])), timeout=None)
+
+
+def record_stage(
+    task: str,
+    stage: str,
+    seconds: float,
+    items: Optional[int] = None,
+    retries: int = 0,
+    ok: bool = True,
+) -> None:
+    """1段分の計測結果を構造化ログに出してメトリクスに加算する"""
+    logger.info(json.dumps({
+        "event": "task_stage",
+        "task": task,
+        "stage": stage,
+        "seconds": round(seconds, 6),
+        "items": items,
+        "retries": retries,
+        "ok": ok,
+    }, ensure_ascii=False))
+
+    labels = {"task": task, "stage": stage}
+    try:
+        inc("mrcase_task_stage_seconds_total", labels, seconds)
+        inc("mrcase_task_stage_runs_total", labels)
+        set_gauge("mrcase_task_stage_last_seconds", labels, seconds)
+        if items:
+            inc("mrcase_task_stage_items_total", labels, items)
+        if retries:
+            inc("mrcase_task_stage_retries_total", labels, retries)
+        if not ok:
+            inc("mrcase_task_stage_errors_total", labels)
+    except Exception as exc:
+        # 計測の失敗で本体を止めない
+        logger.warning("failed to record metrics for %s/%s: %s", task, stage, exc)
+
+
+def record_timings(task: str, timings: StageTimings, retries: Optional[Dict[str, int]] = None) -> None:
+    """StageTimings の各段を record_stage する"""
+    retries = retries or {}
+    for stage, seconds in timings.exclusive().items():
+        record_stage(task, stage, seconds, items=timings.items[stage], retries=retries.get(stage, 0))
+
+
+def record_success(task: str) -> None:
+    try:
+        set_gauge("mrcase_task_last_success_timestamp_seconds", {"task": task}, time.time())
+    except Exception as exc:
+        logger.warning("failed to record metrics for %s: %s", task, exc)
+
+
+class timed:
+    """with timed() as t: ... → t.seconds"""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        return False
+
+
+# ------------------------------------------------------------------ #
+#  出力
+# ------------------------------------------------------------------ #
+
+def render() -> str:
+    """cache の値を Prometheus のテキスト形式にする"""
+    series = cache.get(SERIES_KEY) or []
+    values = cache.get_many([VALUE_KEY.format(series=s) for s in series])
+
+    by_name: Dict[str, List[str]] = {}
+    for s in series:
+        name = s.split("{", 1)[0]
+        if name not in METRICS:
+            continue
+        raw = values.get(VALUE_KEY.format(series=s))
+        if raw is None:
+            continue
+        scale = METRICS[name][2]
+        by_name.setdefault(name, []).append(f"{s} {raw}" if scale == 1 else f"{s} {raw / scale:.6f}")
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text, _ = METRICS[name]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(by_name[name])
+    return "\n".join(lines) + "\n"
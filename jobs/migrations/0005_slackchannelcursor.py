@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jobs", "0004_alter_case_unique_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlackChannelCursor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("channel_id", models.CharField(max_length=32, unique=True)),
+                ("last_ts", models.CharField(max_length=50)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
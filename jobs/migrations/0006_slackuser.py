@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jobs", "0005_slackchannelcursor"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlackUser",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("slack_id", models.CharField(max_length=32, unique=True)),
+                ("name", models.CharField(max_length=200)),
+                ("is_deleted", models.BooleanField(default=False)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0006_slackuser'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManHourMonthlySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('assignee', models.CharField(max_length=200)),
+                ('hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('case', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_summaries', to='jobs.case')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('month', 'case', 'assignee'), name='manhour_summary_month_case_assignee_uniq', nulls_distinct=False)],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY はトランザクション内で実行できない
+    atomic = False
+
+    dependencies = [
+        ("jobs", "0007_manhourmonthlysummary"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="manhourrecord",
+            index=models.Index(fields=["work_date", "assignee"], name="manhour_date_assignee_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="manhourrecord",
+            index=models.Index(fields=["case", "work_date"], name="manhour_case_date_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="manhourrecord",
+            index=models.Index(fields=["assignee", "work_date"], name="manhour_assignee_date_idx"),
+        ),
+    ]
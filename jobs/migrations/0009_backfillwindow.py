@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0008_manhourrecord_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel_id', models.CharField(max_length=32)),
+                ('oldest', models.CharField(max_length=50)),
+                ('latest', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('pending', '未処理'), ('running', '処理中'), ('done', '完了'), ('failed', '失敗')], default='pending', max_length=16)),
+                ('fetched', models.PositiveIntegerField(default=0)),
+                ('imported', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['channel_id', 'status'], name='backfill_channel_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('channel_id', 'oldest', 'latest'), name='backfill_window_channel_range_uniq')],
+            },
+        ),
+    ]
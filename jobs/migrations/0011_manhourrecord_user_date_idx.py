@@ -0,0 +1,18 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY はトランザクション内で実行できない
+    atomic = False
+
+    dependencies = [
+        ("jobs", "0010_useridentity_manhourrecord_assignee_user"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="manhourrecord",
+            index=models.Index(fields=["assignee_user", "work_date"], name="manhour_user_date_idx"),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY はトランザクション内で実行できない
+    atomic = False
+
+    dependencies = [
+        ("jobs", "0011_manhourrecord_user_date_idx"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="manhourrecord",
+            index=models.Index(
+                condition=models.Q(("case__isnull", True)),
+                fields=["project_name"],
+                name="manhour_unmatched_name_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import migrations
+
+# jobs.export_cache.VERSION_KEY と同じ形式（マイグレーションからはアプリのモジュールを import しない）
+VERSION_KEY = "manhour:version:{year}:{month:02d}"
+
+
+def seed_and_backfill(apps, schema_editor):
+    """
+    既存ユーザーの氏名・ユーザー名を担当者名（UserIdentity alias）として登録し、
+    assignee_user が未設定のレコードを担当者名から埋める（backfill_assignee_user と同じ対応）。
+    担当者名ごとに UPDATE 1回。
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    UserIdentity = apps.get_model("jobs", "UserIdentity")
+    SlackUser = apps.get_model("jobs", "SlackUser")
+    ManHourRecord = apps.get_model("jobs", "ManHourRecord")
+
+    identities = []
+    for user in User.objects.all():
+        full_name = f"{user.first_name} {user.last_name}".strip()
+        for value in {full_name, getattr(user, User.USERNAME_FIELD)}:
+            if value:
+                identities.append(UserIdentity(user_id=user.pk, kind="alias", value=value))
+    UserIdentity.objects.bulk_create(identities, ignore_conflicts=True)
+
+    records = ManHourRecord.objects.filter(assignee_user__isnull=True)
+    names = set(records.order_by().values_list("assignee", flat=True).distinct())
+    if not names:
+        return
+
+    # 担当者名 → ユーザー（登録した担当者名を優先し、無ければ Slack 表示名 → Slack ID）
+    by_slack_id = dict(UserIdentity.objects.filter(kind="slack_id").values_list("value", "user_id"))
+    by_name = {}
+    for slack_id, name in SlackUser.objects.filter(name__in=names).values_list("slack_id", "name"):
+        if slack_id in by_slack_id:
+            by_name.setdefault(name, by_slack_id[slack_id])
+    by_name.update(UserIdentity.objects.filter(kind="alias", value__in=names).values_list("value", "user_id"))
+
+    months = set()
+    for name, user_id in by_name.items():
+        linked = records.filter(assignee=name)
+        months |= {(d.year, d.month) for d in linked.dates("work_date", "month")}
+        linked.update(assignee_user_id=user_id)
+
+    if months:
+        # 担当者ごとの Excel キャッシュの中身が変わる
+        for year, month in months:
+            cache.set(VERSION_KEY.format(year=year, month=month), uuid.uuid4().hex, timeout=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jobs", "0012_manhourrecord_unmatched_name_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_and_backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jobs", "0013_seed_aliases_backfill_assignee_user"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlackThread",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("channel_id", models.CharField(max_length=32)),
+                ("thread_ts", models.CharField(max_length=50)),
+                ("last_reply_ts", models.CharField(max_length=50)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("channel_id", "thread_ts"), name="slack_thread_channel_ts_uniq"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY はトランザクション内で実行できない
+    atomic = False
+
+    dependencies = [
+        ("jobs", "0014_slackthread"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="manhourrecord",
+            index=models.Index(
+                fields=["source_ts"],
+                opclasses=["varchar_pattern_ops"],
+                name="manhour_source_ts_like_idx",
+            ),
+        ),
+    ]
@@ -1,2 +1,8 @@
+from .backfill_window import BackfillWindow
 from .case import Case
-from .manhour_record import ManHourRecord
\ No newline at end of file
+from .manhour_record import ManHourRecord
+from .manhour_summary import ManHourMonthlySummary
+from .slack_channel_cursor import SlackChannelCursor
+from .slack_thread import SlackThread
+from .slack_user import SlackUser
+from .user_identity import UserIdentity
@@ -0,0 +1,43 @@
+from django.db import models
+
+
+class BackfillWindow(models.Model):
+    """
+    過去分の再取り込み（backfill_manhours）の1時間窓と進捗。
+    窓ごとに Celery タスクを1つ投入し、完了した窓は再実行時にスキップする。
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "未処理"
+        RUNNING = "running", "処理中"
+        DONE = "done", "完了"
+        FAILED = "failed", "失敗"
+
+    channel_id = models.CharField(max_length=32)
+    # 窓の範囲（Slack の oldest / latest に渡す ts）
+    oldest = models.CharField(max_length=50)
+    latest = models.CharField(max_length=50)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+
+    fetched = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["channel_id", "oldest", "latest"],
+                name="backfill_window_channel_range_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["channel_id", "status"], name="backfill_channel_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.channel_id} {self.oldest}-{self.latest} ({self.status})"
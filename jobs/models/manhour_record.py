@@ -1,7 +1,17 @@
+from django.conf import settings
 from django.db import models
+
+from jobs.dates import month_range
 from jobs.models.case import Case
 
 
+class ManHourRecordQuerySet(models.QuerySet):
+    def in_month(self, year: int, month: int):
+        """year/month の工数（work_date のインデックスを使える範囲条件）"""
+        start, end = month_range(year, month)
+        return self.filter(work_date__gte=start, work_date__lt=end)
+
+
 class ManHourRecord(models.Model):
     case = models.ForeignKey(
         Case,
@@ -13,6 +23,16 @@ class ManHourRecord(models.Model):
     # Slackメッセージの案件名（case が見つからない場合も保持）
     project_name = models.CharField(max_length=200)
     assignee = models.CharField(max_length=200)
+    # 担当者の Django ユーザー（UserIdentity で解決できた場合。取込時と backfill_assignee_user で設定）
+    assignee_user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="manhour_records",
+        null=True,
+        blank=True,
+        # (assignee_user, work_date) の複合インデックスで足りるので単独のインデックスは作らない
+        db_index=False,
+    )
     work_date = models.DateField()
     hours = models.DecimalField(max_digits=6, decimal_places=2)
 
@@ -21,8 +41,25 @@ class ManHourRecord(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ManHourRecordQuerySet.as_manager()
+
     class Meta:
         ordering = ["-work_date", "assignee"]
+        indexes = [
+            models.Index(fields=["work_date", "assignee"], name="manhour_date_assignee_idx"),
+            models.Index(fields=["case", "work_date"], name="manhour_case_date_idx"),
+            models.Index(fields=["assignee", "work_date"], name="manhour_assignee_date_idx"),
+            models.Index(fields=["assignee_user", "work_date"], name="manhour_user_date_idx"),
+            # 未マッチのレコードを案件キー（project_name）で数える（案件一覧）
+            models.Index(
+                fields=["project_name"],
+                condition=models.Q(case__isnull=True),
+                name="manhour_unmatched_name_idx",
+            ),
+            # メッセージの削除（Events API）で source_ts を前方一致（LIKE 'ts_%'）で探す。
+            # C 以外の照合順序では一意制約のインデックスを LIKE に使えないので別に作る（PostgreSQL）
+            models.Index(fields=["source_ts"], opclasses=["varchar_pattern_ops"], name="manhour_source_ts_like_idx"),
+        ]
 
     def __str__(self):
         return f"{self.work_date} | {self.project_name} | {self.assignee} | {self.hours}h"
\ No newline at end of file
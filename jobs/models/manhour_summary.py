@@ -0,0 +1,34 @@
+from django.db import models
+from jobs.models.case import Case
+
+
+class ManHourMonthlySummary(models.Model):
+    """
+    月 × 案件 × 担当者 ごとの工数集計。
+    ManHourRecord の取込・編集と同じトランザクションで更新する（jobs.summary）。
+    """
+    # 対象月（1日固定）
+    month = models.DateField()
+    # 未マッチのレコードは case=None にまとめる
+    case = models.ForeignKey(
+        Case,
+        on_delete=models.CASCADE,
+        related_name="monthly_summaries",
+        null=True,
+        blank=True,
+    )
+    assignee = models.CharField(max_length=200)
+    hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    record_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["month", "case", "assignee"],
+                name="manhour_summary_month_case_assignee_uniq",
+                nulls_distinct=False,
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} | {self.case_id} | {self.assignee} | {self.hours}h"
@@ -0,0 +1,15 @@
+from django.db import models
+
+
+class SlackChannelCursor(models.Model):
+    """
+    Slack チャンネルごとの取り込み済み位置（high-water mark）。
+    last_ts より新しいメッセージだけを次回取得する。
+    """
+    channel_id = models.CharField(max_length=32, unique=True)
+    # 最後に処理した Slack message の ts
+    last_ts = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.channel_id} @ {self.last_ts}"
@@ -0,0 +1,22 @@
+from django.db import models
+
+
+class SlackThread(models.Model):
+    """
+    返信を待っているスレッド（親メッセージの窓はチェックポイント済み）。
+    取り込みのたびに last_reply_ts より後の返信を取り直し、
+    返信が SLACK_THREAD_LOOKBACK_SECONDS 以上途絶えたら削除する（jobs.pipeline）。
+    """
+    channel_id = models.CharField(max_length=32)
+    thread_ts = models.CharField(max_length=50)
+    # 取り込み済みの最新の返信の ts
+    last_reply_ts = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["channel_id", "thread_ts"], name="slack_thread_channel_ts_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.channel_id} / {self.thread_ts} @ {self.last_reply_ts}"
@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class SlackUser(models.Model):
+    """
+    Slack ユーザーの表示名キャッシュ。
+    users.list の一括取得と users.info の個別取得で更新する。
+    """
+    slack_id = models.CharField(max_length=32, unique=True)
+    # 担当者名として使う名前（日本語名 → 表示名 → ユーザー名 の優先順）
+    name = models.CharField(max_length=200)
+    is_deleted = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.slack_id} ({self.name})"
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import models
+
+
+class UserIdentity(models.Model):
+    """
+    Django ユーザーと工数の担当者の対応。
+    Slack の user_id（送信者）と、メッセージ中の担当者名・旧表示名（別名）を登録する。
+    取込時に ManHourRecord.assignee_user を埋めるのに使う（jobs.identities）。
+    """
+
+    class Kind(models.TextChoices):
+        SLACK_ID = "slack_id", "Slack ID"
+        ALIAS = "alias", "担当者名"
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="identities",
+    )
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    value = models.CharField(max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # 同じ Slack ID・担当者名を複数のユーザーに割り当てない
+            models.UniqueConstraint(fields=["kind", "value"], name="user_identity_kind_value_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} ← {self.get_kind_display()}: {self.value}"
@@ -0,0 +1,136 @@
+"""
+jobs/pagination.py
+キーセット（シーク）ページネーション
+  OFFSET を使わず「前ページ最後の行のソートキーより後」を条件に取得するため、
+  何ページ目でも一覧の件数によらず同じコストで取得できる。
+カーソルはソートキーの値を JSON → base64 にした文字列。
+解釈できないカーソル（形式・件数・各値の型が合わない）は InvalidCursor（ビューで 400 を返す）。
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence
+
+from django.core.exceptions import ValidationError
+from django.db.models import Model, Q, QuerySet
+
+DEFAULT_PAGE_SIZE = 100
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([v.isoformat() if hasattr(v, "isoformat") else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def decode_cursor(cursor: Optional[str], model: type[Model], fields: Sequence[str]) -> Optional[list]:
+    """
+    カーソルを fields の値（モデルの各フィールドの型に変換済み）に戻す。
+    カーソルが無ければ None、解釈できなければ InvalidCursor。
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        raise InvalidCursor("malformed cursor")
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise InvalidCursor("malformed cursor")
+
+    decoded = []
+    for name, value in zip(fields, values):
+        field = model._meta.get_field(name)
+        # encode_cursor が書くのは文字列（日付は ISO 形式）と整数だけ
+        if value is None and field.null:
+            decoded.append(None)
+            continue
+        if isinstance(value, bool) or not isinstance(value, (str, int)):
+            raise InvalidCursor(f"invalid cursor value for {name}")
+        try:
+            decoded.append(field.to_python(value))
+        except ValidationError:
+            raise InvalidCursor(f"invalid cursor value for {name}")
+    return decoded
+
+
+def keyset_q(fields: Sequence[str], values: Sequence[Any], reverse: bool = False) -> Q:
+    """(f1, f2, ...) > (v1, v2, ...) を OR/AND の組み合わせで表した Q（reverse で <）"""
+    op = "lt" if reverse else "gt"
+    q = Q()
+    for i, field in enumerate(fields):
+        cond = Q(**{f"{field}__{op}": values[i]})
+        for prev_field, prev_value in zip(fields[:i], values[:i]):
+            cond &= Q(**{prev_field: prev_value})
+        q |= cond
+    return q
+
+
+@dataclass
+class KeysetPage:
+    items: List[Any]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+
+def _key(obj: Any, fields: Sequence[str]) -> list:
+    if isinstance(obj, dict):
+        return [obj[f] for f in fields]
+    return [getattr(obj, f) for f in fields]
+
+
+def paginate(
+    queryset: QuerySet,
+    fields: Sequence[str],
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> KeysetPage:
+    """
+    queryset を fields（昇順・末尾は一意なキー）でキーセットページングする。
+    after: 次ページ用カーソル / before: 前ページ用カーソル
+    1ページにつき SELECT は1回（page_size + 1 件取得して次ページ有無を判定）。
+    カーソルが不正なら InvalidCursor。
+    """
+    after_values = decode_cursor(after, queryset.model, fields)
+    before_values = None if after_values else decode_cursor(before, queryset.model, fields)
+
+    if before_values is not None:
+        # 前ページは逆順で取得して並べ直す
+        qs = queryset.filter(keyset_q(fields, before_values, reverse=True))
+        qs = qs.order_by(*[f"-{f}" for f in fields])
+        rows = list(qs[: page_size + 1])
+        has_more = len(rows) > page_size
+        items = list(reversed(rows[:page_size]))
+        return KeysetPage(
+            items=items,
+            next_cursor=encode_cursor(_key(items[-1], fields)) if items else None,
+            prev_cursor=encode_cursor(_key(items[0], fields)) if has_more and items else None,
+        )
+
+    qs = queryset
+    if after_values is not None:
+        qs = qs.filter(keyset_q(fields, after_values))
+    qs = qs.order_by(*fields)
+    rows = list(qs[: page_size + 1])
+    has_more = len(rows) > page_size
+    items = rows[:page_size]
+    return KeysetPage(
+        items=items,
+        next_cursor=encode_cursor(_key(items[-1], fields)) if has_more and items else None,
+        prev_cursor=encode_cursor(_key(items[0], fields)) if after_values is not None and items else None,
+    )
@@ -0,0 +1,384 @@
+"""
+jobs/pipeline.py
+Slack → ManHourRecord 取り込みパイプライン
+  fetch → スレッド返信 → filter → parse → 担当者解決 → write
+各段はジェネレータで1件ずつ流すため、取得範囲が何年分でもメモリ使用量は一定。
+取得範囲は古い順に時間窓（既定1日）へ分割し、窓ごとに
+  1. その窓のメッセージをストリーミングで取得・解析
+  2. BATCH_SIZE 件ごとにトランザクションでコミット（jobs.importer）
+  3. 窓の処理が終わったら SlackChannelCursor にチェックポイントを保存
+途中で落ちても次回は最後に完了した窓の続きから再開する
+（窓の途中まで書いた分は source_ts の重複チェックでスキップされる）。
+スレッドの返信は親メッセージの窓で取得するが、窓をチェックポイントした後に付いた返信は
+どの窓にも入らないので、返信のあったスレッドを SlackThread に残し、毎回の取り込みで
+前回より後の返信を取り直す（import_recent_threads。返信が THREAD_LOOKBACK 途絶えたら対象外）。
+窓は互いに独立しているので、別々のワーカーで並行に import_window を実行し、
+最後に commit_windows でチェックポイントを進めることもできる（jobs.tasks 参照）。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from jobs.importer import BATCH_SIZE, ImportResult, PendingRecord, import_records
+from jobs.metrics import StageTimings
+from jobs.models import SlackChannelCursor, SlackThread
+from MRCASE import env
+from MRCASE.app import get_time
+from MRCASE.app.filter import iter_filter_by_first_line
+from MRCASE.app.manhour_parser import ParsedMessage, ParseReject, parse_many, ts_to_date
+from MRCASE.app.slack_ReadChannel import PAGE_LIMIT, has_replies, iter_channel_messages, iter_thread_replies
+from MRCASE.models.slack_message import SlackMessage
+
+logger = logging.getLogger(__name__)
+
+# 1回の取得・チェックポイントの単位（秒）
+IMPORT_WINDOW = int(os.environ.get("SLACK_IMPORT_WINDOW_SECONDS", str(24 * 60 * 60)))
+
+# これより新しい窓の終端はまだメッセージが届く可能性があるのでチェックポイントにしない
+CHECKPOINT_MARGIN = 60
+
+# 最後の返信からこの期間（秒）は、スレッドへの新しい返信を毎回取り直す
+THREAD_LOOKBACK = int(os.environ.get("SLACK_THREAD_LOOKBACK_SECONDS", str(7 * 24 * 60 * 60)))
+
+
+# ------------------------------------------------------------------ #
+#  ts / チェックポイント
+# ------------------------------------------------------------------ #
+
+def ts_key(ts: Optional[str]) -> Decimal:
+    """Slack の ts を大小比較用の Decimal に変換する"""
+    try:
+        return Decimal(ts)
+    except (InvalidOperation, TypeError):
+        return Decimal(0)
+
+
+def format_ts(value: Decimal) -> str:
+    return f"{value:.6f}"
+
+
+def load_watermark(channel_id: str) -> str:
+    """前回取り込んだ最終 ts を返す（未取込なら get_time.OLDEST）"""
+    cursor = SlackChannelCursor.objects.filter(channel_id=channel_id).first()
+    return cursor.last_ts if cursor else get_time.OLDEST
+
+
+def save_watermark(channel_id: str, ts: str) -> None:
+    """最終 ts を保存する（既存より新しい場合のみ進める）"""
+    cursor, created = SlackChannelCursor.objects.get_or_create(
+        channel_id=channel_id,
+        defaults={"last_ts": ts},
+    )
+    if not created and ts_key(ts) > ts_key(cursor.last_ts):
+        cursor.last_ts = ts
+        cursor.save(update_fields=["last_ts", "updated_at"])
+
+
+def iter_windows(oldest: str, latest: str, size: int = IMPORT_WINDOW) -> Iterator[Tuple[str, str]]:
+    """[oldest, latest] を古い順に size 秒ずつの (start, end) に分割する"""
+    start, end = ts_key(oldest), ts_key(latest)
+    while start < end:
+        stop = min(start + size, end)
+        yield format_ts(start), format_ts(stop)
+        start = stop
+
+
+def plan_windows(
+    channel: str,
+    now: Optional[float] = None,
+    window: int = IMPORT_WINDOW,
+) -> List[Tuple[str, str]]:
+    """チェックポイントから now までの窓の一覧"""
+    now = time.time() if now is None else now
+    return list(iter_windows(load_watermark(channel), format_ts(Decimal(str(now))), window))
+
+
+def checkpoint_for(end: str, newest: Optional[str], now: float) -> Optional[str]:
+    """完了した窓のチェックポイント（過去の窓は終端、直近の窓は実際に見た最新 ts）"""
+    return end if ts_key(end) <= Decimal(str(now)) - CHECKPOINT_MARGIN else newest
+
+
+def commit_windows(channel: str, outcomes: Iterable[dict], now: float) -> Optional[str]:
+    """
+    並行に処理した窓の結果（start / end / ok / newest）からチェックポイントを進める。
+    古い順に連続して成功した窓までを完了扱いにし、保存した ts を返す。
+    """
+    checkpoint = None
+    for o in sorted(outcomes, key=lambda o: ts_key(o["start"])):
+        if not o["ok"]:
+            break
+        checkpoint = checkpoint_for(o["end"], o.get("newest"), now) or checkpoint
+    if checkpoint:
+        save_watermark(channel, checkpoint)
+    return checkpoint
+
+
+# ------------------------------------------------------------------ #
+#  ステージ
+# ------------------------------------------------------------------ #
+
+@dataclass
+class WindowState:
+    """1つの窓を流している間の状態"""
+    newest: Optional[str] = None
+    fetched: int = 0
+
+
+def track(messages: Iterable[SlackMessage], state: WindowState) -> Iterator[SlackMessage]:
+    """取得件数と最新の ts を記録しながらそのまま流す"""
+    for m in messages:
+        state.fetched += 1
+        if state.newest is None or ts_key(m.ts) > ts_key(state.newest):
+            state.newest = m.ts
+        yield m
+
+
+def _newest_replies(
+    replies: Iterable[SlackMessage],
+    newest: Dict[str, str],
+) -> Iterator[SlackMessage]:
+    """流した返信のスレッドごとの最新 ts を newest に記録する"""
+    for r in replies:
+        if r.thread_ts and ts_key(r.ts) > ts_key(newest.get(r.thread_ts)):
+            newest[r.thread_ts] = r.ts
+        yield r
+
+
+def remember_threads(channel: str, newest: Dict[str, str], now: Optional[float] = None) -> None:
+    """返信を取り込んだスレッドと最新の返信の ts を残す（最後の返信が THREAD_LOOKBACK より前なら残さない）"""
+    now = time.time() if now is None else now
+    cutoff = Decimal(str(now)) - THREAD_LOOKBACK
+    threads = [
+        SlackThread(channel_id=channel, thread_ts=thread_ts, last_reply_ts=ts)
+        for thread_ts, ts in newest.items()
+        if ts_key(ts) >= cutoff
+    ]
+    if threads:
+        SlackThread.objects.bulk_create(
+            threads,
+            update_conflicts=True,
+            unique_fields=["channel_id", "thread_ts"],
+            update_fields=["last_reply_ts", "updated_at"],
+        )
+
+
+def with_thread_replies(
+    messages: Iterable[SlackMessage],
+    channel: str,
+    chunk_size: int = PAGE_LIMIT,
+) -> Iterator[SlackMessage]:
+    """
+    chunk_size 件ごとに、その中のスレッドの返信を並行取得して後ろに流す。
+    返信のあったスレッドは SlackThread に残し、後から付く返信を import_recent_threads で拾う。
+    """
+    it = iter(messages)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return
+        yield from chunk
+        newest: Dict[str, str] = {}
+        yield from _newest_replies(
+            iter_thread_replies([m.ts for m in chunk if has_replies(m)], channel=channel), newest,
+        )
+        remember_threads(channel, newest)
+
+
+def recent_thread_replies(
+    channel: str,
+    newest: Dict[str, str],
+    now: Optional[float] = None,
+) -> Iterator[SlackMessage]:
+    """
+    SlackThread のスレッドについて、前回取り込んだ返信より後の返信を並行取得して流す
+    （スレッドごとの最新の ts を newest に記録する）。
+    最後の返信が THREAD_LOOKBACK より前のスレッドは削除して対象外にする。
+    """
+    now = time.time() if now is None else now
+    cutoff = format_ts(Decimal(str(now)) - THREAD_LOOKBACK)
+    threads = SlackThread.objects.filter(channel_id=channel)
+    # ts は桁数が揃っているので文字列のまま比較できる
+    threads.filter(last_reply_ts__lt=cutoff).delete()
+    oldest = dict(threads.values_list("thread_ts", "last_reply_ts"))
+    if not oldest:
+        return
+
+    yield from _newest_replies(iter_thread_replies(list(oldest), channel=channel, oldest=oldest), newest)
+
+
+def parse_stage(
+    messages: Iterable[SlackMessage],
+    rejects: List[ParseReject],
+    date_of: Callable[[SlackMessage], date] = lambda m: ts_to_date(m.ts),
+) -> Iterator[ParsedMessage]:
+    """工数登録メッセージを解析する（解析できなかった行は rejects に追加）"""
+    for batch in parse_many(messages, date_of=date_of):
+        rejects.extend(batch.rejects)
+        yield from batch.messages
+
+
+def resolve_stage(
+    parsed: Iterable[ParsedMessage],
+    resolve_user: Callable[[Optional[str]], str],
+) -> Iterator[PendingRecord]:
+    """担当者を確定して PendingRecord にする"""
+    for p in parsed:
+        msg, entries = p.message, p.entries
+
+        # 送信者名を取得（担当者省略時だけ使うので必要な場合のみ解決）
+        sender_name = None
+        if any(not e.assignee for e in entries):
+            sender_name = resolve_user(msg.user)
+
+        for i, entry in enumerate(entries):
+            yield PendingRecord(
+                source_ts=f"{msg.ts}_{i}",
+                case_key=entry.case_key,
+                # 担当者: メッセージに指定があればそちら優先、なければ送信者名
+                assignee=entry.assignee or sender_name,
+                work_date=entry.work_date,
+                hours=entry.hours,
+                slack_user_id=None if entry.assignee else msg.user,
+            )
+
+
+def pending_records(
+    messages: Iterable[SlackMessage],
+    channel: str,
+    resolve_user: Callable[[Optional[str]], str],
+    rejects: List[ParseReject],
+    fetch_replies: bool = True,
+    timings: Optional[StageTimings] = None,
+) -> Iterator[PendingRecord]:
+    """
+    fetch 済みメッセージ → PendingRecord までのステージをつなぐ
+    （fetch_replies=False ならスレッド返信は取得しない。Events API のように返信も個別に届く場合）
+    timings を渡すと fetch / filter / parse / resolve の段ごとの時間と件数を記録する。
+    """
+    timings = timings if timings is not None else StageTimings()
+    if fetch_replies:
+        messages = with_thread_replies(messages, channel)
+    messages = timings.wrap("fetch", messages)
+    messages = timings.wrap("filter", iter_filter_by_first_line(messages, env.ADD_MAN_HOUR))
+    parsed = timings.wrap("parse", parse_stage(messages, rejects))
+    return timings.wrap("resolve", resolve_stage(parsed, resolve_user))
+
+
+# ------------------------------------------------------------------ #
+#  実行
+# ------------------------------------------------------------------ #
+
+def import_window(
+    channel: str,
+    oldest: str,
+    latest: str,
+    resolve_user: Callable[[Optional[str]], str],
+    result: ImportResult,
+    batch_size: int = BATCH_SIZE,
+) -> WindowState:
+    """
+    [oldest, latest] の1窓を取り込む。result にバッチ統計と rejects を追加し、
+    段ごとの時間を result.stages に加算する（write は DB 書き込み分）。
+    """
+    state = WindowState()
+    rejects: List[ParseReject] = []
+
+    messages = track(
+        iter_channel_messages(oldest=oldest, latest=latest, channel=channel, inclusive=True),
+        state,
+    )
+    started = time.perf_counter()
+    inserted = result.imported
+    import_records(
+        pending_records(messages, channel, resolve_user, rejects, timings=result.stages),
+        batch_size=batch_size,
+        result=result,
+    )
+    result.stages.add("write", time.perf_counter() - started, items=result.imported - inserted)
+
+    _record_rejects(rejects, result)
+    return state
+
+
+def import_recent_threads(
+    channel: str,
+    resolve_user: Callable[[Optional[str]], str],
+    result: ImportResult,
+    now: Optional[float] = None,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    チェックポイント済みの窓のスレッドに後から付いた返信を取り込む（取り込んだ件数を返す）。
+    窓の取り込みとは独立しているので、チェックポイントは動かさない。
+    スレッドごとの取り込み済みの位置は書き込みが終わってから進める。
+    """
+    newest: Dict[str, str] = {}
+    rejects: List[ParseReject] = []
+    started = time.perf_counter()
+    inserted = result.imported
+    import_records(
+        pending_records(
+            recent_thread_replies(channel, newest, now), channel, resolve_user, rejects,
+            fetch_replies=False, timings=result.stages,
+        ),
+        batch_size=batch_size,
+        result=result,
+    )
+    result.stages.add("write", time.perf_counter() - started, items=result.imported - inserted)
+    remember_threads(channel, newest, now)
+    _record_rejects(rejects, result)
+    return result.imported - inserted
+
+
+def _record_rejects(rejects: List[ParseReject], result: ImportResult) -> None:
+    for r in rejects:
+        logger.warning("parse rejected (ts=%s line=%d %s): %s", r.ts, r.line_no, r.reason, r.line)
+    result.rejects.extend(r.as_dict() for r in rejects)
+
+
+def import_channel(
+    channel: str,
+    resolve_user: Callable[[Optional[str]], str],
+    window: int = IMPORT_WINDOW,
+    now: Optional[float] = None,
+) -> ImportResult:
+    """
+    チェックポイント（SlackChannelCursor）から現在までを窓ごとに取り込む。
+    窓が完了するたびにチェックポイントを進める。
+    先に、チェックポイント済みのスレッドに後から付いた返信を取り込む。
+    """
+    now = time.time() if now is None else now
+    result = ImportResult()
+
+    try:
+        import_recent_threads(channel, resolve_user, result, now)
+    except Exception as exc:
+        # 取れなかった返信は last_reply_ts が進まないので次回取り直す
+        logger.error("Slack import of recent thread replies failed: %s", exc)
+
+    for start, end in iter_windows(load_watermark(channel), format_ts(Decimal(str(now))), window):
+        try:
+            state = import_window(channel, start, end, resolve_user, result)
+        except Exception as exc:
+            # 失敗した窓のチェックポイントは進めない（次回この窓から再開）
+            logger.error("Slack import failed in window %s-%s: %s", start, end, exc)
+            break
+
+        # 過去の窓は終端まで完了扱い、直近の窓は実際に見た最新 ts まで
+        checkpoint = checkpoint_for(end, state.newest, now)
+        if checkpoint:
+            save_watermark(channel, checkpoint)
+        logger.info(
+            "import window %s-%s: fetched=%d imported=%d",
+            start, end, state.fetched, result.imported,
+        )
+
+    return result
@@ -0,0 +1,186 @@
+"""
+jobs/profiling.py
+リクエストごとの SQL・描画時間・メモリの計測（settings.PROFILE_REQUESTS=True の時だけ有効）
+  - ProfilingMiddleware: ビューごとにクエリ数・SQL 時間・テンプレート描画時間・確保メモリのピークを
+    JSON で jobs.profiling のロガーに出し、Server-Timing ヘッダーも付ける。
+    PROFILE_SLOW_MS 以上かかったリクエストは繰り返し実行された SQL の形と合わせて WARNING で出す
+  - query_budget: テストでビューのクエリ数の上限を検証する（超えたら繰り返しの多い SQL を表示）
+SQL の形は execute_wrapper に渡るプレースホルダ付きの SQL（IN (%s, %s, ...) は1つにまとめる）。
+StreamingHttpResponse / FileResponse は本文を返す前までの計測になる。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import re
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+# 遅いリクエストのログに出す SQL の形の数
+TOP_SHAPES = 5
+
+_PLACEHOLDERS_RE = re.compile(r"\(\s*%s(?:\s*,\s*%s)+\s*\)")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def sql_shape(sql: str) -> str:
+    """プレースホルダ付き SQL を集計用に正規化する"""
+    return _SPACES_RE.sub(" ", _PLACEHOLDERS_RE.sub("(%s, ...)", sql)).strip()
+
+
+# ------------------------------------------------------------------ #
+#  計測
+# ------------------------------------------------------------------ #
+
+class QueryProfile:
+    """connection.execute_wrapper に渡して SQL の件数と時間を形ごとに集計する"""
+
+    def __init__(self):
+        self.count = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.rendering = False
+        self.shapes: Dict[str, int] = defaultdict(int)
+        self.shape_seconds: Dict[str, float] = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            shape = sql_shape(sql)
+            self.count += 1
+            self.sql_seconds += elapsed
+            self.shapes[shape] += 1
+            self.shape_seconds[shape] += elapsed
+
+    def repeated(self, limit: int = TOP_SHAPES) -> List[dict]:
+        """2回以上実行された SQL の形（回数の多い順）"""
+        shapes = sorted(
+            ((n, s) for s, n in self.shapes.items() if n > 1),
+            key=lambda x: (-x[0], -self.shape_seconds[x[1]]),
+        )
+        return [
+            {"count": n, "ms": round(self.shape_seconds[s] * 1000, 2), "sql": s}
+            for n, s in shapes[:limit]
+        ]
+
+
+_current: ContextVar[Optional[QueryProfile]] = ContextVar("profiling_current", default=None)
+_original_render = None
+
+
+def _instrument_templates() -> None:
+    """
+    Template.render を包んで描画時間を計測中の QueryProfile に加算する（1回だけ）。
+    include などで入れ子になった描画は一番外側だけを数える。
+    """
+    global _original_render
+    if _original_render is not None:
+        return
+    _original_render = original = Template.render
+
+    def render(self, context):
+        profile = _current.get()
+        if profile is None or profile.rendering:
+            return original(self, context)
+        profile.rendering = True
+        started = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            profile.rendering = False
+            profile.render_seconds += time.perf_counter() - started
+
+    Template.render = render
+
+
+# ------------------------------------------------------------------ #
+#  ミドルウェア
+# ------------------------------------------------------------------ #
+
+class ProfilingMiddleware:
+    """
+    settings.PROFILE_REQUESTS=True の時だけ読み込まれる（False なら MiddlewareNotUsed）。
+    tracemalloc を有効にするため処理は遅くなる。ピークはプロセス全体の値なので、
+    並行にリクエストを処理している場合は他のリクエストの分も含む。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILE_REQUESTS", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, "PROFILE_SLOW_MS", 500)
+        _instrument_templates()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __call__(self, request):
+        profile = QueryProfile()
+        token = _current.set(profile)
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+        peak = max(tracemalloc.get_traced_memory()[1] - base, 0)
+
+        match = request.resolver_match
+        fields = {
+            "event": "request_profile",
+            "view": match.view_name if match else None,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": profile.count,
+            "sql_ms": round(profile.sql_seconds * 1000, 2),
+            "render_ms": round(profile.render_seconds * 1000, 2),
+            "total_ms": round(total * 1000, 2),
+            "peak_kb": round(peak / 1024, 1),
+        }
+        if fields["total_ms"] >= self.slow_ms:
+            logger.warning(json.dumps({**fields, "repeated": profile.repeated()}, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(fields, ensure_ascii=False))
+
+        response["Server-Timing"] = ", ".join([
+            f'sql;dur={fields["sql_ms"]};desc="{profile.count} queries"',
+            f'render;dur={fields["render_ms"]}',
+            f'total;dur={fields["total_ms"]}',
+        ])
+        return response
+
+
+# ------------------------------------------------------------------ #
+#  テスト用
+# ------------------------------------------------------------------ #
+
+@contextmanager
+def query_budget(budget: int, label: str = "") -> Iterator[QueryProfile]:
+    """
+    with query_budget(5, "manhour_list"): ...
+    ブロック内のクエリ数が budget を超えたら AssertionError（繰り返しの多い SQL の形を添える）。
+    """
+    profile = QueryProfile()
+    with connection.execute_wrapper(profile):
+        yield profile
+    if profile.count > budget:
+        detail = "\n".join(f'  {r["count"]}x {r["sql"]}' for r in profile.repeated())
+        raise AssertionError(f"{label or 'block'}: {profile.count} queries (budget {budget})\n{detail}")
@@ -0,0 +1,112 @@
+"""
+jobs/record_feed.py
+/api/manhours/ 用の ManHourRecord のストリーミング出力（CSV / NDJSON）
+  - 1リクエスト = 1ページ（キーセットカーソル、jobs.pagination と同じ形式）
+  - ページの終端キーを先に1回の軽いクエリで求めてから、本体は
+    values_list(...).iterator() で1行ずつ書き出す（メモリ使用量は件数によらず一定）
+  - ETag は対象期間の各月のデータバージョン + 条件 から作る
+"""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Iterator, Optional, Sequence
+
+from django.db.models import QuerySet
+
+from jobs.dates import iter_months
+from jobs.export_cache import data_versions
+from jobs.pagination import decode_cursor, encode_cursor, keyset_q
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON = "ndjson"
+CONTENT_TYPES = {
+    FORMAT_CSV: "text/csv; charset=utf-8",
+    FORMAT_NDJSON: "application/x-ndjson; charset=utf-8",
+}
+
+COLUMNS = ("id", "work_date", "case_id", "project_name", "assignee", "assignee_user_id", "hours")
+
+# 1ページの件数（既定 / 上限）
+DEFAULT_LIMIT = 10000
+MAX_LIMIT = 100000
+
+# DB から一度に読む件数
+CHUNK_SIZE = 2000
+
+
+@dataclass
+class FeedPage:
+    rows: QuerySet  # このページの values_list（未評価）
+    next_cursor: Optional[str]
+
+
+def page_of(
+    records: QuerySet,
+    order: Sequence[str],
+    after: Optional[str],
+    limit: int,
+) -> FeedPage:
+    """
+    records を order で並べた after 以降の limit 件を返す。
+    終端キー（limit 件目）と次ページの有無は order の列だけを読む1クエリで求める。
+    after が不正なら InvalidCursor。
+    """
+    after_values = decode_cursor(after, records.model, order)
+    qs = records.order_by(*order)
+    if after_values is not None:
+        qs = qs.filter(keyset_q(order, after_values))
+
+    bounds = list(qs.values_list(*order)[limit - 1: limit + 1])
+    next_cursor = None
+    if bounds:
+        last = list(bounds[0])
+        # limit 件目までに絞る（以降に追加された行は次ページへ）
+        qs = qs.exclude(keyset_q(order, last))
+        if len(bounds) > 1:
+            next_cursor = encode_cursor(last)
+
+    return FeedPage(rows=qs.values_list(*COLUMNS), next_cursor=next_cursor)
+
+
+def _value(v):
+    if isinstance(v, date):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    return v
+
+
+class _Echo:
+    """csv.writer の書き込み先（書いた行をそのまま返す）"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows: QuerySet) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield writer.writerow([_value(v) for v in row])
+
+
+def iter_ndjson(rows: QuerySet) -> Iterator[str]:
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield json.dumps(dict(zip(COLUMNS, map(_value, row))), ensure_ascii=False) + "\n"
+
+
+def stream(rows: QuerySet, fmt: str) -> Iterator[str]:
+    return iter_csv(rows) if fmt == FORMAT_CSV else iter_ndjson(rows)
+
+
+def etag(since: date, until: date, scope: str, params: str) -> str:
+    """対象期間の月ごとのデータバージョンと条件から ETag を作る"""
+    versions = data_versions((m.year, m.month) for m in iter_months(since, until))
+    raw = "|".join([since.isoformat(), until.isoformat(), scope, params, *versions])
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
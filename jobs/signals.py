@@ -0,0 +1,86 @@
+"""
+jobs/signals.py
+ManHourRecord の変更（管理画面など）を検知して
+  - 担当者の Django ユーザー（assignee_user）が未設定なら担当者名から補う
+  - 月次集計（ManHourMonthlySummary）を同じトランザクションで更新
+  - 月次データのバージョンをコミット後に更新（Excel キャッシュの無効化）
+bulk_create は signal を送らないため jobs.importer 側で個別に処理している。
+Case の変更では案件キャッシュ（jobs.case_directory）のバージョンを更新する。
+ユーザーの追加・改名では氏名・ユーザー名を担当者名として登録し、未設定のレコードを紐づける。
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from jobs import case_directory
+from jobs.export_cache import bump_versions
+from jobs.identities import alias_names, link_unassigned, seed_aliases, user_id_for_name
+from jobs.models import Case, ManHourRecord
+from jobs.summary import SummaryRow, apply_records, row_of
+
+
+def _month(d):
+    return (d.year, d.month)
+
+
+@receiver(pre_save, sender=ManHourRecord)
+def remember_previous_row(sender, instance, **kwargs):
+    """変更前の値を覚えておく（集計の差し引きと、別の月に移る場合のキャッシュ無効化に使う）"""
+    instance._previous_row = None
+    if instance.pk:
+        old = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("work_date", "case_id", "assignee", "hours")
+            .first()
+        )
+        if old is not None:
+            instance._previous_row = SummaryRow(*old)
+
+
+@receiver(pre_save, sender=ManHourRecord)
+def fill_assignee_user(sender, instance, **kwargs):
+    if instance.assignee_user_id is None and instance.assignee:
+        instance.assignee_user_id = user_id_for_name(instance.assignee)
+
+
+@receiver(post_save, sender=ManHourRecord)
+def update_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_row", None)
+    apply_records(added=[row_of(instance)], removed=[previous] if previous else [])
+
+    months = {_month(instance.work_date)}
+    if previous:
+        months.add(_month(previous.work_date))
+    transaction.on_commit(lambda: bump_versions(months))
+
+
+@receiver(post_delete, sender=ManHourRecord)
+def update_on_delete(sender, instance, **kwargs):
+    apply_records(removed=[row_of(instance)])
+
+    months = {_month(instance.work_date)}
+    transaction.on_commit(lambda: bump_versions(months))
+
+
+@receiver(post_save, sender=Case)
+@receiver(post_delete, sender=Case)
+def invalidate_case_directory(sender, instance, **kwargs):
+    # 変更したプロセスではすぐに、他のプロセスではコミット後の内容で読み直させる
+    case_directory.bump_version()
+    transaction.on_commit(case_directory.bump_version)
+
+
+# 担当者名に使うユーザーの項目（ログイン時の last_login の更新などでは何もしない）
+_NAME_FIELDS = {"first_name", "last_name", "username"}
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def link_user_records(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not _NAME_FIELDS & set(update_fields):
+        return
+    seed_aliases([instance])
+    months = link_unassigned(alias_names(instance))
+    if months:
+        transaction.on_commit(lambda: bump_versions(months))
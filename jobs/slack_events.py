@@ -0,0 +1,136 @@
+"""
+jobs/slack_events.py
+Slack Events API（/slack/events/）で受け取った message イベントの処理
+  - 署名検証（X-Slack-Signature / X-Slack-Request-Timestamp）
+  - 新規メッセージ: jobs.pipeline のステージ → jobs.importer でそのまま取り込む
+  - message_changed: そのメッセージ由来のレコードを消して取り込み直す
+  - message_deleted: そのメッセージ由来のレコードを消す
+ビューは検証して Celery に渡すだけで即座に 200 を返し（Slack の3秒制限）、
+取り込みは jobs.tasks.process_slack_event で行う。毎晩の取り込みは取りこぼしの補完になる。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+from django.db import transaction
+
+from jobs.importer import ImportResult, import_records
+from jobs.models import ManHourRecord
+from jobs.pipeline import pending_records
+from MRCASE.app.slack_ReadChannel import _to_slack_message
+
+logger = logging.getLogger(__name__)
+
+SLACK_SIGNING_SECRET = os.environ.get("SLACK_SIGNING_SECRET", "")
+SLACK_CHANNEL_ID = os.environ.get("SLACK_CHANNEL_ID", "")
+
+# リプレイ攻撃対策: これより古いリクエストは受け付けない（秒）
+SIGNATURE_MAX_AGE = 5 * 60
+
+SUBTYPE_CHANGED = "message_changed"
+SUBTYPE_DELETED = "message_deleted"
+# 本文を持つ通常のメッセージとして扱う subtype
+MESSAGE_SUBTYPES = {None, "thread_broadcast", "file_share", "bot_message"}
+
+
+def verify_signature(
+    body: bytes,
+    timestamp: Optional[str],
+    signature: Optional[str],
+    secret: Optional[str] = None,
+    now: Optional[float] = None,
+) -> bool:
+    """Slack の署名（v0=HMAC-SHA256("v0:{timestamp}:{body}")）を検証する"""
+    secret = SLACK_SIGNING_SECRET if secret is None else secret
+    if not secret or not timestamp or not signature:
+        return False
+    try:
+        age = abs((time.time() if now is None else now) - int(timestamp))
+    except ValueError:
+        return False
+    if age > SIGNATURE_MAX_AGE:
+        return False
+
+    base = b"v0:" + timestamp.encode("ascii") + b":" + body
+    expected = "v0=" + hmac.new(secret.encode("utf-8"), base, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def _source_prefix(ts: str) -> str:
+    # PendingRecord.source_ts は "{ts}_{行番号}"
+    return f"{ts}_"
+
+
+def delete_message(ts: str) -> int:
+    """
+    ts のメッセージから作られたレコードを削除する（集計・キャッシュは signals で更新）。
+    前方一致は varchar_pattern_ops のインデックス（manhour_source_ts_like_idx）で引く。
+    """
+    deleted, _ = ManHourRecord.objects.filter(source_ts__startswith=_source_prefix(ts)).delete()
+    return deleted
+
+
+def import_message(
+    message: Dict[str, Any],
+    channel: str,
+    resolve_user: Callable[[Optional[str]], str],
+) -> ImportResult:
+    """1件のメッセージ（Slack API の message オブジェクト）を取り込む"""
+    result = ImportResult()
+    rejects = []
+    import_records(
+        pending_records([_to_slack_message(message)], channel, resolve_user, rejects, fetch_replies=False),
+        result=result,
+    )
+    for r in rejects:
+        logger.warning("parse rejected (ts=%s line=%d %s): %s", r.ts, r.line_no, r.reason, r.line)
+    result.rejects.extend(r.as_dict() for r in rejects)
+    return result
+
+
+def handle_event(event: Dict[str, Any], resolve_user: Callable[[Optional[str]], str]) -> dict:
+    """
+    message イベントを1件処理して結果を返す。
+    Slack の再送で同じイベントが届いても結果が変わらないようにしている
+    （新規は source_ts で重複スキップ、編集は削除 → 取り込み直し）。
+    """
+    if event.get("type") != "message":
+        return {"action": "ignored", "reason": "not_message"}
+
+    channel = event.get("channel", "")
+    if SLACK_CHANNEL_ID and channel != SLACK_CHANNEL_ID:
+        return {"action": "ignored", "reason": "other_channel"}
+
+    subtype = event.get("subtype")
+
+    if subtype == SUBTYPE_DELETED:
+        ts = event.get("deleted_ts") or (event.get("previous_message") or {}).get("ts")
+        if not ts:
+            return {"action": "ignored", "reason": "no_ts"}
+        return {"action": "deleted", "ts": ts, "deleted": delete_message(ts)}
+
+    if subtype == SUBTYPE_CHANGED:
+        message = event.get("message") or {}
+        ts = message.get("ts")
+        if not ts:
+            return {"action": "ignored", "reason": "no_ts"}
+        previous = event.get("previous_message") or {}
+        if previous.get("ts") == ts and previous.get("text") == message.get("text"):
+            # 返信数の更新などで本文が変わっていない
+            return {"action": "ignored", "reason": "unchanged"}
+        with transaction.atomic():
+            deleted = delete_message(ts)
+            result = import_message(message, channel, resolve_user)
+        return {"action": "changed", "ts": ts, "deleted": deleted, "imported": result.imported}
+
+    if subtype not in MESSAGE_SUBTYPES or not event.get("ts"):
+        return {"action": "ignored", "reason": subtype or "no_ts"}
+
+    result = import_message(event, channel, resolve_user)
+    return {"action": "imported", "ts": event["ts"], "imported": result.imported}
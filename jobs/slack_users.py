@@ -0,0 +1,187 @@
+"""
+jobs/slack_users.py
+Slack user_id → 担当者名 の解決キャッシュ
+  1. プロセス内 LRU（TTL 付き）
+  2. DB の SlackUser テーブル
+  3. どちらにも無い ID だけ users.info で個別取得
+users.list の一括取得（warm_up）で SlackUser をまとめて更新できる。
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from django.utils import timezone
+
+from jobs.models import SlackUser
+from MRCASE.app.slack_client import get_client
+
+logger = logging.getLogger(__name__)
+
+# LRU の最大件数と有効期限（秒）
+CACHE_MAXSIZE = 1024
+CACHE_TTL = 60 * 60
+
+# SlackUser がこれより古ければ warm_up で users.list を取り直す
+DIRECTORY_MAX_AGE = timedelta(days=1)
+
+# users.list の1ページあたり件数
+USERS_LIST_LIMIT = 200
+
+UNKNOWN_USER = "不明"
+
+
+def display_name(user: Dict[str, Any]) -> str:
+    """users.info / users.list の user オブジェクトから担当者名を決める"""
+    profile = user.get("profile") or {}
+    # 日本語名 → 表示名 → ユーザー名 の優先順で取得
+    return (
+        profile.get("real_name_normalized")
+        or profile.get("display_name")
+        or user.get("name")
+        or user.get("id")
+        or UNKNOWN_USER
+    )
+
+
+class _TTLCache:
+    """スレッドセーフな LRU + TTL キャッシュ"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SlackUserDirectory:
+    """Slack ユーザー名の解決キャッシュ"""
+
+    def __init__(
+        self,
+        token: str = "",
+        maxsize: int = CACHE_MAXSIZE,
+        ttl: float = CACHE_TTL,
+    ):
+        self.token = token
+        self._cache = _TTLCache(maxsize, ttl)
+
+    def _client(self):
+        return get_client(self.token)
+
+    # ---- 解決 ----
+
+    def resolve(self, user_id: Optional[str]) -> str:
+        """user_id から担当者名を返す（取得できなければ user_id）"""
+        if not user_id:
+            return UNKNOWN_USER
+
+        name = self._cache.get(user_id)
+        if name is not None:
+            return name
+
+        row = SlackUser.objects.filter(slack_id=user_id).values_list("name", flat=True).first()
+        if row is not None:
+            self._cache.set(user_id, row)
+            return row
+
+        return self._fetch_one(user_id)
+
+    def _fetch_one(self, user_id: str) -> str:
+        """DB に無い ID だけ users.info で取得して保存する"""
+        if not self.token:
+            return user_id
+        try:
+            res = self._client().users_info(user=user_id)
+        except Exception as exc:
+            logger.warning("Failed to get Slack username for %s: %s", user_id, exc)
+            return user_id
+
+        user = res["user"]
+        name = display_name(user)
+        SlackUser.objects.update_or_create(
+            slack_id=user_id,
+            defaults={"name": name, "is_deleted": bool(user.get("deleted"))},
+        )
+        self._cache.set(user_id, name)
+        return name
+
+    # ---- 一括取得 ----
+
+    def is_stale(self, max_age: timedelta = DIRECTORY_MAX_AGE) -> bool:
+        latest = SlackUser.objects.order_by("-updated_at").values_list("updated_at", flat=True).first()
+        return latest is None or latest < timezone.now() - max_age
+
+    def warm_up(self, max_age: Optional[timedelta] = DIRECTORY_MAX_AGE) -> int:
+        """
+        users.list をページングして SlackUser をまとめて更新する。
+        max_age 以内に更新済みなら何もしない（None で強制実行）。
+        戻り値は更新したユーザー数。
+        """
+        if not self.token:
+            return 0
+        if max_age is not None and not self.is_stale(max_age):
+            return 0
+
+        client = self._client()
+        users = []
+        cursor = None
+        while True:
+            params: Dict[str, Any] = {"limit": USERS_LIST_LIMIT}
+            if cursor:
+                params["cursor"] = cursor
+            res = client.users_list(**params)
+            for user in res.get("members", []):
+                users.append(
+                    SlackUser(
+                        slack_id=user["id"],
+                        name=display_name(user),
+                        is_deleted=bool(user.get("deleted")),
+                    )
+                )
+            cursor = (res.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                break
+
+        SlackUser.objects.bulk_create(
+            users,
+            update_conflicts=True,
+            unique_fields=["slack_id"],
+            update_fields=["name", "is_deleted", "updated_at"],
+        )
+        for u in users:
+            self._cache.set(u.slack_id, u.name)
+
+        logger.info("SlackUserDirectory: warmed up %d users", len(users))
+        return len(users)
+
+    def clear(self) -> None:
+        self._cache.clear()
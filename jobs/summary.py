@@ -0,0 +1,238 @@
+"""
+jobs/summary.py
+ManHourMonthlySummary（月 × 案件 × 担当者 の工数集計）の更新・再構築・整合性チェック
+  - apply_records: ManHourRecord の追加/削除分を差分として加算する
+    （呼び出し元のトランザクション内で実行すること）。加算は
+    INSERT ... ON CONFLICT DO UPDATE 1文なので、クエリ数はグループ数によらない
+  - rebuild: ManHourRecord から GROUP BY で作り直す
+  - check_consistency: 集計表と ManHourRecord の GROUP BY 結果を突き合わせる
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from jobs.dates import month_start
+from jobs.models import ManHourMonthlySummary, ManHourRecord
+
+GroupKey = Tuple[date, Optional[int], str]  # (month, case_id, assignee)
+
+
+@dataclass(frozen=True)
+class SummaryRow:
+    """集計に反映する1レコード分の値"""
+    work_date: date
+    case_id: Optional[int]
+    assignee: str
+    hours: Decimal
+
+
+def row_of(record: ManHourRecord) -> SummaryRow:
+    return SummaryRow(record.work_date, record.case_id, record.assignee, Decimal(str(record.hours)))
+
+
+# ------------------------------------------------------------------ #
+#  差分更新
+# ------------------------------------------------------------------ #
+
+def _deltas(rows: Iterable[SummaryRow], sign: int) -> Dict[GroupKey, List]:
+    deltas: Dict[GroupKey, List] = defaultdict(lambda: [Decimal(0), 0])
+    for r in rows:
+        d = deltas[(month_start(r.work_date), r.case_id, r.assignee)]
+        d[0] += sign * r.hours
+        d[1] += sign
+    return deltas
+
+
+def _upsert(rows: List[Tuple[date, Optional[int], str, Decimal, int]]) -> None:
+    """
+    (month, case_id, assignee, hours, count) をまとめて加算する。
+    無いグループは INSERT、有るグループは既存値に足す（並行に同じグループが作られても安全）。
+    """
+    if not rows:
+        return
+    meta = ManHourMonthlySummary._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    fields = [meta.get_field(name) for name in ("month", "case", "assignee", "hours", "record_count")]
+    month, case, assignee, hours, count = (qn(f.column) for f in fields)
+    batch_size = max(connection.ops.bulk_batch_size(fields, rows), 1)
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            params = [
+                f.get_db_prep_save(value, connection)
+                for row in chunk
+                for f, value in zip(fields, row)
+            ]
+            cursor.execute(
+                f"INSERT INTO {table} ({month}, {case}, {assignee}, {hours}, {count}) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT ({month}, {case}, {assignee}) DO UPDATE SET "
+                f"{hours} = {table}.{hours} + EXCLUDED.{hours}, "
+                f"{count} = {table}.{count} + EXCLUDED.{count}",
+                params,
+            )
+
+
+def _apply(deltas: Dict[GroupKey, List]) -> None:
+    # 一意制約 (month, case, assignee) は case=None も同一視する NULLS NOT DISTINCT なので、
+    # 対応している DB（PostgreSQL 15+）でだけ作られ、ON CONFLICT の対象にできる。
+    # それ以外の DB（テストの SQLite）と、件数が減るグループ（編集・削除。無ければ INSERT しない）は個別に更新する
+    can_upsert = connection.features.supports_nulls_distinct_unique_constraints
+    upserts, singles = [], []
+    for (month, case_id, assignee), (hours, count) in deltas.items():
+        if not hours and not count:
+            continue
+        if count < 0 or not can_upsert:
+            singles.append((month, case_id, assignee, hours, count))
+        else:
+            upserts.append((month, case_id, assignee, hours, count))
+    _upsert(upserts)
+
+    for month, case_id, assignee, hours, count in singles:
+        group = ManHourMonthlySummary.objects.filter(month=month, case_id=case_id, assignee=assignee)
+        updated = group.update(
+            hours=F("hours") + hours,
+            record_count=F("record_count") + count,
+        )
+        if updated or count < 0:
+            # 減算対象のグループが無いのは不整合（check_consistency / rebuild で修復）
+            continue
+        try:
+            with transaction.atomic():
+                ManHourMonthlySummary.objects.create(
+                    month=month, case_id=case_id, assignee=assignee,
+                    hours=hours, record_count=count,
+                )
+        except IntegrityError:
+            # 並行して同じグループが作られた場合は加算に切り替える
+            group.update(
+                hours=F("hours") + hours,
+                record_count=F("record_count") + count,
+            )
+
+
+def apply_records(
+    added: Iterable[SummaryRow] = (),
+    removed: Iterable[SummaryRow] = (),
+) -> None:
+    """added を加算、removed を減算する。件数が0になったグループは削除する。"""
+    deltas = _deltas(added, +1)
+    for key, (hours, count) in _deltas(removed, -1).items():
+        deltas[key][0] += hours
+        deltas[key][1] += count
+
+    _apply(deltas)
+    emptied = {month for (month, _, _), (_, count) in deltas.items() if count < 0}
+    if emptied:
+        ManHourMonthlySummary.objects.filter(month__in=emptied, record_count__lte=0).delete()
+
+
+# ------------------------------------------------------------------ #
+#  再構築・整合性チェック
+# ------------------------------------------------------------------ #
+
+def _grouped_records(month: Optional[date] = None):
+    records = ManHourRecord.objects.all()
+    if month is not None:
+        records = records.in_month(month.year, month.month)
+    return (
+        records.annotate(month=TruncMonth("work_date"))
+        .values("month", "case_id", "assignee")
+        .annotate(hours=Sum("hours"), record_count=Count("id"))
+        .order_by()
+    )
+
+
+def rebuild(month: Optional[date] = None) -> int:
+    """集計表を ManHourRecord から作り直す（month 指定時はその月のみ）。作成行数を返す。"""
+    summaries = ManHourMonthlySummary.objects.all()
+    if month is not None:
+        month = month_start(month)
+        summaries = summaries.filter(month=month)
+
+    with transaction.atomic():
+        summaries.delete()
+        objs = [
+            ManHourMonthlySummary(
+                month=g["month"],
+                case_id=g["case_id"],
+                assignee=g["assignee"],
+                hours=g["hours"],
+                record_count=g["record_count"],
+            )
+            for g in _grouped_records(month).iterator()
+        ]
+        ManHourMonthlySummary.objects.bulk_create(objs, batch_size=1000)
+    return len(objs)
+
+
+@dataclass(frozen=True)
+class Mismatch:
+    month: date
+    case_id: Optional[int]
+    assignee: str
+    expected_hours: Decimal
+    expected_count: int
+    actual_hours: Decimal
+    actual_count: int
+
+
+def check_consistency(month: Optional[date] = None) -> List[Mismatch]:
+    """集計表と ManHourRecord の集計が一致しないグループを返す"""
+    expected = {
+        (g["month"], g["case_id"], g["assignee"]): (g["hours"], g["record_count"])
+        for g in _grouped_records(month and month_start(month)).iterator()
+    }
+
+    summaries = ManHourMonthlySummary.objects.all()
+    if month is not None:
+        summaries = summaries.filter(month=month_start(month))
+    actual = {
+        (s["month"], s["case_id"], s["assignee"]): (s["hours"], s["record_count"])
+        for s in summaries.values("month", "case_id", "assignee", "hours", "record_count").iterator()
+    }
+
+    zero = (Decimal(0), 0)
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys(), key=lambda k: (k[0], k[1] or 0, k[2])):
+        exp = expected.get(key, zero)
+        act = actual.get(key, zero)
+        if Decimal(exp[0]) != Decimal(act[0]) or exp[1] != act[1]:
+            mismatches.append(Mismatch(*key, Decimal(exp[0]), exp[1], Decimal(act[0]), act[1]))
+    return mismatches
+
+
+# ------------------------------------------------------------------ #
+#  参照
+# ------------------------------------------------------------------ #
+
+def month_totals(
+    month: date,
+    case_id: Optional[int] = None,
+    assignee: Optional[str] = None,
+) -> Dict[str, Decimal | int]:
+    """指定月の合計工数と件数（集計表から O(グループ数) で求める）"""
+    q = Q(month=month_start(month))
+    if case_id is not None:
+        q &= Q(case_id=case_id)
+    if assignee is not None:
+        q &= Q(assignee=assignee)
+    totals = ManHourMonthlySummary.objects.filter(q).aggregate(
+        total_hours=Sum("hours"),
+        record_count=Sum("record_count"),
+    )
+    return {
+        "total_hours": totals["total_hours"] or Decimal(0),
+        "record_count": totals["record_count"] or 0,
+    }
@@ -1,51 +1,240 @@
 """
 jobs/tasks.py
 毎日 0:00 (Asia/Tokyo) に実行されるCeleryタスク
-  1. Slackの当日メッセージを取得して ManHourRecord に登録
+  1. Slackの当日メッセージを取得して ManHourRecord に登録（時間窓ごとに並行）
   2. 当月分の工数を Excel (rawシート) に出力
   3. 出力した Excel を Slack にアップロード
+nightly_import_and_export は分散ロックを取ってから次の canvas を投入する:
+  chord(import_shard × 窓, finish_import) → export_monthly → upload_monthly → ロック解放
+各段は別タスクなので、リトライは段ごと（アップロードの失敗で取り込みはやり直さない）。
 """
 
 from __future__ import annotations
 
-import io
 import logging
 import os
-from datetime import date, datetime, timezone
+import time
+from datetime import date
+from pathlib import Path
+from typing import BinaryIO, Optional
 
-from celery import shared_task
-from openpyxl import Workbook
-from slack_sdk import WebClient
+from celery import chain, chord, group, shared_task
 from slack_sdk.errors import SlackApiError
 
-from jobs.models import Case, ManHourRecord
-from MRCASE.app.filter import filter_by_first_line
-from MRCASE.app.manhour_parser import parse_man_hour_message
-from MRCASE.app.slack_ReadChannel import get_channel_messages
+from jobs import backfill, export_jobs, locks, metrics, slack_events
+from jobs.export_cache import get_or_build
+from jobs.exporter import monthly_filename
+from jobs.importer import ImportResult
+from jobs.pipeline import commit_windows, import_channel, import_recent_threads, import_window, plan_windows
+from jobs.slack_users import SlackUserDirectory
+from MRCASE.app.slack_client import get_client, get_stats
 
 logger = logging.getLogger(__name__)
 
 SLACK_BOT_TOKEN = os.environ.get("SLACK_BOT_TOKEN", "")
 SLACK_CHANNEL_ID = os.environ.get("SLACK_CHANNEL_ID", "")
 
+# 取り込みロックの有効期限（秒）。ワーカーが落ちてもこの時間で解放される
+IMPORT_LOCK_TIMEOUT = int(os.environ.get("IMPORT_LOCK_TIMEOUT", str(2 * 60 * 60)))
+
+# 段ごとのリトライ設定
+IMPORT_MAX_RETRIES = 3
+IMPORT_RETRY_DELAY = 30  # 秒（2倍ずつ延ばす）
+EXPORT_MAX_RETRIES = 2
+UPLOAD_MAX_RETRIES = 5
+
+# メトリクスのラベルに使うタスク名
+NIGHTLY = "nightly_import_and_export"
+MANUAL_IMPORT = "manual_import"
+MANUAL_EXPORT = "manual_export"
+EXPORT_JOB = "export_manhours"
+
+# プロセス内で共有する Slack ユーザー名キャッシュ
+user_directory = SlackUserDirectory(token=SLACK_BOT_TOKEN)
+
 
 # ------------------------------------------------------------------ #
 #  メインタスク
 # ------------------------------------------------------------------ #
 
 @shared_task(name="jobs.tasks.nightly_import_and_export")
-def nightly_import_and_export():
-    """毎日0時に実行: Slack取得 → DB登録 → Excel出力 → Slack送信"""
-    logger.info("nightly_import_and_export: start")
+def nightly_import_and_export() -> Optional[str]:
+    """
+    毎日0時に実行: Slack取得 → DB登録 → Excel出力 → Slack送信
+    ロックを取れなければ（前回の実行や manual_import が動作中）何もしない。
+    投入したワークフローの id を返す。
+    """
+    token = locks.acquire(locks.IMPORT_LOCK, IMPORT_LOCK_TIMEOUT)
+    if token is None:
+        logger.warning("nightly_import_and_export: another import is running; skipped")
+        return None
+
+    try:
+        _warm_up_users(NIGHTLY)
+        now = time.time()
+        windows = plan_windows(SLACK_CHANNEL_ID, now)
+        logger.info("nightly_import_and_export: start (%d windows)", len(windows))
+
+        release = release_import_lock.si(token)
+        stages = [export_monthly.si(), upload_monthly.s(), release]
+        if windows:
+            shards = group(import_shard.si(SLACK_CHANNEL_ID, start, end) for start, end in windows)
+            stages.insert(0, chord(shards, finish_import.s(SLACK_CHANNEL_ID, now)))
+        # チェックポイント済みのスレッドに後から付いた返信
+        stages.insert(0, import_thread_replies.si(SLACK_CHANNEL_ID, now))
+        workflow = chain(*stages).on_error(release)
+        return workflow.apply_async().id
+    except Exception:
+        locks.release(locks.IMPORT_LOCK, token)
+        raise
+
+
+# ------------------------------------------------------------------ #
+#  nightly の各段
+# ------------------------------------------------------------------ #
 
-    imported = _import_from_slack()
-    logger.info("nightly_import_and_export: imported %d records", imported)
+def _log_stage(
+    stage: str,
+    started: float,
+    items: Optional[int] = None,
+    retries: int = 0,
+    ok: bool = True,
+    **fields,
+) -> float:
+    """段の所要時間をログとメトリクスに記録して返す"""
+    elapsed = round(time.monotonic() - started, 3)
+    detail = " ".join(f"{k}={v}" for k, v in fields.items())
+    logger.info("nightly stage=%s elapsed=%.3fs %s", stage, elapsed, detail)
+    metrics.record_stage(NIGHTLY, stage, elapsed, items=items, retries=retries, ok=ok)
+    return elapsed
+
+
+def _slack_retries() -> int:
+    """このプロセスで Slack API を再試行した回数（前後の差で段ごとの回数を求める）"""
+    return sum(get_stats()["retries"].values())
+
+
+@shared_task(bind=True, name="jobs.tasks.import_shard", max_retries=IMPORT_MAX_RETRIES)
+def import_shard(self, channel: str, start: str, end: str) -> dict:
+    """
+    1つの時間窓を取り込む。リトライし尽くしても例外は投げず ok=False を返す
+    （chord 全体を止めず、finish_import がその窓の手前までチェックポイントを進める）。
+    """
+    started = time.monotonic()
+    retries_before = _slack_retries()
+    result = ImportResult()
+    try:
+        state = import_window(channel, start, end, _get_slack_username, result)
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc, countdown=IMPORT_RETRY_DELAY * 2 ** self.request.retries)
+        logger.error("import shard %s-%s failed: %s", start, end, exc)
+        return {
+            "start": start, "end": end, "ok": False, "newest": None,
+            "fetched": 0, "imported": result.imported,
+            "elapsed": _log_stage(
+                "import_shard", started, retries=self.request.retries, ok=False, window=f"{start}-{end}",
+            ),
+        }
+
+    # fetch / filter / parse / resolve / write の内訳
+    metrics.record_timings(NIGHTLY, result.stages, retries={"fetch": _slack_retries() - retries_before})
+    return {
+        "start": start, "end": end, "ok": True, "newest": state.newest,
+        "fetched": state.fetched, "imported": result.imported,
+        "elapsed": _log_stage(
+            "import_shard", started, items=result.imported, retries=self.request.retries,
+            window=f"{start}-{end}", fetched=state.fetched,
+        ),
+    }
+
+
+@shared_task(bind=True, name="jobs.tasks.import_thread_replies", max_retries=IMPORT_MAX_RETRIES)
+def import_thread_replies(self, channel: str, now: float) -> dict:
+    """
+    チェックポイント済みの窓のスレッドに後から付いた返信を取り込む（jobs.pipeline.import_recent_threads）。
+    リトライし尽くしても例外は投げず ok=False を返す（次回の実行で取り直す）。
+    """
+    started = time.monotonic()
+    result = ImportResult()
+    try:
+        import_recent_threads(channel, _get_slack_username, result, now)
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc, countdown=IMPORT_RETRY_DELAY * 2 ** self.request.retries)
+        logger.error("import of thread replies failed: %s", exc)
+        return {
+            "ok": False, "imported": result.imported,
+            "elapsed": _log_stage("import_threads", started, retries=self.request.retries, ok=False),
+        }
+    return {
+        "ok": True, "imported": result.imported,
+        "elapsed": _log_stage("import_threads", started, items=result.imported, retries=self.request.retries),
+    }
+
+
+@shared_task(name="jobs.tasks.finish_import")
+def finish_import(shards: list, channel: str, now: float) -> dict:
+    """全窓の結果を集計し、連続して成功した窓までチェックポイントを進める"""
+    started = time.monotonic()
+    checkpoint = commit_windows(channel, shards, now)
+    failed = [f"{s['start']}-{s['end']}" for s in shards if not s["ok"]]
+    summary = {
+        "windows": len(shards),
+        "failed": failed,
+        "imported": sum(s["imported"] for s in shards),
+        "checkpoint": checkpoint,
+        "shard_elapsed": round(sum(s["elapsed"] for s in shards), 3),
+    }
+    summary["elapsed"] = _log_stage("finish_import", started, items=summary["imported"], **summary)
+    return summary
+
+
+@shared_task(
+    bind=True,
+    name="jobs.tasks.export_monthly",
+    autoretry_for=(OSError,),
+    retry_backoff=True,
+    max_retries=EXPORT_MAX_RETRIES,
+)
+def export_monthly(self) -> str:
+    """当月の Excel を生成（またはキャッシュから取得）してパスを返す"""
+    started = time.monotonic()
+    today = date.today()
+    path = get_or_build(today.year, today.month)
+    _log_stage("excel", started, retries=self.request.retries, path=path.name, bytes=path.stat().st_size)
+    return str(path)
+
+
+@shared_task(
+    bind=True,
+    name="jobs.tasks.upload_monthly",
+    autoretry_for=(SlackApiError, ConnectionError, TimeoutError),
+    retry_backoff=True,
+    max_retries=UPLOAD_MAX_RETRIES,
+)
+def upload_monthly(self, path: str) -> None:
+    """export_monthly が作った Excel を Slack へ送信する（失敗時はこの段だけリトライ）"""
+    started = time.monotonic()
+    if Path(path).exists():
+        excel_file = open(path, "rb")
+    else:
+        # リトライまでの間にキャッシュから消えていたら作り直す
+        excel_file = _build_monthly_excel()
+    try:
+        with excel_file:
+            _upload_excel_to_slack(excel_file)
+    except Exception:
+        _log_stage("upload", started, retries=self.request.retries, ok=False)
+        raise
+    _log_stage("upload", started, retries=self.request.retries)
+    metrics.record_success(NIGHTLY)
 
-    excel_bytes = _build_monthly_excel()
-    logger.info("nightly_import_and_export: excel built (%d bytes)", len(excel_bytes))
 
-    _upload_excel_to_slack(excel_bytes)
-    logger.info("nightly_import_and_export: done")
+@shared_task(name="jobs.tasks.release_import_lock")
+def release_import_lock(token: str) -> None:
+    """nightly のワークフロー終了時（成功・失敗とも）にロックを解放する"""
+    locks.release(locks.IMPORT_LOCK, token)
 
 
 # ------------------------------------------------------------------ #
@@ -54,145 +243,156 @@ def nightly_import_and_export():
 
 @shared_task(name="jobs.tasks.manual_import")
 def manual_import():
-    """手動で Slack → DB 取り込みだけ実行"""
-    count = _import_from_slack()
-    logger.info("manual_import: imported %d records", count)
-    return count
+    """
+    手動で Slack → DB 取り込みだけ実行（バッチごとの統計を返す）
+    nightly などの取り込みが動作中ならスキップする。
+    """
+    with locks.held(locks.IMPORT_LOCK, IMPORT_LOCK_TIMEOUT) as token:
+        if token is None:
+            logger.warning("manual_import: another import is running; skipped")
+            return {"skipped": "locked"}
+        retries_before = _slack_retries()
+        result = _import_from_slack(MANUAL_IMPORT)
+    metrics.record_timings(MANUAL_IMPORT, result.stages, retries={"fetch": _slack_retries() - retries_before})
+    metrics.record_success(MANUAL_IMPORT)
+    logger.info("manual_import: imported %d records", result.imported)
+    return result.as_dict()
 
 
 @shared_task(name="jobs.tasks.manual_export")
 def manual_export():
     """手動で Excel 生成 → Slack 送信だけ実行"""
-    excel_bytes = _build_monthly_excel()
-    _upload_excel_to_slack(excel_bytes)
-    logger.info("manual_export: done")
-
-
-# ------------------------------------------------------------------ #
-#  内部処理
-# ------------------------------------------------------------------ #
+    with metrics.timed() as excel:
+        excel_file = _build_monthly_excel()
+    metrics.record_stage(MANUAL_EXPORT, "excel", excel.seconds)
 
-def _get_slack_username(user_id: str) -> str:
-    """Slack の user_id から表示名を取得する"""
-    if not user_id or not SLACK_BOT_TOKEN:
-        return user_id or "不明"
+    started = time.perf_counter()
+    retries_before = _slack_retries()
     try:
-        client = WebClient(token=SLACK_BOT_TOKEN)
-        res = client.users_info(user=user_id)
-        profile = res["user"]["profile"]
-        # 日本語名 → 表示名 → ユーザー名 の優先順で取得
-        return (
-            profile.get("real_name_normalized")
-            or profile.get("display_name")
-            or res["user"].get("name")
-            or user_id
-        )
-    except Exception as exc:
-        logger.warning("Failed to get Slack username for %s: %s", user_id, exc)
-        return user_id
+        with excel_file:
+            _upload_excel_to_slack(excel_file)
+    except Exception:
+        metrics.record_stage(MANUAL_EXPORT, "upload", time.perf_counter() - started, ok=False)
+        raise
+    metrics.record_stage(
+        MANUAL_EXPORT, "upload", time.perf_counter() - started, retries=_slack_retries() - retries_before,
+    )
+    metrics.record_success(MANUAL_EXPORT)
+    logger.info("manual_export: done")
 
 
-def _ts_to_date(ts: str) -> date:
-    """Slack の ts（UNIXタイムスタンプ文字列）を date に変換する"""
+@shared_task(name="jobs.tasks.export_manhours")
+def export_manhours(job_id: str) -> Optional[dict]:
+    """画面から依頼された月次 Excel を共有ボリュームに生成する（進捗は jobs.export_jobs）"""
+    started = time.perf_counter()
     try:
-        return datetime.fromtimestamp(float(ts), tz=timezone.utc).date()
-    except (ValueError, TypeError):
-        return date.today()
+        job = export_jobs.run(job_id)
+    except Exception:
+        metrics.record_stage(EXPORT_JOB, "excel", time.perf_counter() - started, ok=False)
+        raise
+    metrics.record_stage(EXPORT_JOB, "excel", time.perf_counter() - started, items=job["rows"] if job else None)
+    return job
 
 
-def _import_from_slack() -> int:
+@shared_task(bind=True, name="jobs.tasks.backfill_window", max_retries=IMPORT_MAX_RETRIES)
+def backfill_window(self, window_id: int) -> dict:
     """
-    Slack チャンネルから工数登録メッセージを取得して ManHourRecord に保存。
-    - 日付省略 → メッセージの送信日を使用
-    - 担当者省略 → Slack の送信者名を使用
+    backfill_manhours で登録した1つの時間窓を取り込む（進捗は BackfillWindow に記録）。
+    リトライし尽くした窓は failed のまま残り、コマンドの再実行で再投入される。
     """
+    started = time.monotonic()
     try:
-        messages = get_channel_messages()
+        window = backfill.run_window(window_id, _get_slack_username)
     except Exception as exc:
-        logger.error("Slack get_channel_messages failed: %s", exc)
-        return 0
-
-    from MRCASE import env
-    filtered = filter_by_first_line(messages, env.ADD_MAN_HOUR)
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc, countdown=IMPORT_RETRY_DELAY * 2 ** self.request.retries)
+        logger.error("backfill window %d failed: %s", window_id, exc)
+        return {"id": window_id, "ok": False}
 
-    imported = 0
-    for msg in filtered:
-        ts = msg.ts
+    return {
+        "id": window.id, "ok": True, "fetched": window.fetched, "imported": window.imported,
+        "elapsed": round(time.monotonic() - started, 3),
+    }
 
-        # メッセージの送信日を取得
-        message_date = _ts_to_date(ts)
 
-        # 送信者名を取得（担当者省略時に使う）
-        sender_name = _get_slack_username(msg.user) if msg.user else "不明"
+@shared_task(bind=True, name="jobs.tasks.process_slack_event", max_retries=IMPORT_MAX_RETRIES)
+def process_slack_event(self, event: dict) -> dict:
+    """/slack/events/ で受け取った message イベントを取り込む"""
+    try:
+        outcome = slack_events.handle_event(event, resolve_user=_get_slack_username)
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc, countdown=IMPORT_RETRY_DELAY * 2 ** self.request.retries)
+        raise
+    logger.info("slack event: %s", outcome)
+    return outcome
 
-        entries = parse_man_hour_message(msg.text, message_date=message_date)
 
-        for i, entry in enumerate(entries):
-            unique_ts = f"{ts}_{i}"
+# ------------------------------------------------------------------ #
+#  内部処理
+# ------------------------------------------------------------------ #
 
-            if ManHourRecord.objects.filter(source_ts=unique_ts).exists():
-                continue
+def _get_slack_username(user_id: str) -> str:
+    """Slack の user_id から表示名を取得する（SlackUserDirectory 経由でキャッシュ）"""
+    if not user_id or not SLACK_BOT_TOKEN:
+        return user_id or "不明"
+    return user_directory.resolve(user_id)
 
-            # 担当者: メッセージに指定があればそちら優先、なければ送信者名
-            assignee = entry.assignee or sender_name
 
-            # ユニークキーでCase検索
-            case = Case.objects.filter(unique_key=entry.case_key, is_active=True).first()
+def _warm_up_users(task: Optional[str] = None) -> None:
+    """担当者名解決用に users.list を一括取得（1日以内に取得済みならスキップ）"""
+    started = time.perf_counter()
+    count, ok = 0, True
+    try:
+        count = user_directory.warm_up()
+    except Exception as exc:
+        ok = False
+        logger.warning("Slack users.list warm-up failed: %s", exc)
+    if task:
+        metrics.record_stage(task, "users", time.perf_counter() - started, items=count, ok=ok)
 
-            ManHourRecord.objects.create(
-                case=case,
-                project_name=case.name if case else entry.case_key,
-                assignee=assignee,
-                work_date=entry.work_date,
-                hours=entry.hours,
-                source_ts=unique_ts,
-            )
-            imported += 1
 
-    return imported
+def _import_from_slack(task: Optional[str] = None) -> ImportResult:
+    """
+    Slack チャンネルから工数登録メッセージを取得して ManHourRecord に保存。
+    - 前回のチェックポイント（SlackChannelCursor）から現在までを時間窓ごとに取り込む
+    - 取得範囲内のスレッド返信（conversations.replies）も対象
+    - チェックポイント済みのスレッドに後から付いた返信も取り直す（SlackThread）
+    - 日付省略 → メッセージの送信日を使用
+    - 担当者省略 → Slack の送信者名を使用
+    - 各段はジェネレータでつなぎ、書き込みは jobs.importer でバッチ単位にコミット
+    """
+    _warm_up_users(task)
+    result = import_channel(SLACK_CHANNEL_ID, resolve_user=_get_slack_username)
+    for n, batch in enumerate(result.batches, start=1):
+        logger.info(
+            "import batch %d: received=%d skipped=%d unmatched=%d inserted=%d",
+            n, batch.received, batch.skipped_existing, batch.unmatched_case, batch.inserted,
+        )
+    return result
 
 
-def _build_monthly_excel() -> bytes:
-    """当月分の ManHourRecord を rawシートに書き出して bytes で返す"""
+def _build_monthly_excel() -> BinaryIO:
+    """当月分の ManHourRecord を rawシートに書き出した Excel を開いて返す（キャッシュ済みならそれを使う）"""
     today = date.today()
-    records = ManHourRecord.objects.filter(
-        work_date__year=today.year,
-        work_date__month=today.month,
-    ).order_by("work_date", "assignee")
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "raw"
-
-    ws.append(["日付", "案件名", "担当者", "時間(h)"])
-    for r in records:
-        ws.append([
-            r.work_date.isoformat(),
-            r.project_name,
-            r.assignee,
-            float(r.hours),
-        ])
-
-    buf = io.BytesIO()
-    wb.save(buf)
-    return buf.getvalue()
-
-
-def _upload_excel_to_slack(excel_bytes: bytes) -> None:
+    return open(get_or_build(today.year, today.month), "rb")
+
+
+def _upload_excel_to_slack(excel_file: BinaryIO) -> None:
     """Excel を Slack チャンネルへ送信"""
     if not SLACK_BOT_TOKEN or not SLACK_CHANNEL_ID:
         logger.error("Slack token or channel ID is not configured.")
         return
 
     today = date.today()
-    filename = f"manhour_{today.year}{today.month:02d}.xlsx"
+    filename = monthly_filename(today.year, today.month)
 
-    client = WebClient(token=SLACK_BOT_TOKEN)
+    client = get_client(SLACK_BOT_TOKEN)
     try:
         client.files_upload_v2(
             channel=SLACK_CHANNEL_ID,
             filename=filename,
-            content=excel_bytes,
+            file=excel_file,
             initial_comment=f"{today.year}年{today.month}月 工数レポートです。",
         )
     except SlackApiError as exc:
@@ -1,3 +1,1304 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qsl
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+
+from jobs import case_directory
+from jobs import export_cache
+from jobs import export_jobs
+from jobs import exporter
+from jobs import locks
+from jobs import metrics
+from jobs import pagination
+from jobs import pipeline
+from jobs import profiling
+from jobs import slack_events
+from jobs import slack_users
+from jobs import summary
+from jobs import tasks
+from jobs.importer import PendingRecord, import_records
+from jobs.models import (
+    BackfillWindow, Case, ManHourMonthlySummary, ManHourRecord, SlackChannelCursor, SlackThread, SlackUser,
+    UserIdentity,
+)
+from jobs.pipeline import commit_windows, import_channel
+from jobs.slack_users import SlackUserDirectory
+from MRCASE.app import excel_write
+from MRCASE.app import main as legacy_main
+from MRCASE.app import slack_client
+from MRCASE.app.manhour_parser import REJECT_INVALID_DATE, REJECT_MISSING_HOURS, parse_date, parse_many
+from MRCASE.app.slack_ReadChannel import iter_thread_replies
+from MRCASE.models.manhour_entry import ManHourEntry
+from MRCASE.models.slack_message import SlackMessage
+
+
+# ------------------------------------------------------------------ #
+# Slack スタブサーバー
+# ------------------------------------------------------------------ #
+
+class _SlackStubHandler(BaseHTTPRequestHandler):
+    """
+    /api/<method> に応答するスタブ。
+    server.responses[method] に (status, headers, body) のリストを積むと順に返す。
+    受け取ったパラメータは server.params に (method, {key: value}) で残す。
+    """
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode()
+        path, _, query = self.path.partition("?")
+        method = path.rsplit("/", 1)[-1]
+        self.server.calls.append(method)
+        params = dict(parse_qsl(query))
+        if body and self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            params.update(parse_qsl(body))
+        self.server.params.append((method, params))
+        queue = self.server.responses.get(method) or [(200, {}, {"ok": True})]
+        status, headers, body = queue.pop(0) if len(queue) > 1 else queue[0]
+
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class SlackStubMixin:
+    def setUp(self):
+        super().setUp()
+        self.server = HTTPServer(("127.0.0.1", 0), _SlackStubHandler)
+        self.server.calls = []
+        self.server.params = []
+        self.server.responses = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/api/"
+        slack_client.reset_clients()
+        slack_client.reset_stats()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        slack_client.reset_clients()
+        super().tearDown()
+
+
+# ------------------------------------------------------------------ #
+# Slack クライアント
+# ------------------------------------------------------------------ #
+
+class SlackClientTests(SlackStubMixin, SimpleTestCase):
+    def test_client_is_shared(self):
+        a = slack_client.get_client("xoxb-test", base_url=self.base_url)
+        b = slack_client.get_client("xoxb-test", base_url=self.base_url)
+        self.assertIs(a, b)
+
+    def test_retries_after_rate_limit(self):
+        self.server.responses["conversations.history"] = [
+            (429, {"Retry-After": "0"}, {"ok": False, "error": "ratelimited"}),
+            (200, {}, {"ok": True, "messages": []}),
+        ]
+        client = slack_client.get_client("xoxb-test", base_url=self.base_url)
+        res = client.conversations_history(channel="C1")
+
+        self.assertTrue(res["ok"])
+        self.assertEqual(self.server.calls, ["conversations.history"] * 2)
+        stats = slack_client.get_stats()
+        self.assertEqual(stats["calls"], {"conversations.history": 1})
+        self.assertEqual(stats["retries"], {"conversations.history": 1})
+
+    def test_token_bucket_waits_when_empty(self):
+        bucket = slack_client.TokenBucket(per_minute=600, burst=1)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertGreater(bucket.acquire(), 0.0)
+
+
+class ThreadReplyTests(SlackStubMixin, SimpleTestCase):
+    def test_replies_are_fetched_for_each_thread(self):
+        self.server.responses["conversations.replies"] = [
+            (200, {}, {"ok": True, "messages": [
+                {"ts": "1.0", "thread_ts": "1.0", "text": "親"},
+                {"ts": "1.1", "thread_ts": "1.0", "text": "工数登録\n返信"},
+            ]}),
+        ]
+        with mock.patch.object(slack_client, "SLACK_API_URL", self.base_url):
+            replies = list(iter_thread_replies(["1.0", "1.0"], channel="C1", max_workers=2))
+
+        # 重複したスレッドは1回だけ取得し、親メッセージは含めない
+        self.assertEqual(self.server.calls, ["conversations.replies"])
+        self.assertEqual([m.ts for m in replies], ["1.1"])
+
+
+def _slack_user(user_id, name, deleted=False):
+    return {"id": user_id, "name": user_id.lower(), "deleted": deleted, "profile": {"real_name_normalized": name}}
+
+
+class SlackUserDirectoryTests(SlackStubMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(slack_client, "SLACK_API_URL", self.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = SlackUserDirectory(token="xoxb-test")
+
+    def test_cache_expires_and_evicts_least_recently_used(self):
+        now = [0.0]
+        with mock.patch.object(slack_users.time, "monotonic", lambda: now[0]):
+            c = slack_users._TTLCache(maxsize=2, ttl=10)
+            c.set("U1", "大場")
+            c.set("U2", "田中")
+            self.assertEqual(c.get("U1"), "大場")
+            c.set("U3", "佐藤")
+            # 最近使っていない U2 が追い出される
+            self.assertEqual((c.get("U1"), c.get("U2"), c.get("U3")), ("大場", None, "佐藤"))
+
+            now[0] = 11
+            self.assertIsNone(c.get("U1"))
+
+    def test_resolves_from_cache_then_db_then_users_info(self):
+        SlackUser.objects.create(slack_id="U1", name="大場")
+        self.server.responses["users.info"] = [(200, {}, {"ok": True, "user": _slack_user("U2", "田中")})]
+
+        self.assertEqual(self.directory.resolve("U1"), "大場")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.directory.resolve("U1"), "大場")
+
+        # DB にも無い ID だけ users.info で取得して保存する
+        self.assertEqual(self.directory.resolve("U2"), "田中")
+        self.assertEqual(self.directory.resolve("U2"), "田中")
+        self.assertEqual(self.server.params, [("users.info", {"user": "U2"})])
+        self.assertEqual(SlackUser.objects.get(slack_id="U2").name, "田中")
+
+    def test_warm_up_follows_cursor_and_refreshes_stale_rows(self):
+        SlackUser.objects.create(slack_id="U1", name="旧名")
+        SlackUser.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        self.server.responses["users.list"] = [
+            (200, {}, {"ok": True, "members": [_slack_user("U1", "大場")],
+                       "response_metadata": {"next_cursor": "page2"}}),
+            (200, {}, {"ok": True, "members": [_slack_user("U2", "田中", deleted=True)],
+                       "response_metadata": {"next_cursor": ""}}),
+        ]
+
+        self.assertTrue(self.directory.is_stale())
+        self.assertEqual(self.directory.warm_up(), 2)
+        self.assertEqual([p.get("cursor") for m, p in self.server.params], [None, "page2"])
+        self.assertEqual(
+            list(SlackUser.objects.order_by("slack_id").values_list("slack_id", "name", "is_deleted")),
+            [("U1", "大場", False), ("U2", "田中", True)],
+        )
+
+        # 更新したばかりなら取り直さない。取得した名前はキャッシュから返す
+        self.assertEqual(self.directory.warm_up(), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.directory.resolve("U1"), "大場")
+        self.assertEqual(self.server.calls, ["users.list"] * 2)
+
+
+# ------------------------------------------------------------------ #
+# Excel 出力
+# ------------------------------------------------------------------ #
+
+def _record(i, work_date=date(2026, 2, 18), assignee="大場", hours=2):
+    return ManHourRecord.objects.create(
+        project_name="案件君",
+        assignee=assignee,
+        work_date=work_date,
+        hours=hours,
+        source_ts=f"{i}.000000_0",
+    )
+
+
+# ------------------------------------------------------------------ #
+# パーサー
+# ------------------------------------------------------------------ #
+
+def _message(text, ts="1771398155.000100", user="U1"):
+    return SlackMessage(text=text, user=user, ts=ts, thread_ts=None, raw={})
+
+
+class ParserTests(SimpleTestCase):
+    def _parse(self, text):
+        batches = list(parse_many([_message(text)], date_of=lambda m: date(2026, 2, 18)))
+        return batches[0].entries, batches[0].rejects
+
+    def test_accepts_full_width_and_several_date_formats(self):
+        entries, rejects = self._parse(
+            "工数登録\n"
+            "案件名=abcd1234, 担当者=大場, 時間=2, 日付=2026/02/18\n"
+            "案件名＝ABCD1234，時間＝１．５，日付＝２０２６年２月１９日\n"
+            "案件名=ABCD1234、時間=3h、日付=2/20\n"
+            "案件名=ABCD1234, 時間=1\n"
+        )
+        self.assertEqual(rejects, [])
+        self.assertEqual(
+            [(e.case_key, e.hours, e.work_date, e.assignee) for e in entries],
+            [
+                ("ABCD1234", 2.0, date(2026, 2, 18), "大場"),
+                ("ABCD1234", 1.5, date(2026, 2, 19), None),
+                ("ABCD1234", 3.0, date(2026, 2, 20), None),
+                ("ABCD1234", 1.0, date(2026, 2, 18), None),
+            ],
+        )
+
+    def test_month_day_after_message_date_is_previous_year(self):
+        batch = next(parse_many(
+            [_message("工数登録\n案件名=ABCD1234, 時間=.5, 日付=12/28\n案件名=ABCD1234, 時間=1, 日付=1/4\n")],
+            date_of=lambda m: date(2027, 1, 4),
+        ))
+        self.assertEqual(batch.rejects, [])
+        self.assertEqual(
+            [(e.hours, e.work_date) for e in batch.entries],
+            [(0.5, date(2026, 12, 28)), (1.0, date(2027, 1, 4))],
+        )
+        self.assertEqual(parse_date("2/29", date(2029, 1, 5)), date(2028, 2, 29))
+        with self.assertRaises(ValueError):
+            parse_date("2/30", date(2026, 3, 1))
+
+    def test_reports_rejected_lines(self):
+        entries, rejects = self._parse(
+            "工数登録\n"
+            "案件名=ABCD1234, 日付=2026/02/18\n"
+            "\n"
+            "案件名=ABCD1234, 時間=2, 日付=2026/13/01\n"
+        )
+        self.assertEqual(entries, [])
+        self.assertEqual(
+            [(r.line_no, r.reason) for r in rejects],
+            [(2, REJECT_MISSING_HOURS), (4, REJECT_INVALID_DATE)],
+        )
+
+    def test_ignores_other_messages(self):
+        self.assertEqual(self._parse("雑談\n案件名=ABCD1234, 時間=2"), ([], []))
+
+
+class MonthRangeTests(SimpleTestCase):
+    def test_in_month_uses_plain_range_on_work_date(self):
+        sql = str(ManHourRecord.objects.in_month(2026, 12).query)
+        self.assertIn('"work_date" >= 2026-12-01', sql)
+        self.assertIn('"work_date" < 2027-01-01', sql)
+
+
+class ExporterTests(TestCase):
+    def setUp(self):
+        # データバージョンを新しくして、他のテストで生成したファイルを使わない
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+        super().tearDown()
+
+    def test_monthly_excel_contains_only_that_month(self):
+        _record(1)
+        _record(2, assignee="田中", hours=3)
+        _record(3, work_date=date(2026, 3, 1))
+
+        rows = list(load_workbook(export_cache.get_or_build(2026, 2)).active.values)
+
+        self.assertEqual(rows[0], ("日付", "案件名", "担当者", "時間(h)"))
+        self.assertEqual(rows[1:], [
+            ("2026-02-18", "案件君", "大場", 2),
+            ("2026-02-18", "案件君", "田中", 3),
+        ])
+
+    def test_summary_sheets_are_grouped_in_the_database(self):
+        _record(1)
+        _record(2, assignee="田中", hours=3)
+        _record(3, work_date=date(2026, 2, 19), hours=1.5)
+        ManHourRecord.objects.create(
+            project_name="別案件", assignee="田中", work_date=date(2026, 2, 19), hours=4, source_ts="4_0",
+        )
+
+        # raw 1 + 集計シートごとに GROUP BY 1
+        with self.assertNumQueries(5):
+            path = export_cache.get_or_build(2026, 2)
+        wb = load_workbook(path)
+
+        self.assertEqual(wb.sheetnames, ["raw", "案件別", "担当者別", "日別", "案件×担当者"])
+        self.assertEqual(list(wb["案件別"].values), [
+            ("案件名", "時間(h)", "件数", "担当者数"),
+            ("別案件", 4, 1, 1),
+            ("案件君", 6.5, 3, 2),
+            ("合計", 10.5, 4, None),
+        ])
+        self.assertEqual(list(wb["担当者別"].values)[1:], [("大場", 3.5, 2, 1), ("田中", 7, 2, 2), ("合計", 10.5, 4, None)])
+        self.assertEqual(list(wb["日別"].values)[1:], [
+            ("2026-02-18", 5, 2, 2), ("2026-02-19", 5.5, 2, 2), ("合計", 10.5, 4, None),
+        ])
+        self.assertEqual(list(wb["案件×担当者"].values), [
+            ("案件名", "大場", "田中", "合計"),
+            ("別案件", None, 4, 4),
+            ("案件君", 3.5, 3, 6.5),
+            ("合計", 3.5, 7, 10.5),
+        ])
+
+    def test_download_is_limited_to_own_records_for_users(self):
+        user = get_user_model().objects.create_user("oba", password="pw")
+        UserIdentity.objects.create(user=user, kind=UserIdentity.Kind.ALIAS, value="大場")
+        _record(1)
+        _record(2, assignee="田中")
+        self.client.force_login(user)
+
+        res = self.client.get(reverse("manhour_download"), {"year": 2026, "month": 2})
+
+        self.assertEqual(res["Content-Disposition"], 'attachment; filename="manhour_202602.xlsx"')
+        wb = load_workbook(io.BytesIO(b"".join(res.streaming_content)))
+        self.assertEqual([r[2] for r in wb.active.iter_rows(min_row=2, values_only=True)], ["大場"])
+
+
+    def test_download_rejects_invalid_year_month(self):
+        self.client.force_login(get_user_model().objects.create_superuser("admin", password="pw"))
+        for params in ({"year": 2026, "month": 13}, {"year": "abc", "month": 2}, {"year": 9999, "month": 12}):
+            with self.subTest(params=params):
+                res = self.client.get(reverse("manhour_download"), params)
+                self.assertEqual((res.status_code, res.content), (400, b"invalid year/month"))
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = get_user_model().objects.create_superuser("admin", password="pw")
+        for i in range(3):
+            _record(i)
+
+    def tearDown(self):
+        cache.clear()
+        super().tearDown()
+
+    def test_pending_requests_are_deduplicated(self):
+        queued = []
+        first = export_jobs.request_export(2026, 2, None, self.admin.id, enqueue=queued.append)
+        second = export_jobs.request_export(2026, 2, None, self.admin.id, enqueue=queued.append)
+        self.assertEqual(first["id"], second["id"])
+        self.assertEqual(queued, [first["id"]])
+        # 範囲が違えば別のジョブ
+        own = export_jobs.request_export(2026, 2, self.admin.id, self.admin.id, enqueue=queued.append)
+        self.assertNotEqual(own["id"], first["id"])
+
+        with mock.patch.object(exporter, "CHUNK_SIZE", 2):
+            job = tasks.export_manhours(first["id"])
+        self.assertEqual((job["status"], job["rows"], job["total_rows"]), ("done", 3, 3))
+        self.assertEqual(export_jobs.percent(job), 100)
+        self.assertTrue(export_jobs.file_path(job).exists())
+
+        # 生成済みならタスクを使わずに完了済みで返す
+        again = export_jobs.request_export(2026, 2, None, self.admin.id, enqueue=queued.append)
+        self.assertEqual((again["status"], again["file"]), ("done", job["file"]))
+        self.assertEqual(len(queued), 2)
+
+    def test_pending_job_is_shared_between_admins(self):
+        admin2 = get_user_model().objects.create_superuser("admin2", password="pw")
+        queued = []
+        with mock.patch.object(tasks.export_manhours, "delay", queued.append):
+            self.client.force_login(self.admin)
+            self.client.post(reverse("manhour_export_request"), {"year": 2026, "month": 2})
+            self.client.force_login(admin2)
+            res = self.client.post(reverse("manhour_export_request"), {"year": 2026, "month": 2})
+
+        self.assertEqual(len(queued), 1)
+        self.assertRedirects(res, reverse("manhour_export_detail", args=[queued[0]]))
+        status = self.client.get(reverse("manhour_export_status", args=[queued[0]]))
+        self.assertEqual(status.status_code, 200)
+        self.assertEqual(status.json()["status"], "pending")
+
+    def test_request_status_and_download(self):
+        self.client.force_login(self.admin)
+        queued = []
+        with mock.patch.object(tasks.export_manhours, "delay", queued.append):
+            res = self.client.post(reverse("manhour_export_request"), {"year": 2026, "month": 2})
+        job_id = queued[0]
+        self.assertRedirects(res, reverse("manhour_export_detail", args=[job_id]))
+
+        status = self.client.get(reverse("manhour_export_status", args=[job_id])).json()
+        self.assertEqual((status["status"], status["percent"], status["download_url"]), ("pending", 0, None))
+        self.assertContains(self.client.get(reverse("manhour_export_detail", args=[job_id])), 'http-equiv="refresh"')
+
+        tasks.export_manhours(job_id)
+        status = self.client.get(reverse("manhour_export_status", args=[job_id])).json()
+        self.assertEqual(status["status"], "done")
+        res = self.client.get(status["download_url"])
+        self.assertEqual(res["Content-Disposition"], 'attachment; filename="manhour_202602.xlsx"')
+        self.assertEqual(len(list(load_workbook(io.BytesIO(b"".join(res.streaming_content))).active.values)), 4)
+
+        # 依頼者でなくても、同じ範囲を出力できる別の管理者はダウンロードできる
+        admin2 = get_user_model().objects.create_superuser("admin2", password="pw")
+        self.client.force_login(admin2)
+        self.assertEqual(self.client.get(status["download_url"]).status_code, 200)
+
+        # 全員分の出力は管理者以外からは見えない
+        other = get_user_model().objects.create_user("oba", password="pw")
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse("manhour_export_status", args=[job_id])).status_code, 404)
+
+
+class LegacyWorkbookTests(SimpleTestCase):
+    """MRCASE/app の raw ストア追記と xlsx の組み立て"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "manhours.xlsx"
+
+    def _entry(self, day, hours=1):
+        return ManHourEntry(case_key="ABCD1234", hours=hours, work_date=date(2026, 2, day), assignee="大場")
+
+    def _rows(self, sheet="raw"):
+        return [r[:4] for r in load_workbook(self.path)[sheet].iter_rows(min_row=2, values_only=True)]
+
+    def test_append_seeds_store_from_workbook_and_keeps_other_sheets(self):
+        wb = Workbook()
+        wb.active.title = "raw"
+        wb.active.append(excel_write.HEADERS)
+        wb.active.append([date(2026, 2, 1), "OLD00001", "田中", 2.0])
+        wb.create_sheet("集計").append(["合計", 2])
+        wb.save(self.path)
+
+        self.assertEqual(excel_write.append_entries_to_store([self._entry(2), self._entry(3)], self.path, "raw"), 2)
+        excel_write.compile_workbook(self.path, "raw")
+
+        self.assertEqual([r[1] for r in self._rows()], ["OLD00001", "ABCD1234", "ABCD1234"])
+        self.assertEqual(load_workbook(self.path).sheetnames, ["raw", "集計"])
+        self.assertEqual(list(load_workbook(self.path)["集計"].values), [("合計", 2)])
+
+    def test_repeated_runs_do_not_duplicate_entries(self):
+        first = excel_write.append_entries_to_store(
+            [self._entry(1), self._entry(1)], self.path, "raw", source_ts=["1.000100", "1.000100"],
+        )
+        # 読み直した 1.000100 は飛ばし、新しい 2.000000 だけを追記する
+        again = excel_write.append_entries_to_store(
+            [self._entry(1), self._entry(1), self._entry(2, hours=3)], self.path, "raw",
+            source_ts=["1.000100", "1.000100", "2.000000"],
+        )
+        self.assertEqual((first, again), (2, 1))
+        self.assertEqual(excel_write.read_watermark(self.path), "2.000000")
+
+        excel_write.compile_workbook(self.path, "raw")
+        self.assertEqual(
+            [(r[0].date(), r[3]) for r in self._rows()],
+            [(date(2026, 2, 1), 1), (date(2026, 2, 1), 1), (date(2026, 2, 2), 3)],
+        )
+
+    def test_main_compiles_and_uploads_on_demand(self):
+        messages = [_message("工数登録\n案件名=ABCD1234, 時間=1, 日付=2026/02/18")]
+        with mock.patch.object(legacy_main, "get_channel_messages", return_value=messages), \
+                mock.patch.object(legacy_main, "file_upload") as upload, \
+                mock.patch.object(legacy_main.env, "FILE", str(self.path)), \
+                mock.patch.object(excel_write, "compile_workbook", wraps=excel_write.compile_workbook) as compile_:
+            legacy_main.main()  # ブックが無いので組み立てる
+            legacy_main.main()
+            legacy_main.main(compile_workbook=True)
+
+        self.assertEqual((compile_.call_count, upload.call_count), (2, 2))
+        self.assertEqual(len(self._rows()), 1)
+
+
+class ExportCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_repeat_build_hits_cache_without_queries(self):
+        _record(1)
+        first = export_cache.get_or_build(2026, 2)
+        with self.assertNumQueries(0):
+            second = export_cache.get_or_build(2026, 2)
+        self.assertEqual(first, second)
+
+    def test_record_change_invalidates_month(self):
+        r = _record(1)
+        first = export_cache.get_or_build(2026, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            r.hours = 5
+            r.save()
+        self.assertNotEqual(export_cache.get_or_build(2026, 2), first)
+
+    def test_evict_removes_least_recently_used(self):
+        _record(1)
+        _record(2, work_date=date(2026, 3, 1))
+        old = export_cache.get_or_build(2026, 2)
+        os.utime(old, (0, 0))
+        new = export_cache.get_or_build(2026, 3)
+
+        export_cache.evict(max_bytes=new.stat().st_size)
+        self.assertFalse(old.exists())
+        self.assertTrue(new.exists())
+
+
+# ------------------------------------------------------------------ #
+# 月次集計
+# ------------------------------------------------------------------ #
+
+class MonthlySummaryTests(TestCase):
+    def test_import_and_edits_keep_summary_consistent(self):
+        import_records([
+            PendingRecord(f"{i}.0_0", "NOCASE01", "大場", date(2026, 2, i + 1), 1.5)
+            for i in range(3)
+        ])
+        r = ManHourRecord.objects.get(source_ts="0.0_0")
+        r.work_date = date(2026, 3, 1)
+        r.save()
+        ManHourRecord.objects.get(source_ts="1.0_0").delete()
+
+        self.assertEqual(summary.check_consistency(), [])
+        self.assertEqual(
+            summary.month_totals(date(2026, 2, 1)),
+            {"total_hours": Decimal("1.50"), "record_count": 1},
+        )
+
+    def test_additions_are_upserted_in_one_statement(self):
+        if not connection.features.supports_nulls_distinct_unique_constraints:
+            # SQLite には NULLS NOT DISTINCT の一意制約が作られないので、同じ列の一意インデックスで代用する
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE UNIQUE INDEX test_summary_uniq ON jobs_manhourmonthlysummary (month, case_id, assignee)"
+                )
+        admin = get_user_model().objects.create_superuser("admin", password="pw")
+        cases = [Case.objects.create(unique_key=f"CASE{i:04d}", name=f"案件{i}", created_by=admin) for i in range(5)]
+        rows = [
+            summary.SummaryRow(date(2026, 2, d), case.id, assignee, Decimal("1.5"))
+            for case in cases for assignee in ("大場", "田中") for d in (1, 2)
+        ]
+
+        with mock.patch.object(connection.features, "supports_nulls_distinct_unique_constraints", True):
+            with self.assertNumQueries(1):
+                summary.apply_records(added=rows)
+            with self.assertNumQueries(1):
+                summary.apply_records(added=rows[:2])
+
+        self.assertEqual(ManHourMonthlySummary.objects.count(), 10)
+        first = ManHourMonthlySummary.objects.get(case=cases[0], assignee="大場")
+        self.assertEqual((first.hours, first.record_count), (Decimal("6.00"), 4))
+
+    def test_concurrent_duplicate_does_not_change_summary(self):
+        row = PendingRecord("a_0", "NOCASE01", "大場", date(2026, 2, 1), 1)
+        import_records([row])
+        # 既存チェックの後に別の取り込みが同じ source_ts を先に入れた場合
+        with mock.patch("jobs.importer._existing_source_ts", return_value=set()):
+            stats = import_records([row]).batches[0]
+
+        self.assertEqual((stats.inserted, stats.skipped_existing, stats.unmatched_case), (0, 1, 0))
+        self.assertEqual(ManHourRecord.objects.count(), 1)
+        self.assertEqual(
+            summary.month_totals(date(2026, 2, 1)),
+            {"total_hours": Decimal("1.00"), "record_count": 1},
+        )
+        self.assertEqual(summary.check_consistency(), [])
+
+    def test_reimported_window_is_not_counted_as_unmatched(self):
+        rows = [
+            PendingRecord("a_0", "NOCASE01", "大場", date(2026, 2, 1), 1),
+            PendingRecord("b_0", "NOCASE02", "大場", date(2026, 2, 1), 1),
+        ]
+        self.assertEqual(import_records(rows).batches[0].unmatched_case, 2)
+        # 窓の読み直し（境界を含む取得やリトライ）
+        again = import_records(rows + [PendingRecord("c_0", "NOCASE03", "大場", date(2026, 2, 1), 1)])
+        self.assertEqual((again.batches[0].inserted, again.batches[0].unmatched_case), (1, 1))
+
+    def test_rebuild_repairs_drift(self):
+        _record(1)
+        ManHourMonthlySummary.objects.update(hours=99)
+        self.assertEqual(len(summary.check_consistency()), 1)
+
+        summary.rebuild()
+        self.assertEqual(summary.check_consistency(), [])
+
+
+# ------------------------------------------------------------------ #
+# 工数一覧
+# ------------------------------------------------------------------ #
+
+class ManhourListTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser("admin", password="pw")
+        self.client.force_login(self.admin)
+        for i in range(25):
+            _record(i, work_date=date(2026, 2, i % 28 + 1))
+        # 案件リストはプロセス内キャッシュから（読み込み済みにしておく）
+        case_directory.directory.snapshot()
+
+    def _get(self, **params):
+        return self.client.get(reverse("manhour_list"), {"year": 2026, "month": 2, **params})
+
+    @mock.patch("jobs.views.RECORD_PAGE_SIZE", 10)
+    def test_pages_follow_keyset_order(self):
+        seen = []
+        res = self._get()
+        while True:
+            seen += [r.id for r in res.context["records"]]
+            page = res.context["page"]
+            if not page.has_next:
+                break
+            res = self._get(after=page.next_cursor)
+
+        expected = list(ManHourRecord.objects.order_by("work_date", "assignee", "id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+        back = self._get(before=page.prev_cursor)
+        self.assertEqual([r.id for r in back.context["records"]], expected[10:20])
+
+    def test_users_see_records_linked_to_them(self):
+        user = get_user_model().objects.create_user("oba", first_name="文也", last_name="大場", password="pw")
+        SlackUser.objects.create(slack_id="U1", name="大場")
+        _record(100, assignee="田中")
+
+        call_command("backfill_assignee_user", stdout=io.StringIO())
+        self.assertEqual(ManHourRecord.objects.filter(assignee_user=user).count(), 0)
+
+        # Slack ID を登録すると、その Slack 表示名の担当者がこのユーザーに紐づく
+        UserIdentity.objects.create(user=user, kind=UserIdentity.Kind.SLACK_ID, value="U1")
+        call_command("backfill_assignee_user", stdout=io.StringIO())
+        self.assertEqual(ManHourRecord.objects.filter(assignee_user=user).count(), 25)
+
+        self.client.force_login(user)
+        with self.assertNumQueries(4):
+            res = self._get()
+        self.assertEqual(res.context["record_count"], 25)
+        self.assertEqual({r.assignee for r in res.context["records"]}, {"大場"})
+
+    def test_new_user_is_linked_to_records_by_name(self):
+        version = export_cache.data_version(2026, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            user = get_user_model().objects.create_user("大場", password="pw")
+        self.assertEqual(ManHourRecord.objects.filter(assignee_user=user).count(), 25)
+        self.assertNotEqual(export_cache.data_version(2026, 2), version)
+
+        # ログイン（last_login の更新）では何もしない
+        with self.assertNumQueries(1):
+            user.save(update_fields=["last_login"])
+
+        self.client.force_login(user)
+        self.assertEqual(self._get().context["record_count"], 25)
+
+    def test_migration_seeds_aliases_and_backfills(self):
+        from django.apps import apps
+        from importlib import import_module
+        migration = import_module("jobs.migrations.0013_seed_aliases_backfill_assignee_user")
+
+        user = get_user_model().objects.create_user("oba", first_name="大場", password="pw")
+        UserIdentity.objects.all().delete()
+        ManHourRecord.objects.update(assignee_user=None)
+
+        migration.seed_and_backfill(apps, None)
+        self.assertTrue(UserIdentity.objects.filter(user=user, kind=UserIdentity.Kind.ALIAS, value="大場").exists())
+        self.assertEqual(ManHourRecord.objects.filter(assignee_user=user).count(), 25)
+
+    def test_import_links_sender_and_alias(self):
+        user = get_user_model().objects.create_user("oba", password="pw")
+        UserIdentity.objects.create(user=user, kind=UserIdentity.Kind.SLACK_ID, value="U1")
+        UserIdentity.objects.create(user=user, kind=UserIdentity.Kind.ALIAS, value="おおば")
+        import_records([
+            PendingRecord("a_0", "NOCASE01", "大場", date(2026, 2, 1), 1, slack_user_id="U1"),
+            PendingRecord("b_0", "NOCASE01", "おおば", date(2026, 2, 1), 1),
+            PendingRecord("c_0", "NOCASE01", "田中", date(2026, 2, 1), 1, slack_user_id="U2"),
+        ])
+        self.assertEqual(
+            dict(ManHourRecord.objects.filter(source_ts__in=["a_0", "b_0", "c_0"])
+                 .values_list("source_ts", "assignee_user_id")),
+            {"a_0": user.id, "b_0": user.id, "c_0": None},
+        )
+
+    def test_query_count_is_independent_of_month_size(self):
+        # session + user + 集計 + 1ページ分の SELECT
+        with self.assertNumQueries(4):
+            res = self._get()
+        self.assertEqual(res.context["record_count"], 25)
+        self.assertEqual(res.context["total_hours"], Decimal("50.00"))
+
+
+# ビュー → 1リクエストのクエリ数の上限（データ量に依存しないこと）
+VIEW_QUERY_BUDGETS = {
+    "case_list": 4,
+    "manhour_list": 5,  # 案件キャッシュの読み直しを含む
+    "admin:jobs_case_changelist": 5,
+    "admin:jobs_manhourrecord_changelist": 7,
+    "admin:jobs_manhourmonthlysummary_changelist": 5,
+    "admin:jobs_useridentity_changelist": 5,
+}
+
+
+class CaseListTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser("admin", password="pw")
+        self.client.force_login(self.admin)
+        self.a = Case.objects.create(unique_key="AAAA0001", name="案件A", created_by=self.admin)
+        self.b = Case.objects.create(unique_key="BBBB0001", name="案件B", created_by=self.admin)
+        self.c = Case.objects.create(unique_key="CCCC0001", name="案件C", created_by=self.admin)
+        self.today = date.today()
+
+        for i, (case, work_date, hours) in enumerate([
+            (self.a, self.today, 3),
+            (self.a, date(2025, 1, 10), 5),
+            (self.b, date(2025, 6, 1), 1),
+        ]):
+            ManHourRecord.objects.create(
+                case=case, project_name=case.name, assignee="大場",
+                work_date=work_date, hours=hours, source_ts=f"{i}_0",
+            )
+        # 案件登録前に取り込まれた（未マッチの）レコード
+        for i in range(2):
+            ManHourRecord.objects.create(
+                project_name="CCCC0001", assignee="大場",
+                work_date=date(2025, 1, 1), hours=1, source_ts=f"{100 + i}_0",
+            )
+
+    def _get(self, **params):
+        return self.client.get(reverse("case_list"), params)
+
+    def test_columns_come_from_one_query(self):
+        # session + user + 件数 + 1ページ分
+        with self.assertNumQueries(4):
+            res = self._get()
+        rows = {c.unique_key: c for c in res.context["cases"]}
+        self.assertEqual(rows["AAAA0001"].total_hours, Decimal("8.00"))
+        self.assertEqual(rows["AAAA0001"].month_hours, Decimal("3.00"))
+        self.assertEqual(rows["AAAA0001"].last_activity, self.today)
+        self.assertEqual(rows["BBBB0001"].month_hours, Decimal(0))
+        self.assertIsNone(rows["CCCC0001"].last_activity)
+        self.assertEqual(rows["CCCC0001"].unmatched_count, 2)
+        self.assertEqual(rows["AAAA0001"].unmatched_count, 0)
+
+    def test_sorts_by_column(self):
+        def keys(sort):
+            return [c.unique_key for c in self._get(sort=sort).context["cases"]]
+
+        self.assertEqual(keys("-total_hours"), ["AAAA0001", "BBBB0001", "CCCC0001"])
+        self.assertEqual(keys("total_hours"), ["CCCC0001", "BBBB0001", "AAAA0001"])
+        # 稼働の無い案件は昇順・降順とも最後
+        self.assertEqual(keys("last_activity"), ["BBBB0001", "AAAA0001", "CCCC0001"])
+        self.assertEqual(keys("-unmatched_count")[0], "CCCC0001")
+        # 不正な指定は作成日時の降順
+        self.assertEqual(keys("password"), keys("-created_at"))
+
+    @mock.patch("jobs.views.CASE_PAGE_SIZE", 2)
+    def test_paginates(self):
+        res = self._get(sort="name", page=2)
+        self.assertEqual([c.unique_key for c in res.context["cases"]], ["CCCC0001"])
+        self.assertContains(res, "2 / 2")
+
+
+class CaseDirectoryTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser("admin", password="pw")
+        self.case = Case.objects.create(unique_key="ABCD1234", name="案件A", created_by=self.admin)
+
+    def tearDown(self):
+        cache.clear()
+        super().tearDown()
+
+    def test_resolves_from_memory_until_a_case_changes(self):
+        directory = case_directory.CaseDirectory()
+        self.assertEqual(directory.resolve("ABCD1234").id, self.case.id)
+        with self.assertNumQueries(0):
+            self.assertEqual([c.name for c in directory.active()], ["案件A"])
+            self.assertIsNone(directory.resolve("NOCASE01"))
+
+        # 保存で版が変わり、次の参照で読み直す
+        self.case.is_active = False
+        self.case.save()
+        with self.assertNumQueries(1):
+            self.assertIsNone(directory.resolve("ABCD1234"))
+        self.assertEqual(directory.active(), [])
+        self.assertFalse(directory.snapshot().by_key["ABCD1234"].is_active)
+
+        self.case.delete()
+        self.assertNotIn("ABCD1234", directory.snapshot().by_key)
+
+    def test_import_uses_the_directory(self):
+        case_directory.directory.snapshot()
+        with CaptureQueriesContext(connection) as ctx:
+            stats = import_records([PendingRecord("a_0", "ABCD1234", "大場", date(2026, 2, 1), 1)]).batches[0]
+        self.assertEqual(stats.unmatched_case, 0)
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if 'FROM "jobs_case"' in q["sql"]])
+        record = ManHourRecord.objects.get(source_ts="a_0")
+        self.assertEqual((record.case_id, record.project_name), (self.case.id, "案件A"))
+
+
+class ViewQueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser("admin", password="pw")
+        for i in range(30):
+            user = get_user_model().objects.create_user(f"user{i}", password="pw")
+            case = Case.objects.create(unique_key=f"CASE{i:04d}", name=f"案件{i}", created_by=user)
+            UserIdentity.objects.create(user=user, kind=UserIdentity.Kind.ALIAS, value=f"担当{i}")
+            record = _record(i, assignee=f"担当{i}")
+            record.case = case
+            record.save()
+        summary.rebuild()
+
+    def tearDown(self):
+        cache.clear()
+        super().tearDown()
+
+    def test_views_stay_within_query_budget(self):
+        self.client.force_login(self.admin)
+        for view, budget in VIEW_QUERY_BUDGETS.items():
+            with self.subTest(view=view), profiling.query_budget(budget, view):
+                self.assertEqual(self.client.get(reverse(view)).status_code, 200)
+
+    @override_settings(PROFILE_REQUESTS=True, PROFILE_SLOW_MS=0)
+    def test_profiling_middleware_logs_repeated_sql(self):
+        def n_plus_one(request):
+            names = [c.created_by.username for c in Case.objects.all()]
+            return HttpResponse(Template("{{ names|length }}").render(Context({"names": names})))
+
+        middleware = profiling.ProfilingMiddleware(n_plus_one)
+        with self.assertLogs("jobs.profiling", "WARNING") as logs:
+            res = middleware(RequestFactory().get("/cases/"))
+
+        profile = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(profile["queries"], 31)
+        self.assertGreater(profile["render_ms"], 0)
+        self.assertEqual(profile["repeated"][0]["count"], 30)
+        self.assertIn("auth_user", profile["repeated"][0]["sql"])
+        self.assertIn('desc="31 queries"', res["Server-Timing"])
+
+
+class RecordsApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = get_user_model().objects.create_superuser("admin", password="pw")
+        for i in range(5):
+            _record(i, work_date=date(2026, 2, i + 1))
+        _record(10, work_date=date(2026, 3, 1), assignee="田中")
+
+    def _get(self, **params):
+        headers = params.pop("headers", {})
+        return self.client.get(
+            reverse("manhour_records_api"),
+            {"since": "2026-02-01", "until": "2026-03-31", **params},
+            headers=headers,
+        )
+
+    def _lines(self, res):
+        return b"".join(res.streaming_content).decode("utf-8").splitlines()
+
+    def test_ndjson_pages_follow_cursor(self):
+        self.client.force_login(self.admin)
+        seen = []
+        res = self._get(limit=4)
+        while True:
+            seen += [json.loads(line)["id"] for line in self._lines(res)]
+            if "X-Next-Cursor" not in res:
+                break
+            res = self._get(limit=4, after=res["X-Next-Cursor"])
+
+        expected = list(ManHourRecord.objects.order_by("work_date", "assignee", "id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursors_are_rejected(self):
+        self.client.force_login(self.admin)
+        cursors = [
+            "not-base64!",
+            pagination.encode_cursor(["2026-02-01", "大場"]),
+            pagination.encode_cursor([["2026-02-01"], "大場", 1]),
+            pagination.encode_cursor(["2026-02-30", "大場", 1]),
+            pagination.encode_cursor(["2026-02-01", "大場", "1; DROP"]),
+            pagination.encode_cursor(["2026-02-01", "大場", True]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                res = self._get(after=cursor)
+                self.assertEqual((res.status_code, res.content), (400, b"invalid cursor"))
+                res = self.client.get(reverse("manhour_list"), {"year": 2026, "month": 2, "before": cursor})
+                self.assertEqual((res.status_code, res.content), (400, b"invalid cursor"))
+
+    def test_csv_and_filters(self):
+        self.client.force_login(self.admin)
+        lines = self._lines(self._get(format="csv", assignee="田中"))
+        self.assertEqual(lines[0], "id,work_date,case_id,project_name,assignee,assignee_user_id,hours")
+        self.assertEqual(len(lines), 2)
+        self.assertIn("2026-03-01,,案件君,田中,,2.00", lines[1])
+
+    def test_etag_follows_data_version(self):
+        self.client.force_login(self.admin)
+        tag = self._get()["ETag"]
+        self.assertEqual(self._get(headers={"If-None-Match": tag}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            _record(20, work_date=date(2026, 3, 2))
+        res = self._get(headers={"If-None-Match": tag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(self._lines(res)), 7)
+
+    def test_users_only_get_their_own_records(self):
+        user = get_user_model().objects.create_user("tanaka", password="pw")
+        ManHourRecord.objects.filter(assignee="田中").update(assignee_user=user)
+        self.client.force_login(user)
+        rows = [json.loads(line) for line in self._lines(self._get(assignee="大場"))]
+        self.assertEqual([r["assignee"] for r in rows], ["田中"])
+
+
+# ------------------------------------------------------------------ #
+# 取り込みパイプライン
+# ------------------------------------------------------------------ #
+
+class PipelineTests(SlackStubMixin, TestCase):
+    OLDEST = 1771398155  # get_time.OLDEST
+    DAY = 24 * 60 * 60
+
+    def _history(self, *messages):
+        return (200, {}, {"ok": True, "messages": list(messages)})
+
+    def _import(self, days):
+        with mock.patch.object(slack_client, "SLACK_API_URL", self.base_url):
+            return import_channel("C1", resolve_user=lambda u: f"user:{u}", now=self.OLDEST + days * self.DAY)
+
+    def test_checkpoints_after_each_window_and_resumes(self):
+        ts = f"{self.OLDEST + 10}.000100"
+        self.server.responses["conversations.history"] = [
+            self._history({"ts": ts, "user": "U1", "text": "工数登録\n案件名=ABCD1234, 時間=2, 日付=2026/02/18"}),
+            (200, {}, {"ok": False, "error": "fatal_error"}),
+        ]
+        with self.assertLogs("jobs.pipeline", "ERROR"):
+            result = self._import(days=3)
+
+        self.assertEqual(result.imported, 1)
+        self.assertEqual(ManHourRecord.objects.get().assignee, "user:U1")
+        # 2つ目の窓で失敗したので1つ目の窓の終端で止まっている
+        cursor = SlackChannelCursor.objects.get(channel_id="C1")
+        self.assertEqual(cursor.last_ts, f"{self.OLDEST + self.DAY}.000000")
+
+        self.server.responses["conversations.history"] = [self._history()]
+        self._import(days=3)
+        cursor.refresh_from_db()
+        self.assertEqual(cursor.last_ts, f"{self.OLDEST + 2 * self.DAY}.000000")
+
+
+    def test_late_reply_to_checkpointed_thread_is_imported(self):
+        parent = f"{self.OLDEST + 10}.000100"
+        first_reply = f"{self.OLDEST + 20}.000100"
+        late_reply = f"{self.OLDEST + 2 * self.DAY + 30}.000100"
+
+        def run(days):
+            with mock.patch.object(pipeline.time, "time", return_value=self.OLDEST + days * self.DAY):
+                return self._import(days)
+
+        # 1回目: 親と（工数ではない）返信だけ。窓はチェックポイントされる
+        self.server.responses["conversations.history"] = [
+            self._history({"ts": parent, "thread_ts": parent, "reply_count": 1, "user": "U1", "text": "今日の作業"}),
+            self._history(),
+        ]
+        self.server.responses["conversations.replies"] = [(200, {}, {"ok": True, "messages": [
+            {"ts": parent, "thread_ts": parent, "user": "U1", "text": "今日の作業"},
+            {"ts": first_reply, "thread_ts": parent, "user": "U2", "text": "了解"},
+        ]})]
+        run(days=2)
+        self.assertEqual(ManHourRecord.objects.count(), 0)
+        self.assertEqual(SlackChannelCursor.objects.get(channel_id="C1").last_ts, f"{self.OLDEST + self.DAY}.000000")
+
+        # 2回目: 親はもう窓に入らないが、後から付いた工数登録の返信を取り込む
+        self.server.params.clear()
+        self.server.responses["conversations.history"] = [self._history()]
+        self.server.responses["conversations.replies"] = [(200, {}, {"ok": True, "messages": [
+            {"ts": late_reply, "thread_ts": parent, "user": "U2",
+             "text": "工数登録\n案件名=ABCD1234, 時間=1, 日付=2026/02/19"},
+        ]})]
+        result = run(days=3)
+
+        self.assertEqual(result.imported, 1)
+        self.assertEqual(ManHourRecord.objects.get().source_ts, f"{late_reply}_0")
+        replies = [p for m, p in self.server.params if m == "conversations.replies"]
+        self.assertEqual([(p["ts"], p["oldest"]) for p in replies], [(parent, first_reply)])
+        self.assertEqual(SlackThread.objects.get(thread_ts=parent).last_reply_ts, late_reply)
+
+        # 返信が途絶えて THREAD_LOOKBACK を過ぎたスレッドは取り直さない
+        self.server.params.clear()
+        run(days=3 + pipeline.THREAD_LOOKBACK // self.DAY)
+        self.assertNotIn("conversations.replies", [m for m, p in self.server.params])
+        self.assertFalse(SlackThread.objects.exists())
+
+
+class NightlyWorkflowTests(SlackStubMixin, TestCase):
+    def tearDown(self):
+        cache.clear()
+        super().tearDown()
+
+    def test_lock_is_exclusive(self):
+        token = locks.acquire(locks.IMPORT_LOCK, 60)
+        self.assertIsNotNone(token)
+        self.assertIsNone(locks.acquire(locks.IMPORT_LOCK, 60))
+        with self.assertLogs("jobs.locks", "WARNING"):
+            self.assertFalse(locks.release(locks.IMPORT_LOCK, "other"))
+        self.assertTrue(locks.release(locks.IMPORT_LOCK, token))
+        self.assertIsNotNone(locks.acquire(locks.IMPORT_LOCK, 60))
+
+    def test_manual_import_skips_while_nightly_holds_lock(self):
+        locks.acquire(locks.IMPORT_LOCK, 60)
+        with self.assertLogs("jobs.tasks", "WARNING"):
+            self.assertEqual(tasks.manual_import(), {"skipped": "locked"})
+            self.assertIsNone(tasks.nightly_import_and_export())
+
+    def test_commit_windows_stops_at_first_failed_window(self):
+        outcomes = [
+            {"start": "300.000000", "end": "400.000000", "ok": True, "newest": None},
+            {"start": "100.000000", "end": "200.000000", "ok": True, "newest": None},
+            {"start": "200.000000", "end": "300.000000", "ok": False, "newest": None},
+        ]
+        self.assertEqual(commit_windows("C1", outcomes, now=10_000), "200.000000")
+        self.assertEqual(SlackChannelCursor.objects.get(channel_id="C1").last_ts, "200.000000")
+
+    def test_nightly_runs_stages_and_releases_lock(self):
+        now = PipelineTests.OLDEST + 2 * PipelineTests.DAY
+        ts = f"{PipelineTests.OLDEST + 10}.000100"
+        self.server.responses["conversations.history"] = [
+            (200, {}, {"ok": True, "messages": [
+                {"ts": ts, "user": "U1", "text": "工数登録\n案件名=ABCD1234, 時間=2, 日付=2026/02/18, 担当者=大場"},
+            ]}),
+            (200, {}, {"ok": True, "messages": []}),
+        ]
+        with mock.patch.object(slack_client, "SLACK_API_URL", self.base_url), \
+                mock.patch.object(tasks, "SLACK_CHANNEL_ID", "C1"), \
+                mock.patch.object(tasks, "_warm_up_users"), \
+                mock.patch.object(tasks.time, "time", return_value=now), \
+                mock.patch.object(tasks, "_upload_excel_to_slack") as upload:
+            tasks.nightly_import_and_export()
+
+        self.assertEqual(ManHourRecord.objects.count(), 1)
+        self.assertEqual(upload.call_count, 1)
+        # 直近の窓はメッセージが無いので1つ目の窓の終端まで
+        self.assertEqual(
+            SlackChannelCursor.objects.get(channel_id="C1").last_ts,
+            f"{PipelineTests.OLDEST + PipelineTests.DAY}.000000",
+        )
+        self.assertIsNone(locks.owner(locks.IMPORT_LOCK))
+
+        # 段ごとの計測値が /metrics に出る（スタッフのみ）
+        self.client.force_login(get_user_model().objects.create_user("staff", password="pw", is_staff=True))
+        body = self.client.get(reverse("metrics")).content.decode()
+        for stage in ("fetch", "filter", "parse", "resolve", "write", "excel", "upload"):
+            self.assertIn(f'mrcase_task_stage_runs_total{{stage="{stage}",task="nightly_import_and_export"}}', body)
+        self.assertIn('mrcase_task_stage_items_total{stage="write",task="nightly_import_and_export"} 1', body)
+        self.assertIn(f'mrcase_task_last_success_timestamp_seconds{{task="nightly_import_and_export"}} {now}', body)
+
+
+class MetricsTests(SimpleTestCase):
+    def tearDown(self):
+        cache.clear()
+        super().tearDown()
+
+    def test_stage_timings_subtract_upstream(self):
+        timings = metrics.StageTimings()
+        timings.add("fetch", 3.0, items=10)
+        timings.add("parse", 5.0, items=4)
+        timings.add("write", 5.5, items=4)
+        self.assertEqual(timings.exclusive(), {"fetch": 3.0, "parse": 2.0, "write": 0.5})
+
+    def test_render_accumulates_counters(self):
+        with self.assertLogs("jobs.metrics", "INFO") as logs:
+            metrics.record_stage("manual_import", "fetch", 1.5, items=3, retries=2)
+            metrics.record_stage("manual_import", "fetch", 0.25, items=1, ok=False)
+        self.assertEqual(json.loads(logs.records[0].getMessage())["retries"], 2)
+
+        body = metrics.render()
+        self.assertIn("# TYPE mrcase_task_stage_seconds_total counter", body)
+        self.assertIn('mrcase_task_stage_seconds_total{stage="fetch",task="manual_import"} 1.750000', body)
+        self.assertIn('mrcase_task_stage_items_total{stage="fetch",task="manual_import"} 4', body)
+        self.assertIn('mrcase_task_stage_retries_total{stage="fetch",task="manual_import"} 2', body)
+        self.assertIn('mrcase_task_stage_errors_total{stage="fetch",task="manual_import"} 1', body)
+        self.assertIn('mrcase_task_stage_last_seconds{stage="fetch",task="manual_import"} 0.250000', body)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_requires_staff_or_token(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user("oba", password="pw"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        with self.settings(METRICS_TOKEN="s3cret"):
+            self.client.logout()
+            self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer wrong"}).status_code, 403)
+            res = self.client.get(url, headers={"Authorization": "Bearer s3cret"})
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(res["Content-Type"].startswith("text/plain; version=0.0.4"))
+
+        self.client.force_login(get_user_model().objects.create_user("staff", password="pw", is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class BackfillTests(SlackStubMixin, TestCase):
+    def _backfill(self, **options):
+        out = io.StringIO()
+        with mock.patch.object(slack_client, "SLACK_API_URL", self.base_url), \
+                mock.patch.object(tasks, "_warm_up_users"), \
+                mock.patch("jobs.backfill.time.time", return_value=1772300000):
+            call_command(
+                "backfill_manhours", since="2026-02-18", until="2026-02-20",
+                channel="C1", stdout=out, **options,
+            )
+        return out.getvalue()
+
+    def test_dispatches_windows_and_resumes(self):
+        ts = f"{PipelineTests.OLDEST + 10}.000100"
+        self.server.responses["conversations.history"] = [
+            (200, {}, {"ok": True, "messages": [
+                {"ts": ts, "user": "U1", "text": "工数登録\n案件名=ABCD1234, 時間=2, 担当者=大場"},
+            ]}),
+            (200, {}, {"ok": False, "error": "fatal_error"}),
+        ]
+        with mock.patch.object(tasks.backfill_window, "max_retries", 0), self.assertLogs("jobs", "ERROR"):
+            output = self._backfill(chunk="1d")
+
+        self.assertIn("dispatched 3 windows", output)
+        self.assertEqual(ManHourRecord.objects.count(), 1)
+        statuses = list(BackfillWindow.objects.order_by("oldest").values_list("status", flat=True))
+        self.assertEqual(statuses, ["done", "failed", "failed"])
+        # チェックポイントは動かさない
+        self.assertFalse(SlackChannelCursor.objects.exists())
+
+        # 再実行では失敗した窓だけを投入する
+        self.server.responses["conversations.history"] = [(200, {}, {"ok": True, "messages": []})]
+        output = self._backfill(chunk="1d")
+        self.assertIn("dispatched 2 windows", output)
+        self.assertIn("3/3 windows done", output)
+        self.assertEqual(BackfillWindow.objects.count(), 3)
+
+    def test_rejects_invalid_chunk(self):
+        with self.assertRaises(CommandError):
+            self._backfill(chunk="1w")
+
+
+# Events API で実際に届く形の payload（不要なフィールドは省略）
+SLACK_MESSAGE_EVENT = {
+    "token": "XXYYZZ",
+    "team_id": "T0001",
+    "api_app_id": "A0001",
+    "type": "event_callback",
+    "event_id": "Ev0001",
+    "event_time": 1771398200,
+    "event": {
+        "type": "message",
+        "channel": "C1",
+        "user": "U1",
+        "text": "工数登録\n案件名=ABCD1234, 時間=2, 日付=2026/02/18, 担当者=大場\n案件名=ABCD1234, 時間=1, 日付=2026/02/18, 担当者=大場",
+        "ts": "1771398200.000100",
+        "event_ts": "1771398200.000100",
+        "channel_type": "channel",
+    },
+}
+
+SLACK_MESSAGE_CHANGED_EVENT = {
+    "type": "event_callback",
+    "event_id": "Ev0002",
+    "event": {
+        "type": "message",
+        "subtype": "message_changed",
+        "channel": "C1",
+        "hidden": True,
+        "message": {
+            "type": "message",
+            "user": "U1",
+            "text": "工数登録\n案件名=ABCD1234, 時間=3.5, 日付=2026/02/18, 担当者=大場",
+            "ts": "1771398200.000100",
+            "edited": {"user": "U1", "ts": "1771398300.000000"},
+        },
+        "previous_message": {
+            "type": "message",
+            "user": "U1",
+            "text": SLACK_MESSAGE_EVENT["event"]["text"],
+            "ts": "1771398200.000100",
+        },
+        "ts": "1771398300.000200",
+        "event_ts": "1771398300.000200",
+    },
+}
+
+SLACK_MESSAGE_DELETED_EVENT = {
+    "type": "event_callback",
+    "event_id": "Ev0003",
+    "event": {
+        "type": "message",
+        "subtype": "message_deleted",
+        "channel": "C1",
+        "hidden": True,
+        "deleted_ts": "1771398200.000100",
+        "previous_message": {"type": "message", "ts": "1771398200.000100"},
+        "ts": "1771398400.000300",
+        "event_ts": "1771398400.000300",
+    },
+}
+
+
+class SlackEventsTests(TestCase):
+    SECRET = "test-signing-secret"
+
+    def setUp(self):
+        patcher = mock.patch.object(slack_events, "SLACK_SIGNING_SECRET", self.SECRET)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, payload, secret=SECRET, timestamp=None):
+        body = json.dumps(payload).encode("utf-8")
+        timestamp = str(int(time.time()) if timestamp is None else timestamp)
+        base = b"v0:" + timestamp.encode() + b":" + body
+        signature = "v0=" + hmac.new(secret.encode(), base, hashlib.sha256).hexdigest()
+        return self.client.post(
+            reverse("slack_events"),
+            data=body,
+            content_type="application/json",
+            headers={"X-Slack-Request-Timestamp": timestamp, "X-Slack-Signature": signature},
+        )
+
+    def test_rejects_bad_or_stale_signature(self):
+        self.assertEqual(self._post(SLACK_MESSAGE_EVENT, secret="wrong").status_code, 403)
+        self.assertEqual(self._post(SLACK_MESSAGE_EVENT, timestamp=1).status_code, 403)
+        self.assertFalse(ManHourRecord.objects.exists())
+
+    def test_url_verification(self):
+        response = self._post({"type": "url_verification", "challenge": "abc123"})
+        self.assertEqual(response.json(), {"challenge": "abc123"})
+
+    def test_message_created_changed_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self._post(SLACK_MESSAGE_EVENT).status_code, 200)
+        self.assertEqual(
+            sorted(ManHourRecord.objects.values_list("source_ts", "hours")),
+            [("1771398200.000100_0", Decimal("2.00")), ("1771398200.000100_1", Decimal("1.00"))],
+        )
+
+        # Slack の再送でも重複しない
+        self._post(SLACK_MESSAGE_EVENT)
+        self.assertEqual(ManHourRecord.objects.count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._post(SLACK_MESSAGE_CHANGED_EVENT)
+        self.assertEqual(
+            list(ManHourRecord.objects.values_list("source_ts", "hours")),
+            [("1771398200.000100_0", Decimal("3.50"))],
+        )
+        self.assertEqual(summary.check_consistency(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._post(SLACK_MESSAGE_DELETED_EVENT)
+        self.assertFalse(ManHourRecord.objects.exists())
+        self.assertFalse(ManHourMonthlySummary.objects.exists())
@@ -1,17 +1,54 @@
 """
 jobs/views.py
 """
-import io
-from datetime import date
+import hmac
+import json
+import logging
+from datetime import date, timedelta
+from decimal import Decimal
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import HttpResponse
+from django.core.paginator import Paginator
+from django.db.models import Count, Sum
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
-from openpyxl import Workbook
-
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from jobs import case_stats, export_jobs, metrics, record_feed, slack_events
+from jobs.case_directory import directory as case_directory
+from jobs.dates import month_range
+from jobs.export_cache import get_or_build
+from jobs.exporter import XLSX_CONTENT_TYPE, monthly_filename
 from jobs.forms import CaseForm
 from jobs.models import Case, ManHourRecord
+from jobs.pagination import InvalidCursor, paginate
+from jobs.summary import month_totals
+from jobs.tasks import export_manhours, process_slack_event
+
+logger = logging.getLogger(__name__)
+
+# 工数一覧の並び順（末尾の id で一意にする）と1ページの件数
+RECORD_ORDER = ("work_date", "assignee", "id")
+RECORD_PAGE_SIZE = 100
+# 解釈できないカーソル（形式・件数・値の型）への 400 の本文（一覧・API 共通）
+INVALID_CURSOR_MESSAGE = "invalid cursor"
+
+# 案件一覧の1ページの件数と、最初のクリックで降順にする列（数値・日付）
+CASE_PAGE_SIZE = 50
+CASE_DESC_FIRST = {"created_at", "total_hours", "month_hours", "last_activity", "unmatched_count"}
 
 
 # ------------------------------------------------------------------ #
@@ -40,10 +77,36 @@ def menu(request):
 # 案件
 # ------------------------------------------------------------------ #
 
+def _sort_headers(sort):
+    """列ごとの並び替えリンク（クリックで昇順 ⇔ 降順）と現在の並びの印"""
+    headers = {}
+    for field in case_stats.SORT_FIELDS:
+        if sort == field:
+            headers[field] = {"sort": f"-{field}", "mark": " ▲"}
+        elif sort == f"-{field}":
+            headers[field] = {"sort": field, "mark": " ▼"}
+        else:
+            headers[field] = {"sort": f"-{field}" if field in CASE_DESC_FIRST else field, "mark": ""}
+    return headers
+
+
 @login_required
 def case_list(request):
-    cases = Case.objects.order_by("-created_at")
-    return render(request, "cases/list.html", {"cases": cases})
+    """
+    案件一覧（集計列付き、列見出しで並び替え）。集計列で並べ替えるため
+    キーセットではなくページ番号でページングする（案件は多くても数千件）。
+    """
+    sort = case_stats.parse_sort(request.GET.get("sort"))
+    today = date.today()
+    page = Paginator(case_stats.case_list_queryset(sort, today), CASE_PAGE_SIZE).get_page(request.GET.get("page"))
+    context = {
+        "cases": page.object_list,
+        "page": page,
+        "sort": sort,
+        "headers": _sort_headers(sort),
+        "today": today,
+    }
+    return render(request, "cases/list.html", context)
 
 
 @admin_required
@@ -90,6 +153,20 @@ def case_delete(request, pk):
 # 工数
 # ------------------------------------------------------------------ #
 
+def _totals(records, own_only, month, case_id):
+    """
+    件数・合計。全員分は月次集計表から、自分の分は (assignee_user, work_date) の
+    インデックスで絞った records を直接集計する（どちらも1クエリ）。
+    """
+    if not own_only:
+        return month_totals(month, case_id=case_id)
+    totals = records.aggregate(total_hours=Sum("hours"), record_count=Count("id"))
+    return {
+        "total_hours": totals["total_hours"] or Decimal(0),
+        "record_count": totals["record_count"],
+    }
+
+
 @login_required
 def manhour_list(request):
     # 絞り込みパラメータ
@@ -100,27 +177,38 @@ def manhour_list(request):
     try:
         year = int(year)
         month = int(month)
+        date(year, month, 1)
     except (ValueError, TypeError):
         year = date.today().year
         month = date.today().month
 
-    records = ManHourRecord.objects.filter(
-        work_date__year=year,
-        work_date__month=month,
-    )
+    records = ManHourRecord.objects.in_month(year, month)
 
-    # 使用者は自分の担当者名と一致するものだけ（管理者は全件）
-    if not is_admin(request.user):
-        records = records.filter(assignee=request.user.get_full_name() or request.user.username)
+    # 使用者は自分が担当者のものだけ（管理者は全件）
+    own_only = not is_admin(request.user)
+    if own_only:
+        records = records.filter(assignee_user_id=request.user.id)
 
     # 案件絞り込み
+    selected_case = None
     if case_id:
         try:
-            records = records.filter(case_id=int(case_id))
+            selected_case = int(case_id)
+            records = records.filter(case_id=selected_case)
         except (ValueError, TypeError):
             pass
 
-    records = records.order_by("work_date", "assignee")
+    # 1ページ分だけ必要な列で取得（work_date, assignee, id のキーセットページング）
+    try:
+        page = paginate(
+            records.only("id", "work_date", "project_name", "assignee", "hours", "case_id", "created_at"),
+            RECORD_ORDER,
+            after=request.GET.get("after"),
+            before=request.GET.get("before"),
+            page_size=RECORD_PAGE_SIZE,
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest(INVALID_CURSOR_MESSAGE)
 
     # 月選択用リスト
     months = range(1, 13)
@@ -128,55 +216,278 @@ def manhour_list(request):
     # 年選択用リスト（2020年〜今年）
     years = range(2020, date.today().year + 1)
 
-    # 案件選択用リスト（有効案件のみ）
-    cases = Case.objects.filter(is_active=True).order_by("name")
+    # 案件選択用リスト（有効案件のみ。プロセス内キャッシュから）
+    cases = case_directory.active()
 
     context = {
-        "records": records,
+        "records": page.items,
+        "page": page,
         "year": year,
         "month": month,
         "months": months,
         "years": years,
         "cases": cases,
         "selected_case_id": case_id,
-        "total_hours": sum(r.hours for r in records),
+        **_totals(records, own_only, date(year, month, 1), selected_case),
     }
     return render(request, "manhours/list.html", context)
 
 
+def _year_month(params):
+    """year / month パラメータ（省略時は当月）。不正なら None"""
+    try:
+        year = int(params.get("year", date.today().year))
+        month = int(params.get("month", date.today().month))
+        date(year, month, 1)
+    except (ValueError, TypeError):
+        return None
+    # 月末（翌月1日）を求めるので最終年は除く
+    if year >= date.max.year:
+        return None
+    return year, month
+
+
 @login_required
 def manhour_download(request):
     """当月（またはパラメータ指定）の工数を Excel でダウンロード"""
-    year = int(request.GET.get("year", date.today().year))
-    month = int(request.GET.get("month", date.today().month))
+    parsed = _year_month(request.GET)
+    if parsed is None:
+        return HttpResponseBadRequest("invalid year/month")
+    year, month = parsed
+
+    # 使用者は自分の分のみ（管理者は全件）
+    user_id = None if is_admin(request.user) else request.user.id
+
+    # Excel 生成（データが変わっていなければ生成済みファイルをそのまま返す）
+    path = get_or_build(year, month, user_id)
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=True,
+        filename=monthly_filename(year, month),
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+# ------------------------------------------------------------------ #
+# Excel の非同期生成
+# ------------------------------------------------------------------ #
+
+def _own_job(request, job_id):
+    """
+    見る権限のあるジョブ（それ以外・期限切れは 404）。
+    同じ出力の依頼は1つのジョブにまとめるので、依頼者ではなく出力の範囲で判定する
+    （全員分は管理者、担当者分はその本人と管理者）。
+    """
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise Http404("export job not found")
+    if not is_admin(request.user) and job["user_id"] != request.user.id:
+        raise Http404("export job not found")
+    return job
+
+
+def _job_status(job):
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "percent": export_jobs.percent(job),
+        "rows": job["rows"],
+        "total_rows": job["total_rows"],
+        "error": job["error"],
+        "download_url": (
+            reverse("manhour_export_download", args=[job["id"]])
+            if job["status"] == export_jobs.DONE else None
+        ),
+    }
 
-    records = ManHourRecord.objects.filter(
-        work_date__year=year,
-        work_date__month=month,
+
+@login_required
+@require_POST
+def manhour_export_request(request):
+    """Excel の生成を Celery に依頼して進捗画面へ（生成済みならそのままダウンロード）"""
+    parsed = _year_month(request.POST)
+    if parsed is None:
+        return HttpResponseBadRequest("invalid year/month")
+    year, month = parsed
+
+    # 使用者は自分の分のみ（管理者は全件）
+    user_id = None if is_admin(request.user) else request.user.id
+    job = export_jobs.request_export(year, month, user_id, request.user.id, enqueue=export_manhours.delay)
+    if export_jobs.file_path(job) is not None:
+        return redirect("manhour_export_download", job["id"])
+    return redirect("manhour_export_detail", job["id"])
+
+
+@login_required
+def manhour_export_detail(request, job_id):
+    """進捗画面（完了するまで数秒ごとに再読み込み）"""
+    job = _own_job(request, job_id)
+    return render(request, "manhours/export.html", {"job": job, **_job_status(job)})
+
+
+@login_required
+@require_GET
+def manhour_export_status(request, job_id):
+    """進捗（JSON）。ポーリング用"""
+    return JsonResponse(_job_status(_own_job(request, job_id)))
+
+
+@login_required
+def manhour_export_download(request, job_id):
+    job = _own_job(request, job_id)
+    path = export_jobs.file_path(job)
+    if path is None:
+        if job["status"] == export_jobs.DONE:
+            # キャッシュの上限で削除された
+            return HttpResponse("ファイルの保存期間が過ぎました。もう一度作成してください。", status=410)
+        return redirect("manhour_export_detail", job["id"])
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=True,
+        filename=monthly_filename(job["year"], job["month"]),
+        content_type=XLSX_CONTENT_TYPE,
     )
 
-    if not is_admin(request.user):
-        records = records.filter(assignee=request.user.get_full_name() or request.user.username)
 
-    records = records.order_by("work_date", "assignee")
+# ------------------------------------------------------------------ #
+# API
+# ------------------------------------------------------------------ #
+
+def _parse_iso_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@login_required
+@require_GET
+def manhour_records_api(request):
+    """
+    工数レコードを CSV / NDJSON でストリーミング出力する（BI ツール向け・読み取り専用）。
+    パラメータ:
+      since, until  : 期間（YYYY-MM-DD、両端を含む。省略時は当月）
+      case_id       : 案件
+      assignee      : 担当者名（管理者のみ。使用者は常に自分の分）
+      format        : csv / ndjson（既定 ndjson）
+      after, limit  : キーセットカーソルと1ページの件数
+    次ページのカーソルは X-Next-Cursor と Link ヘッダーで返す。
+    """
+    params = request.GET
+    fmt = params.get("format", record_feed.FORMAT_NDJSON)
+    if fmt not in record_feed.CONTENT_TYPES:
+        return HttpResponseBadRequest("format must be csv or ndjson")
+
+    month_start, month_end = month_range(date.today().year, date.today().month)
+    since = _parse_iso_date(params.get("since", month_start.isoformat()))
+    until = _parse_iso_date(params.get("until", (month_end - timedelta(days=1)).isoformat()))
+    if since is None or until is None or since > until:
+        return HttpResponseBadRequest("since / until must be YYYY-MM-DD and since <= until")
+
+    try:
+        limit = min(max(int(params.get("limit", record_feed.DEFAULT_LIMIT)), 1), record_feed.MAX_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+
+    records = ManHourRecord.objects.filter(work_date__gte=since, work_date__lte=until)
 
-    # Excel 生成
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "raw"
+    # 権限は工数一覧と同じ（使用者は自分が担当者のものだけ）
+    if is_admin(request.user):
+        scope = "all"
+        if params.get("assignee"):
+            records = records.filter(assignee=params["assignee"])
+    else:
+        scope = f"user:{request.user.id}"
+        records = records.filter(assignee_user_id=request.user.id)
 
-    ws.append(["日付", "案件名", "担当者", "時間(h)"])
-    for r in records:
-        ws.append([r.work_date.isoformat(), r.project_name, r.assignee, float(r.hours)])
+    if params.get("case_id"):
+        try:
+            records = records.filter(case_id=int(params["case_id"]))
+        except ValueError:
+            return HttpResponseBadRequest("case_id must be an integer")
 
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
+    tag = record_feed.etag(since, until, scope, params.urlencode())
+    if tag in [t.strip() for t in request.headers.get("If-None-Match", "").split(",")]:
+        return HttpResponseNotModified(headers={"ETag": tag})
 
-    filename = f"manhour_{year}{month:02d}.xlsx"
-    response = HttpResponse(
-        buf.read(),
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    try:
+        page = record_feed.page_of(records, RECORD_ORDER, params.get("after"), limit)
+    except InvalidCursor:
+        return HttpResponseBadRequest(INVALID_CURSOR_MESSAGE)
+    response = StreamingHttpResponse(
+        record_feed.stream(page.rows, fmt),
+        content_type=record_feed.CONTENT_TYPES[fmt],
     )
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["ETag"] = tag
+    response["Cache-Control"] = "private, no-cache"
+    if page.next_cursor:
+        next_params = params.copy()
+        next_params["after"] = page.next_cursor
+        response["X-Next-Cursor"] = page.next_cursor
+        response["Link"] = f'<{request.path}?{next_params.urlencode()}>; rel="next"'
     return response
+
+
+# ------------------------------------------------------------------ #
+# Slack Events API
+# ------------------------------------------------------------------ #
+
+@csrf_exempt
+@require_POST
+def slack_events_endpoint(request):
+    """
+    Slack Events API の受け口。署名を検証し、message イベントを Celery に渡してすぐ 200 を返す。
+    （取り込みは jobs.tasks.process_slack_event）
+    """
+    body = request.body
+    if not slack_events.verify_signature(
+        body,
+        request.headers.get("X-Slack-Request-Timestamp"),
+        request.headers.get("X-Slack-Signature"),
+    ):
+        return HttpResponseForbidden("invalid signature")
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return HttpResponseBadRequest("invalid json")
+
+    # イベント URL 登録時の確認
+    if payload.get("type") == "url_verification":
+        return JsonResponse({"challenge": payload.get("challenge", "")})
+
+    if payload.get("type") == "event_callback":
+        event = payload.get("event") or {}
+        if event.get("type") == "message":
+            process_slack_event.delay(event)
+        if request.headers.get("X-Slack-Retry-Num"):
+            logger.info(
+                "slack event retry %s (%s) for %s",
+                request.headers["X-Slack-Retry-Num"],
+                request.headers.get("X-Slack-Retry-Reason", ""),
+                payload.get("event_id"),
+            )
+
+    return HttpResponse(status=200)
+
+
+# ------------------------------------------------------------------ #
+# メトリクス（Prometheus）
+# ------------------------------------------------------------------ #
+
+def _metrics_allowed(request) -> bool:
+    """settings.METRICS_TOKEN の Bearer トークンか、スタッフのログインがあれば見せる"""
+    token = settings.METRICS_TOKEN
+    if token:
+        scheme, _, value = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(value.strip().encode(), token.encode()):
+            return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+@require_GET
+def metrics_endpoint(request):
+    """Celery タスクの段ごとの計測値（jobs.metrics）を Prometheus のテキスト形式で返す"""
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden("forbidden")
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")